@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""资源预处理：离线把精灵图缩放到展示尺寸并转成RGBA，写出带内容哈希的清单
+
+用法（只依赖Pillow，任何Linux机器都能离线运行）：
+    python asset_pipeline.py [插件目录] [--force]
+"""
+import os
+import sys
+import json
+import hashlib
+from typing import Dict, Any, Optional
+
+# 信息卡尺寸与宠物图片的展示尺寸，需要和PetImageGenerator的排版保持一致
+CARD_SIZE = (800, 600)
+SPRITE_SIZE = (300, 300)
+
+BUILD_DIR_NAME = "build"
+MANIFEST_NAME = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def file_sha256(path: str) -> str:
+    """计算文件内容的sha256"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _assets_dir(plugin_dir: str) -> str:
+    return os.path.join(plugin_dir, "assets")
+
+
+def _build_dir(plugin_dir: str) -> str:
+    return os.path.join(_assets_dir(plugin_dir), BUILD_DIR_NAME)
+
+
+def manifest_path(plugin_dir: str) -> str:
+    return os.path.join(_build_dir(plugin_dir), MANIFEST_NAME)
+
+
+def _asset_specs(plugin_dir: str) -> Dict[str, Dict[str, Any]]:
+    """列出需要预处理的资源：背景图和所有 *_1.png / *_2.png 精灵图"""
+    assets_dir = _assets_dir(plugin_dir)
+    specs = {}
+    if os.path.exists(os.path.join(assets_dir, "background.png")):
+        specs["background"] = {"source": "background.png", "size": CARD_SIZE, "mode": "RGBA"}
+    for filename in sorted(os.listdir(assets_dir)):
+        stem, ext = os.path.splitext(filename)
+        if ext.lower() == ".png" and (stem.endswith("_1") or stem.endswith("_2")):
+            specs[stem] = {"source": filename, "size": SPRITE_SIZE, "mode": "RGBA"}
+    return specs
+
+
+def load_manifest(plugin_dir: str) -> Optional[Dict[str, Any]]:
+    """读取资源清单，不存在或版本不符时返回None"""
+    path = manifest_path(plugin_dir)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def prebuilt_path(plugin_dir: str, manifest: Optional[Dict[str, Any]], key: str) -> Optional[str]:
+    """校验清单中的哈希，源文件和产物都未变化时返回预处理后的图片路径"""
+    if not manifest:
+        return None
+    entry = manifest.get("assets", {}).get(key)
+    if not entry:
+        return None
+    source = os.path.join(_assets_dir(plugin_dir), entry["source"])
+    output = os.path.join(_build_dir(plugin_dir), entry["output"])
+    try:
+        if file_sha256(source) != entry["source_sha256"]:
+            return None
+        if file_sha256(output) != entry["output_sha256"]:
+            return None
+    except OSError:
+        return None
+    return output
+
+
+def build_assets(plugin_dir: str, force: bool = False) -> Dict[str, Any]:
+    """预处理所有资源并写出清单，源文件哈希未变化的资源会被跳过"""
+    from PIL import Image
+
+    build_dir = _build_dir(plugin_dir)
+    os.makedirs(build_dir, exist_ok=True)
+
+    old_manifest = None if force else load_manifest(plugin_dir)
+    manifest = {"version": MANIFEST_VERSION, "assets": {}}
+
+    for key, spec in _asset_specs(plugin_dir).items():
+        source = os.path.join(_assets_dir(plugin_dir), spec["source"])
+        output_name = f"{key}.png"
+        output = os.path.join(build_dir, output_name)
+        source_sha = file_sha256(source)
+
+        if prebuilt_path(plugin_dir, old_manifest, key) and \
+                old_manifest["assets"][key]["size"] == list(spec["size"]):
+            manifest["assets"][key] = old_manifest["assets"][key]
+            print(f"跳过未变化的资源: {spec['source']}")
+            continue
+
+        with Image.open(source) as img:
+            img = img.convert(spec["mode"]).resize(spec["size"], Image.LANCZOS)
+            img.save(output, optimize=True)
+
+        manifest["assets"][key] = {
+            "source": spec["source"],
+            "source_sha256": source_sha,
+            "output": output_name,
+            "output_sha256": file_sha256(output),
+            "size": list(spec["size"]),
+            "mode": spec["mode"],
+        }
+        print(f"已处理资源: {spec['source']} -> {output_name} {spec['size'][0]}x{spec['size'][1]} {spec['mode']}")
+
+    with open(manifest_path(plugin_dir), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"资源清单已写入: {manifest_path(plugin_dir)}")
+    return manifest
+
+
+if __name__ == "__main__":
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    target_dir = args[0] if args else os.path.dirname(os.path.abspath(__file__))
+    build_assets(target_dir, force="--force" in sys.argv[1:])
@@ -0,0 +1,2 @@
+# -*- coding: utf-8 -*-
+"""插件的性能基准测试，在插件目录下运行：python -m benchmarks.<模块名>"""
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+"""基准测试公共工具：离线的astrbot替身、把插件复制到临时目录加载、计时统计"""
+import os
+import sys
+import time
+import types
+import shutil
+import logging
+import importlib
+import statistics
+from typing import Any, Callable, Dict, List
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def install_astrbot_stub():
+    """注册一个最小的astrbot.api替身，装饰器原样返回被装饰的函数"""
+    if "astrbot.api" in sys.modules:
+        return
+
+    class _Filter:
+        class PermissionType:
+            ADMIN = "admin"
+            MEMBER = "member"
+
+        def command(self, command_name: str, alias=None, priority: int = 0):
+            return lambda func: func
+
+        def permission_type(self, permission_type, raise_error: bool = True):
+            return lambda func: func
+
+    class AstrMessageEvent:
+        pass
+
+    class Context:
+        pass
+
+    class Star:
+        def __init__(self, context):
+            self.context = context
+
+    def register(*args, **kwargs):
+        return lambda cls: cls
+
+    astrbot = types.ModuleType("astrbot")
+    api = types.ModuleType("astrbot.api")
+    api.logger = logging.getLogger("astrbot")
+    api.AstrBotConfig = dict
+    event = types.ModuleType("astrbot.api.event")
+    event.filter = _Filter()
+    event.AstrMessageEvent = AstrMessageEvent
+    star = types.ModuleType("astrbot.api.star")
+    star.Context = Context
+    star.Star = Star
+    star.register = register
+
+    astrbot.api = api
+    api.event = event
+    api.star = star
+    sys.modules.update({
+        "astrbot": astrbot,
+        "astrbot.api": api,
+        "astrbot.api.event": event,
+        "astrbot.api.star": star,
+    })
+
+
+def load_plugin(workdir: str, package: str = "chongwu_bench"):
+    """把插件复制到workdir下作为包导入，数据库和临时文件都落在workdir里"""
+    install_astrbot_stub()
+    target = os.path.join(workdir, package)
+    if not os.path.exists(target):
+        shutil.copytree(PLUGIN_DIR, target, ignore=shutil.ignore_patterns(
+            "benchmarks", "plugins_db", "temp", ".git", "__pycache__", "*.jsonl"))
+    if workdir not in sys.path:
+        sys.path.insert(0, workdir)
+    return importlib.import_module(f"{package}.main")
+
+
+class FakeEvent:
+    """模拟AstrMessageEvent中插件用到的方法"""
+
+    def __init__(self, user_id: str, sender_name: str = "测试玩家", group_id: str = None):
+        self.user_id = user_id
+        self.sender_name = sender_name
+        self.group_id = group_id
+
+    def get_sender_id(self):
+        return self.user_id
+
+    def get_sender_name(self):
+        return self.sender_name
+
+    def get_group_id(self):
+        return self.group_id
+
+    def plain_result(self, text):
+        return ("plain", text)
+
+    def image_result(self, image_path):
+        return ("image", image_path)
+
+
+async def drain(handler) -> List[Any]:
+    """执行一个指令处理器，收集它产出的全部结果"""
+    return [result async for result in handler]
+
+
+def quiet_logs():
+    logging.getLogger().setLevel(logging.ERROR)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """把秒为单位的耗时样本整理成毫秒统计"""
+    ordered = sorted(samples)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    total = sum(ordered)
+    return {
+        "n": len(ordered),
+        "ops_per_sec": len(ordered) / total if total else 0.0,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": ordered[-1] * 1000,
+    }
+
+
+def measure(func: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""连续探索与多次单独探索的吞吐量对比
+
+用法：python -m benchmarks.bench_batch_explore [--count 10] [--rounds 50]
+"""
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+
+from ._harness import FakeEvent, drain, load_plugin, quiet_logs
+
+# 去掉冷却和频率限制，只比较指令本身的开销
+NO_LIMITS = {"command_limits": {"*": {"rate": 0}, "探索": {"cooldown": 0}}, "explore_batch_max": 1000}
+
+
+def reset_pet(pet):
+    # 让宠物足够强壮，避免中途失去战斗能力导致连续探索提前结束
+    pet.hp = 10 ** 9
+    pet.attack = 10 ** 6
+
+
+async def run(plugin, count: int, rounds: int):
+    event = FakeEvent("bench_user")
+    await drain(plugin.adopt_pet(event, "火", "烈焰"))
+    pet = plugin.pets["bench_user"]
+
+    single = 0.0
+    batch = 0.0
+    for _ in range(rounds):
+        reset_pet(pet)
+        start = time.perf_counter()
+        for _ in range(count):
+            await drain(plugin.explore(event))
+        single += time.perf_counter() - start
+
+        reset_pet(pet)
+        start = time.perf_counter()
+        await drain(plugin.explore(event, count))
+        batch += time.perf_counter() - start
+    return single, batch
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    quiet_logs()
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        plugin = load_plugin(workdir).QQPetPlugin(None, NO_LIMITS)
+        single, batch = asyncio.run(run(plugin, args.count, args.rounds))
+        plugin.db.close()
+
+    explores = args.count * args.rounds
+    print(f"{'方式':<16} {'探索次数':>8} {'总耗时(s)':>10} {'探索/秒':>10}")
+    print(f"{f'{args.count}次单独探索':<16} {explores:>8} {single:>10.3f} {explores / single:>10.1f}")
+    print(f"{f'/探索 {args.count}':<16} {explores:>8} {batch:>10.3f} {explores / batch:>10.1f}")
+    print(f"加速比：{single / batch:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
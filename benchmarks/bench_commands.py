@@ -0,0 +1,254 @@
+# -*- coding: utf-8 -*-
+"""所有玩家指令的端到端基准：用离线astrbot替身加载插件，在临时数据库上逐个驱动指令处理器
+
+每条指令报告ops/sec和延迟分位数，结果写成JSON，可以和之前的结果对比找回退。
+
+用法：python -m benchmarks.bench_commands [--iterations 200] [--users 50] [--only 探索,对决] [--backend memory]
+      [--output benchmarks/results/commands.json] [--compare 旧结果.json] [--threshold 0.2]
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from ._harness import PLUGIN_DIR, FakeEvent, drain, load_plugin, quiet_logs, summarize
+
+# 去掉冷却和频率限制，只测指令本身的开销
+NO_LIMITS = {"command_limits": {"*": {"rate": 0}, "探索": {"cooldown": 0}, "对决": {"cooldown": 0}}}
+STARTERS = (("火", "烈焰"), ("水", "碧波兽"), ("草", "藤甲虫"), ("土", "碎裂岩"), ("金", "金刚"))
+DEFAULT_OUTPUT = os.path.join(PLUGIN_DIR, "benchmarks", "results", "commands.json")
+# 处理器捕获异常后回复的固定后缀
+FAILURE_MARKER = "失败了~请联系管理员检查日志"
+
+
+class Scenario(NamedTuple):
+    """一条指令的驱动方式：args根据玩家生成参数，setup在计时之外准备数据"""
+    command: str
+    handler: str
+    args: Callable[["BenchState", str, int], Tuple] = lambda state, user, i: ()
+    setup: Optional[Callable[["BenchState", str, int], None]] = None
+    fresh_user: bool = False
+
+
+class BenchState:
+    def __init__(self, module, plugin, users: List[str]):
+        self.module = module
+        self.plugin = plugin
+        self.users = users
+        self.snapshots: Dict[str, Dict[str, Any]] = {}
+
+    def populate(self):
+        """直接写入数据库创建玩家，不走领取指令（它在回复后还会等待删除图片）"""
+        for i, user in enumerate(self.users):
+            pet_type, name = STARTERS[i % len(STARTERS)]
+            pet = self.plugin.pets[user] = self.module.Pet(name, pet_type, user)
+            self.plugin.db.create_pet(user, pet.name, pet.type, pet.owner)
+            self.plugin.db.update_pet_data(user, **pet.to_dict())
+            self.snapshots[user] = pet.to_dict()
+
+    def reset(self, user: str, **overrides):
+        """把宠物恢复到领取时的状态，避免前面的指令（失去战斗能力、金币花光）影响后面的测量"""
+        pet = self.plugin.pets[user] = self.plugin.pets[user].from_dict(self.snapshots[user])
+        pet.coins = 10 ** 6
+        for name, value in overrides.items():
+            setattr(pet, name, value)
+
+    def opponent(self, user: str) -> str:
+        return self.users[(self.users.index(user) + 1) % len(self.users)]
+
+
+def _reset(state, user, i):
+    state.reset(user)
+
+
+def _reset_duel(state, user, i):
+    state.reset(user)
+    state.reset(state.opponent(user))
+
+
+def _stock_food(state, user, i):
+    state.reset(user, hunger=50)
+    state.plugin.db.add_item_to_inventory(user, "普通口粮", 1)
+
+
+def _first_skill(state, user, i):
+    skills = state.plugin.pets[user].skills
+    return (skills[0] if skills else "火焰焚烧",)
+
+
+SCENARIOS = (
+    Scenario("领取宠物", "adopt_pet", lambda state, user, i: STARTERS[i % len(STARTERS)], fresh_user=True),
+    Scenario("我的宠物", "my_pet", setup=_reset),
+    Scenario("查看宠物", "view_pet", setup=_reset),
+    Scenario("宠物详细", "pet_details", setup=_reset),
+    Scenario("宠物菜单", "pet_menu"),
+    Scenario("宠物大全", "pet_catalog"),
+    Scenario("探索", "explore", setup=_reset),
+    Scenario("探索期望", "explore_expectation"),
+    Scenario("对决", "duel_pet", lambda state, user, i: (state.opponent(user),), setup=_reset_duel),
+    Scenario("商店", "shop"),
+    Scenario("购买", "buy_item", lambda state, user, i: (str(i % 6 + 1),), setup=_reset),
+    Scenario("投喂", "feed_pet", lambda state, user, i: ("普通口粮",), setup=_stock_food),
+    Scenario("宠物背包", "pet_inventory"),
+    Scenario("查看技能", "check_skills"),
+    Scenario("使用技能", "use_skill", _first_skill),
+    Scenario("战斗设置", "battle_settings"),
+    Scenario("修改最低血量", "modify_auto_heal_threshold", lambda state, user, i: (30 + i % 40,)),
+    Scenario("宠物进化", "evolve_pet", setup=lambda state, user, i: state.reset(user, level=10)),
+)
+
+
+async def reply(handler) -> Tuple[float, List[Any], Optional[asyncio.Task]]:
+    """执行指令直到最后一条回复，返回(耗时, 回复, 收尾任务)
+
+    回复之后的收尾（如等待删除临时图片）玩家感知不到，放到后台完成，不计入延迟。
+    """
+    results = []
+    start = time.perf_counter()
+    elapsed = 0.0
+    iterator = handler.__aiter__()
+    while True:
+        try:
+            result = await iterator.__anext__()
+        except StopAsyncIteration:
+            return elapsed or time.perf_counter() - start, results, None
+        results.append(result)
+        elapsed = time.perf_counter() - start
+        if result[0] == "image":
+            # 图片回复后只剩收尾工作
+            return elapsed, results, asyncio.ensure_future(drain(iterator))
+
+
+async def run_scenario(state: BenchState, scenario: Scenario, iterations: int, warmup: int) -> Dict[str, Any]:
+    handler = getattr(state.plugin, scenario.handler)
+    samples = []
+    errors = 0
+    tails = []
+    for i in range(warmup + iterations):
+        user = f"fresh_{scenario.handler}_{i}" if scenario.fresh_user else state.users[i % len(state.users)]
+        if scenario.setup is not None:
+            scenario.setup(state, user, i)
+        args = scenario.args(state, user, i)
+
+        elapsed, results, tail = await reply(handler(FakeEvent(user), *args))
+        if tail is not None:
+            tails.append(tail)
+
+        if i < warmup:
+            continue
+        samples.append(elapsed)
+        if any(kind == "plain" and FAILURE_MARKER in str(content) for kind, content in results):
+            errors += 1
+
+    await asyncio.gather(*tails)
+    summary = summarize(samples)
+    summary["errors"] = errors
+    return summary
+
+
+async def run(module, plugin, scenarios, iterations: int, users: int, warmup: int) -> Dict[str, Dict[str, Any]]:
+    state = BenchState(module, plugin, [f"bench_{i}" for i in range(users)])
+    state.populate()
+    results = {}
+    for scenario in scenarios:
+        results[scenario.command] = await run_scenario(state, scenario, iterations, warmup)
+        print_row(scenario.command, results[scenario.command])
+    return results
+
+
+def print_row(command: str, stats: Dict[str, Any]):
+    print(f"{command:<10} {stats['ops_per_sec']:>10.1f} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} "
+          f"{stats['p99_ms']:>9.3f} {stats['max_ms']:>9.3f} {stats['errors']:>6}")
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PLUGIN_DIR,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline_path: str, results: Dict[str, Dict[str, Any]], threshold: float) -> int:
+    """与旧结果对比p50和p99，变慢超过threshold的指令记为回退，返回回退数"""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["commands"]
+
+    regressions = 0
+    print(f"\n对比 {baseline_path}（阈值{threshold:.0%}）")
+    print(f"{'指令':<10} {'p50变化':>9} {'p99变化':>9}")
+    for command, stats in results.items():
+        old = baseline.get(command)
+        if not old:
+            print(f"{command:<10} {'新增':>9}")
+            continue
+        p50 = stats["p50_ms"] / old["p50_ms"] - 1 if old["p50_ms"] else 0.0
+        p99 = stats["p99_ms"] / old["p99_ms"] - 1 if old["p99_ms"] else 0.0
+        regressed = p50 > threshold or p99 > threshold
+        regressions += regressed
+        print(f"{command:<10} {p50:>+9.1%} {p99:>+9.1%}{'  ⚠ 回退' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--only", help="只测这些指令，逗号分隔")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--compare", help="对比的旧结果JSON")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", default="sqlite", help="存储后端，memory不读写磁盘，只测量指令本身")
+    parser.add_argument("--config", help="插件配置JSON，覆盖默认配置")
+    args = parser.parse_args()
+
+    scenarios = SCENARIOS
+    if args.only:
+        wanted = set(args.only.split(","))
+        scenarios = tuple(scenario for scenario in SCENARIOS if scenario.command in wanted)
+
+    quiet_logs()
+    random.seed(args.seed)
+    print(f"{'指令':<10} {'ops/sec':>10} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9} {'错误':>6}")
+    with tempfile.TemporaryDirectory() as workdir:
+        module = load_plugin(workdir)
+        config = dict(NO_LIMITS, storage_backend=args.backend, **(json.loads(args.config) if args.config else {}))
+        plugin = module.QQPetPlugin(None, config)
+        results = asyncio.run(run(module, plugin, scenarios, args.iterations, args.users, args.warmup))
+        plugin.db.close()
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "warmup": args.warmup,
+            "users": args.users,
+            "seed": args.seed,
+            "backend": args.backend,
+            "config": args.config,
+        },
+        "commands": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+
+    if args.compare and compare(args.compare, results, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""PetDatabase在不同玩家规模下的表现：启动加载、单点读写、背包操作和数据库文件大小
+
+每个规模使用一个新数据库，先用populate写入模拟玩家，再随机抽取玩家测量。
+结果打印为表格并写成JSON，便于跨版本对比。
+
+用法：python -m benchmarks.bench_db_scaling [--scales 1000,100000,1000000] [--samples 2000]
+      [--output benchmarks/results/db_scaling.json]
+"""
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import importlib
+from typing import Any, Dict, List
+
+from ._harness import PLUGIN_DIR, load_plugin, quiet_logs, summarize
+from .populate import ITEMS, populate
+
+DEFAULT_OUTPUT = os.path.join(PLUGIN_DIR, "benchmarks", "results", "db_scaling.json")
+
+
+def timed(func, args_list: List[tuple]) -> Dict[str, float]:
+    samples = []
+    for args in args_list:
+        start = time.perf_counter()
+        func(*args)
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+def file_size(db_path: str) -> int:
+    """数据库及其日志文件的总大小"""
+    return sum(os.path.getsize(path) for path in (db_path, f"{db_path}-wal", f"{db_path}-journal")
+               if os.path.exists(path))
+
+
+def bench_scale(plugin, pet_module, users: int, samples: int, workdir: str, seed: int) -> Dict[str, Any]:
+    scale_dir = os.path.join(workdir, f"scale_{users}")
+    db = pet_module.PetDatabase(scale_dir)
+    start = time.perf_counter()
+    counts = populate(db, pet_module, users, seed)
+    populate_s = time.perf_counter() - start
+    db.conn.close()
+
+    # 重新打开，启动时间包含建表检查和全部宠物的加载
+    plugin.db.conn.close()
+    start = time.perf_counter()
+    plugin.db = pet_module.PetDatabase(scale_dir)
+    plugin.pets = {}
+    plugin._load_existing_pets()
+    startup_s = time.perf_counter() - start
+    db = plugin.db
+
+    rng = random.Random(seed)
+    user_ids = [str(10_000_000 + rng.randrange(users)) for _ in range(samples)]
+    result = {
+        "users": counts["pets"],
+        "inventory_rows": counts["inventory_rows"],
+        "populate_s": populate_s,
+        "startup_s": startup_s,
+        "get_pet_data": timed(db.get_pet_data, [(user_id,) for user_id in user_ids]),
+        "update_pet_data": timed(lambda user_id, values: db.update_pet_data(user_id, **values), [
+            (user_id, {"coins": rng.randrange(1000), "hunger": rng.randrange(100)}) for user_id in user_ids
+        ]),
+        "get_user_inventory": timed(db.get_user_inventory, [(user_id,) for user_id in user_ids]),
+        "add_item_to_inventory": timed(db.add_item_to_inventory, [
+            (user_id, rng.choice(ITEMS), 1) for user_id in user_ids
+        ]),
+        "remove_item_from_inventory": timed(db.remove_item_from_inventory, [
+            (user_id, rng.choice(ITEMS), 1) for user_id in user_ids
+        ]),
+    }
+    db.conn.close()
+    result["file_bytes"] = file_size(db.db_path)
+    return result
+
+
+OPERATIONS = ("get_pet_data", "update_pet_data", "get_user_inventory", "add_item_to_inventory",
+              "remove_item_from_inventory")
+SHORT_NAMES = ("读宠物", "写宠物", "读背包", "加物品", "减物品")
+
+
+def print_table(results: Dict[str, Dict[str, Any]]):
+    header = f"{'玩家数':>9} {'背包行':>9} {'文件(MB)':>9} {'生成(s)':>8} {'启动(s)':>8}"
+    header += "".join(f" {name + ' p50/p99(µs)':>22}" for name in SHORT_NAMES)
+    print(header)
+    for stats in results.values():
+        line = (f"{stats['users']:>9} {stats['inventory_rows']:>9} {stats['file_bytes'] / 2 ** 20:>9.1f} "
+                f"{stats['populate_s']:>8.2f} {stats['startup_s']:>8.2f}")
+        for operation in OPERATIONS:
+            cell = f"{stats[operation]['p50_ms'] * 1000:.0f}/{stats[operation]['p99_ms'] * 1000:.0f}"
+            line += f" {cell:>22}"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scales", default="1000,100000", help="逗号分隔的玩家数，100万约需几分钟")
+    parser.add_argument("--samples", type=int, default=2000, help="每种操作随机抽取的玩家数")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    quiet_logs()
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        module = load_plugin(workdir)
+        pet_module = importlib.import_module(f"{module.__package__}.pet")
+        plugin = module.QQPetPlugin(None, {})
+        for users in map(int, args.scales.split(",")):
+            results[str(users)] = bench_scale(plugin, pet_module, users, args.samples, workdir, args.seed)
+
+    print_table(results)
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": pet_module.sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "samples": args.samples,
+            "seed": args.seed,
+        },
+        "scales": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""探索好事件的耗时与已加载宠物数量的关系
+
+用法：python -m benchmarks.bench_explore_events [--sizes 100,10000,100000] [--repeat 200]
+"""
+import random
+import asyncio
+import argparse
+import tempfile
+
+from ._harness import load_plugin, measure, quiet_logs
+
+
+def legacy_owner_lookup(pets, pet):
+    """改动前好事件查找user_id的写法：遍历所有已加载的宠物"""
+    for uid, p in pets.items():
+        if p == pet:
+            return uid
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="100,10000,100000")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(","))
+
+    quiet_logs()
+    random.seed(0)
+    with tempfile.TemporaryDirectory() as workdir:
+        plugin_main = load_plugin(workdir)
+        # 使用内存存储，只测量事件本身的开销
+        plugin = plugin_main.QQPetPlugin(None, {"storage_backend": "memory"})
+        loop = asyncio.new_event_loop()
+
+        print(f"{'已加载宠物':>10} {'好事件均值(ms)':>14} {'好事件p95(ms)':>14} {'旧查找均值(ms)':>14}")
+        for size in sizes:
+            while len(plugin.pets) < size:
+                plugin.pets[f"bench_{len(plugin.pets)}"] = plugin_main.Pet("烈焰", "火")
+            # 取最后加载的用户，对应旧实现的最坏情况
+            user_id = f"bench_{size - 1}"
+            pet = plugin.pets[user_id]
+
+            item_events = [plugin.explore_events.by_id[event_id] for event_id in ("medical_kit", "merchant", "little_girl")]
+            events = measure(lambda: loop.run_until_complete(
+                plugin._apply_explore_event(pet, user_id, random.choice(item_events))), args.repeat)
+            legacy = measure(lambda: legacy_owner_lookup(plugin.pets, pet), args.repeat)
+            print(f"{size:>10} {events['mean_ms']:>14.3f} {events['p95_ms']:>14.3f} {legacy['mean_ms']:>14.3f}")
+
+        loop.close()
+        plugin.db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""信息卡渲染的微基准：冷/热缓存、每个种族、字体降级和各输出编码器
+
+报告每张卡的耗时、峰值内存增量和输出字节数，结果写成JSON。
+
+用法：python -m benchmarks.bench_render [--iterations 30] [--font 某字体.ttf]
+      [--output benchmarks/results/render.json]
+
+不提供--font时只测默认字体（插件目录没有assets/font.ttf时线上就是这种情况）。
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import importlib
+import contextlib
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from ._harness import PLUGIN_DIR, load_plugin, quiet_logs, summarize
+
+DEFAULT_OUTPUT = os.path.join(PLUGIN_DIR, "benchmarks", "results", "render.json")
+CARD_TEXT = "主人：测试玩家\n名称：{name}\n属性：{type}\n战力值：1234\n等级：25"
+ENCODERS = {
+    "png": {"format": "PNG"},
+    "png_optimize": {"format": "PNG", "optimize": True},
+    "jpeg_q85": {"format": "JPEG", "quality": 85},
+    "webp_q80": {"format": "WEBP", "quality": 80},
+}
+
+
+class PeakMemory:
+    """测量一段代码的峰值内存增量（KB）
+
+    Linux上重置并读取进程的VmHWM，能统计到Pillow在C层分配的像素内存；
+    其他平台退回tracemalloc，只统计Python层的分配。
+    """
+
+    def __init__(self):
+        self.kb = 0
+        self.proc = sys.platform.startswith("linux") and os.path.exists("/proc/self/clear_refs")
+
+    @staticmethod
+    def _status(field: str) -> int:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field):
+                    return int(line.split()[1])
+        return 0
+
+    def __enter__(self):
+        if self.proc:
+            try:
+                with open("/proc/self/clear_refs", "w") as f:
+                    f.write("5")
+                self._baseline = self._status("VmRSS:")
+                return self
+            except OSError:
+                self.proc = False
+        tracemalloc.start()
+        return self
+
+    def __exit__(self, *exc):
+        if self.proc:
+            self.kb = max(0, self._status("VmHWM:") - self._baseline)
+        else:
+            self.kb = tracemalloc.get_traced_memory()[1] // 1024
+            tracemalloc.stop()
+
+
+def run_case(func: Callable[[], Any], iterations: int, setup: Callable[[], None] = None) -> Dict[str, Any]:
+    """setup在计时外执行；峰值内存取第一次执行（冷启动时最高）"""
+    samples = []
+    peak_kb = 0
+    for i in range(iterations):
+        if setup is not None:
+            setup()
+        memory = PeakMemory() if i == 0 else contextlib.nullcontext()
+        with memory:
+            start = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - start)
+        if i == 0:
+            peak_kb = memory.kb
+    summary = summarize(samples)
+    summary["peak_kb"] = peak_kb
+    return summary
+
+
+def encoded_size(image, options: Dict[str, Any]) -> int:
+    buffer = io.BytesIO()
+    encode(image, options, buffer)
+    return buffer.tell()
+
+
+def encode(image, options: Dict[str, Any], buffer=None):
+    if options["format"] == "JPEG" and image.mode != "RGB":
+        image = image.convert("RGB")
+    image.save(buffer if buffer is not None else io.BytesIO(), **options)
+
+
+def bench(module, plugin_dir: str, iterations: int, font: str = None) -> Dict[str, Dict[str, Any]]:
+    asset_pipeline = importlib.import_module(f"{module.__package__}.asset_pipeline")
+    species = importlib.import_module(f"{module.__package__}.species")
+    Generator = module.PetImageGenerator
+    results: Dict[str, Dict[str, Any]] = {}
+    sample_text = CARD_TEXT.format(name="烈焰", type="火")
+
+    def record(name: str, stats: Dict[str, Any]):
+        results[name] = stats
+        print(f"{name:<28} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['peak_kb']:>10} "
+              f"{stats.get('bytes', ''):>10}")
+
+    print(f"{'场景':<28} {'p50(ms)':>9} {'p95(ms)':>9} {'峰值(KB)':>10} {'字节':>10}")
+
+    # 冷缓存：每次都是新的生成器，分别测没有预处理清单（解码原图再缩放）和有清单（读取预处理产物）
+    holder = {}
+
+    def fresh(manifest: bool):
+        def setup():
+            generator = Generator(plugin_dir)
+            if not manifest:
+                generator.manifest = None
+            holder["generator"] = generator
+        return setup
+
+    build_dir = os.path.join(plugin_dir, "assets", "build")
+    shutil.rmtree(build_dir, ignore_errors=True)
+    record("冷缓存/原图", run_case(lambda: holder["generator"].draw_card(sample_text, "烈焰"),
+                               iterations, fresh(manifest=False)))
+    with contextlib.redirect_stdout(io.StringIO()):
+        asset_pipeline.build_assets(plugin_dir)
+    record("冷缓存/预处理清单", run_case(lambda: holder["generator"].draw_card(sample_text, "烈焰"),
+                                 iterations, fresh(manifest=True)))
+
+    # 热缓存：每个种族和没有图片的卡片
+    generator = Generator(plugin_dir)
+    for spec in species.SPECIES.values():
+        text = CARD_TEXT.format(name=spec.name, type=spec.type)
+        generator.draw_card(text, spec.name)
+        record(f"热缓存/{spec.name}", run_case(lambda: generator.draw_card(text, spec.name), iterations))
+    record("热缓存/无宠物图片", run_case(lambda: generator.draw_card(sample_text, None), iterations))
+
+    # 字体：默认字体降级和TrueType字体
+    generator.font_path = os.path.join(plugin_dir, "assets", "missing_font.ttf")
+    record("字体/默认字体降级", run_case(lambda: generator.draw_card(sample_text, "烈焰"), iterations))
+    if font:
+        generator.font_path = font
+        record("字体/TrueType", run_case(lambda: generator.draw_card(sample_text, "烈焰"), iterations))
+    else:
+        print("未提供--font，跳过TrueType字体")
+    generator.font_path = os.path.join(plugin_dir, "assets", "font.ttf")
+
+    # 编码器：同一张卡片编码为各种格式
+    card = generator.draw_card(sample_text, "烈焰")
+    for name, options in ENCODERS.items():
+        stats = run_case(lambda: encode(card, options), iterations)
+        stats["bytes"] = encoded_size(card, options)
+        record(f"编码/{name}", stats)
+
+    # 线上路径：绘制并保存PNG到临时目录
+    paths: List[str] = []
+    stats = run_case(lambda: paths.append(generator._render_pet_image(sample_text, "烈焰")), iterations)
+    stats["bytes"] = os.path.getsize(paths[-1])
+    record("完整/绘制+保存PNG", stats)
+    for path in paths:
+        os.remove(path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--font", help="用于测量TrueType字体渲染的字体文件")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    args = parser.parse_args()
+
+    quiet_logs()
+    with tempfile.TemporaryDirectory() as workdir:
+        module = load_plugin(workdir)
+        plugin_dir = os.path.dirname(module.__file__)
+        results = bench(module, plugin_dir, args.iterations, args.font)
+        pil_version = importlib.import_module("PIL").__version__
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "pillow": pil_version,
+            "platform": platform.platform(),
+            "iterations": args.iterations,
+            "font": args.font,
+        },
+        "cases": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""数据库分片的写入吞吐：同一份模拟玩家数据用db_shards重新分片为K个文件后，
+测量挂机结算式的批量写入（save_idle_tick）和逐条提交的单用户写入
+
+用法：python -m benchmarks.bench_shards [--users 20000] [--shards 1,2,4,8] [--batch 2000] [--rounds 10]
+      [--output benchmarks/results/shards.json]
+"""
+import io
+import os
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import importlib
+import contextlib
+from typing import Any, Dict, List
+
+from ._harness import PLUGIN_DIR, load_plugin, quiet_logs, summarize
+from .populate import populate
+
+DEFAULT_OUTPUT = os.path.join(PLUGIN_DIR, "benchmarks", "results", "shards.json")
+
+
+def tick_rows(pet_module, db, user_ids: List[str], rng: random.Random):
+    """一轮挂机结算的三组数据，宠物行由数据库中现有的宠物得到"""
+    pet_rows, item_rows, digest_rows = [], [], []
+    for user_id in user_ids:
+        pet = pet_module.Pet.from_dict(db.get_pet_data(user_id))
+        pet.coins += rng.randrange(50)
+        row = pet.to_dict()
+        row["user_id"] = user_id
+        pet_rows.append(row)
+        item_rows.append((user_id, "普通口粮", 1))
+        digest_rows.append(("{}", user_id))
+    return pet_rows, item_rows, digest_rows
+
+
+def bench_shards(pet_module, db_shards, source_dir: str, workdir: str, shards: int, users: int,
+                 batch: int, rounds: int, seed: int) -> Dict[str, Any]:
+    plugin_dir = os.path.join(workdir, f"shards_{shards}")
+    shutil.copytree(source_dir, plugin_dir)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        db_shards.reshard(plugin_dir, shards)
+    reshard_s = time.perf_counter() - start
+
+    db = pet_module.open_database(plugin_dir, shards)
+    rng = random.Random(seed)
+    user_ids = [str(10_000_000 + number) for number in range(users)]
+    for user_id in rng.sample(user_ids, min(batch, users)):
+        db.set_idle_enrolled(user_id, True)
+
+    tick_samples = []
+    for _ in range(rounds):
+        rows = tick_rows(pet_module, db, rng.sample(user_ids, min(batch, users)), rng)
+        start = time.perf_counter()
+        db.save_idle_tick(*rows)
+        tick_samples.append(time.perf_counter() - start)
+
+    single_samples = []
+    for user_id in rng.sample(user_ids, min(batch, users)):
+        start = time.perf_counter()
+        db.update_pet_data(user_id, coins=rng.randrange(1000))
+        single_samples.append(time.perf_counter() - start)
+    db.close()
+
+    tick = summarize(tick_samples)
+    single = summarize(single_samples)
+    return {
+        "shards": shards,
+        "reshard_s": reshard_s,
+        "save_idle_tick": tick,
+        "tick_rows_per_s": batch / tick["mean_ms"] * 1000,
+        "update_pet_data": single,
+        "single_commits_per_s": 1000 / single["mean_ms"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--shards", default="1,2,4,8", help="逗号分隔的分片数")
+    parser.add_argument("--batch", type=int, default=2000, help="每轮结算的玩家数")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--output", default=DEFAULT_OUTPUT)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    quiet_logs()
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        module = load_plugin(workdir)
+        pet_module = importlib.import_module(f"{module.__package__}.pet")
+        db_shards = importlib.import_module(f"{module.__package__}.db_shards")
+
+        source_dir = os.path.join(workdir, "source")
+        db = pet_module.PetDatabase(source_dir)
+        populate(db, pet_module, args.users, args.seed)
+        db.close()
+
+        print(f"{'分片':>4} {'重新分片(s)':>11} {'结算p50(ms)':>12} {'结算行/s':>10} {'单条p50(ms)':>12} {'单条提交/s':>11}")
+        for shards in map(int, args.shards.split(",")):
+            stats = bench_shards(pet_module, db_shards, source_dir, workdir, shards, args.users,
+                                 args.batch, args.rounds, args.seed)
+            results[str(shards)] = stats
+            print(f"{shards:>4} {stats['reshard_s']:>11.2f} {stats['save_idle_tick']['p50_ms']:>12.1f} "
+                  f"{stats['tick_rows_per_s']:>10.0f} {stats['update_pet_data']['p50_ms']:>12.2f} "
+                  f"{stats['single_commits_per_s']:>11.0f}")
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "sqlite": pet_module.sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "users": args.users,
+            "batch": args.batch,
+            "rounds": args.rounds,
+            "seed": args.seed,
+        },
+        "shards": results,
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""并发压测：在进程内启动插件，模拟大量群聊用户按指令比例以目标QPS发送指令
+
+请求按泊松过程开环到达（处理变慢不会降低发送速率），报告吞吐、尾延迟、
+事件循环延迟，以及锁、渲染队列、冷却和数据库的争用情况。
+
+用法：python -m benchmarks.loadgen [--users 2000] [--groups 20] [--qps 200] [--duration 30]
+      [--mix 探索=30,我的宠物=15,...] [--no-limits] [--output 结果.json]
+"""
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+from collections import Counter
+from typing import Any, Callable, Dict, List, Tuple
+
+from ._harness import FakeEvent, load_plugin, quiet_logs, summarize
+from .bench_commands import FAILURE_MARKER, BenchState, reply
+
+# 指令 -> (处理器, 参数)，参数函数接收(压测状态, 用户)
+COMMANDS: Dict[str, Tuple[str, Callable[["LoadState", str], tuple]]] = {
+    "我的宠物": ("my_pet", lambda state, user: ()),
+    "查看宠物": ("view_pet", lambda state, user: ()),
+    "探索": ("explore", lambda state, user: ()),
+    "对决": ("duel_pet", lambda state, user: (state.opponent(user),)),
+    "购买": ("buy_item", lambda state, user: (str(random.randint(1, 6)),)),
+    "投喂": ("feed_pet", lambda state, user: ("普通口粮",)),
+    "宠物背包": ("pet_inventory", lambda state, user: ()),
+}
+DEFAULT_MIX = "探索=30,我的宠物=15,查看宠物=15,对决=10,购买=10,投喂=10,宠物背包=10"
+LAG_INTERVAL = 0.01
+
+
+class LoadState(BenchState):
+    def __init__(self, module, plugin, users: List[str], groups: int):
+        super().__init__(module, plugin, users)
+        self.groups = groups
+        self.index = {user: i for i, user in enumerate(users)}
+
+    def group_of(self, user: str) -> str:
+        return f"group_{self.index[user] % self.groups}"
+
+    def opponent(self, user: str) -> str:
+        """同群的另一位玩家"""
+        index = self.index[user]
+        other = (index + self.groups * random.randint(1, max(1, len(self.users) // self.groups - 1))) % len(self.users)
+        return self.users[other]
+
+    def populate(self):
+        super().populate()
+        # 每人一些口粮，投喂指令能走到真正的使用物品流程
+        with self.plugin.db.transaction():
+            for user in self.users:
+                self.plugin.db.add_item_to_inventory(user, "普通口粮", 10 ** 6)
+
+    def prepare(self, user: str):
+        """模拟玩家自己治疗和赚钱：宠物失去战斗能力或金币不足时恢复初始状态"""
+        pet = self.plugin.pets[user]
+        if not pet.is_alive() or pet.coins < 200:
+            self.reset(user)
+
+
+def parse_mix(raw: str) -> Tuple[List[str], List[float]]:
+    commands, weights = [], []
+    for part in raw.split(","):
+        command, weight = part.split("=")
+        if command not in COMMANDS:
+            raise SystemExit(f"不支持的指令: {command}，可选：{'、'.join(COMMANDS)}")
+        commands.append(command)
+        weights.append(float(weight))
+    return commands, weights
+
+
+async def monitor_lag(samples: List[float], stop: asyncio.Event):
+    """定时睡眠并记录实际醒来的延迟，即事件循环被阻塞的时间"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + LAG_INTERVAL
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+class LoadResult:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.outcomes: Counter = Counter()
+        self.inflight = 0
+        self.max_inflight = 0
+        self.sent = 0
+        self.tails: List[asyncio.Task] = []
+
+
+async def send(state: LoadState, result: LoadResult, command: str, user: str):
+    handler_name, args = COMMANDS[command]
+    state.prepare(user)
+    event = FakeEvent(user, user, state.group_of(user))
+    result.inflight += 1
+    result.max_inflight = max(result.max_inflight, result.inflight)
+    try:
+        elapsed, replies, tail = await reply(getattr(state.plugin, handler_name)(event, *args(state, user)))
+        if tail is not None:
+            result.tails.append(tail)
+        result.latencies.setdefault(command, []).append(elapsed)
+        if any(kind == "plain" and FAILURE_MARKER in str(content) for kind, content in replies):
+            result.outcomes["error"] += 1
+        elif any(kind == "image" for kind, _ in replies):
+            result.outcomes["image"] += 1
+        else:
+            result.outcomes["text"] += 1
+    except Exception:
+        result.outcomes["exception"] += 1
+    finally:
+        result.inflight -= 1
+
+
+async def run(state: LoadState, qps: float, duration: float, mix: Tuple[List[str], List[float]]) -> Dict[str, Any]:
+    plugin = state.plugin
+    result = LoadResult()
+    lag: List[float] = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_lag(lag, stop))
+    tasks = set()
+    commands, weights = mix
+
+    start = time.perf_counter()
+    sql_count, sql_time_ms = plugin.metrics.sql_count, plugin.metrics.sql_time_ms
+    next_at = start
+    while True:
+        next_at += random.expovariate(qps)
+        if next_at - start >= duration:
+            break
+        delay = next_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        command = random.choices(commands, weights)[0]
+        task = asyncio.create_task(send(state, result, command, random.choice(state.users)))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+        result.sent += 1
+
+    send_elapsed = time.perf_counter() - start
+    if tasks:
+        await asyncio.wait(tasks, timeout=60)
+    elapsed = time.perf_counter() - start
+    # 回复之后的收尾（如删除临时图片）不计入延迟，结束前等它们完成
+    await asyncio.gather(*result.tails, return_exceptions=True)
+    stop.set()
+    await lag_task
+
+    all_latencies = [value for values in result.latencies.values() for value in values]
+    completed = len(all_latencies)
+    db_time = (plugin.metrics.sql_time_ms - sql_time_ms) / 1000
+    return {
+        "sent": result.sent,
+        "completed": completed,
+        "target_qps": qps,
+        "offered_qps": result.sent / send_elapsed if send_elapsed else 0.0,
+        "throughput_qps": completed / elapsed if elapsed else 0.0,
+        "max_inflight": result.max_inflight,
+        "outcomes": dict(result.outcomes),
+        "latency": summarize(all_latencies) if all_latencies else {},
+        "commands": {command: summarize(values) for command, values in result.latencies.items()},
+        "loop_lag": summarize(lag) if lag else {},
+        "db": {
+            "statements": plugin.metrics.sql_count - sql_count,
+            "time_s": db_time,
+            "busy_ratio": db_time / elapsed if elapsed else 0.0,
+        },
+        "components": plugin.metrics.collect(),
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    latency = report["latency"]
+    print(f"发送{report['sent']}个请求（目标{report['target_qps']:.0f} QPS，实际{report['offered_qps']:.1f}），"
+          f"完成{report['completed']}，吞吐{report['throughput_qps']:.1f} QPS，最多同时处理{report['max_inflight']}个")
+    print("结果：" + "，".join(f"{name}={count}" for name, count in sorted(report["outcomes"].items())))
+    if latency:
+        print(f"延迟：p50 {latency['p50_ms']:.1f}ms p95 {latency['p95_ms']:.1f}ms "
+              f"p99 {latency['p99_ms']:.1f}ms max {latency['max_ms']:.1f}ms")
+    print(f"\n{'指令':<8} {'次数':>7} {'p50(ms)':>9} {'p95(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9}")
+    for command, stats in sorted(report["commands"].items(), key=lambda item: -item[1]["p99_ms"]):
+        print(f"{command:<8} {stats['n']:>7} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+
+    lag = report["loop_lag"]
+    if lag:
+        print(f"\n事件循环延迟：p50 {lag['p50_ms']:.2f}ms p99 {lag['p99_ms']:.2f}ms max {lag['max_ms']:.1f}ms")
+    db = report["db"]
+    print(f"数据库：{db['statements']}条语句，共{db['time_s']:.2f}s，占用{db['busy_ratio']:.1%}的时间（阻塞事件循环）")
+    components = report["components"]
+    locks = components.get("locks", {})
+    if locks:
+        print(f"锁：{locks['acquisitions']}次获取，{locks['contended']}次等待，"
+              f"平均{locks['avg_wait_ms']:.2f}ms，最长{locks['max_wait_ms']:.1f}ms")
+    render = components.get("render_queue", {})
+    if render:
+        print(f"渲染队列：完成{render['rendered']}，排队{render['queued']}，丢弃{render['shed']}"
+              f"（队列满{render['shed_queue_full']}，超时{render['shed_timeout']}）")
+    cooldowns = components.get("cooldowns", {})
+    if cooldowns:
+        print(f"冷却拒绝{cooldowns['rejected_cooldown']}次，频率限制拒绝{cooldowns['rejected_rate']}次")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--groups", type=int, default=20)
+    parser.add_argument("--qps", type=float, default=200)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="指令=权重，逗号分隔")
+    parser.add_argument("--no-limits", action="store_true", help="关闭冷却和频率限制")
+    parser.add_argument("--config", help="插件配置JSON，覆盖默认配置")
+    parser.add_argument("--output", help="把结果写成JSON")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    config: Dict[str, Any] = json.loads(args.config) if args.config else {}
+    if args.no_limits:
+        config["command_limits"] = {"*": {"rate": 0}, "探索": {"cooldown": 0}, "对决": {"cooldown": 0}}
+    mix = parse_mix(args.mix)
+
+    quiet_logs()
+    random.seed(args.seed)
+    with tempfile.TemporaryDirectory() as workdir:
+        module = load_plugin(workdir)
+
+        async def main_async():
+            plugin = module.QQPetPlugin(None, config)
+            state = LoadState(module, plugin, [str(10_000_000 + i) for i in range(args.users)], args.groups)
+            state.populate()
+            try:
+                return await run(state, args.qps, args.duration, mix)
+            finally:
+                await plugin.terminate()
+
+        report = asyncio.run(main_async())
+
+    print_report(report)
+    if args.output:
+        report["meta"] = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "users": args.users,
+            "groups": args.groups,
+            "mix": args.mix,
+            "limits": not args.no_limits,
+            "config": config,
+            "seed": args.seed,
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n结果已写入 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
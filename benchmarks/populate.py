@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""批量生成模拟玩家：向pet_data和user_inventory写入大量合成宠物和背包
+
+等级按长尾分布（多数玩家等级较低），宠物数值由真实的Pet按经验升级/进化得到，
+背包物品数和数量也按少量物品居多的分布生成。
+
+用法：python -m benchmarks.populate --users 100000 --dir 插件目录（数据库写入 插件目录/plugins_db）
+"""
+import time
+import random
+import argparse
+import tempfile
+import importlib
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from ._harness import load_plugin, quiet_logs
+
+MAX_LEVEL = 60
+STARTERS = (("火", "烈焰"), ("水", "碧波兽"), ("草", "藤甲虫"), ("土", "碎裂岩"), ("金", "金刚"))
+ITEMS = ("普通口粮", "美味罐头", "开心饼干", "小治疗瓶", "中治疗瓶", "大治疗瓶")
+# 背包中有0~6种物品的玩家比例
+ITEM_KIND_WEIGHTS = (30, 25, 18, 12, 8, 5, 2)
+
+
+def build_templates(pet_module) -> Dict[Tuple[int, int], Dict]:
+    """每个初始种族在每个等级的to_dict()，由真实的升级和进化得到"""
+    templates = {}
+    for index, (pet_type, name) in enumerate(STARTERS):
+        for level in range(1, MAX_LEVEL + 1):
+            pet = pet_module.Pet(name, pet_type)
+            pet.gain_exp(pet_module.total_exp_for(level))
+            templates[index, level] = pet.to_dict()
+    return templates
+
+
+def random_level(rng: random.Random) -> int:
+    return min(MAX_LEVEL, int(rng.paretovariate(1.2)))
+
+
+def generate(pet_module, start: int, count: int, rng: random.Random, templates=None):
+    """生成[start, start+count)号玩家的(宠物行, 背包行)，宠物行的列顺序与columns一致"""
+    templates = templates or build_templates(pet_module)
+    columns = ["user_id"] + list(next(iter(templates.values())))
+    now = datetime.now()
+    pet_rows: List[tuple] = []
+    item_rows: List[tuple] = []
+    for number in range(start, start + count):
+        user_id = str(10_000_000 + number)
+        row = dict(templates[rng.randrange(len(STARTERS)), random_level(rng)])
+        row["user_id"] = user_id
+        row["owner"] = f"玩家{number}"
+        row["exp"] = rng.randrange(row["level"] * 100)
+        row["hunger"] = rng.randint(0, 100)
+        row["mood"] = rng.randint(0, 100)
+        row["coins"] = int(rng.expovariate(1 / 300))
+        row["last_updated"] = (now - timedelta(seconds=rng.randrange(30 * 86400))).isoformat()
+        row["last_battle_time"] = (now - timedelta(seconds=rng.randrange(30 * 86400))).isoformat()
+        pet_rows.append(tuple(row[column] for column in columns))
+
+        kinds = rng.choices(range(len(ITEM_KIND_WEIGHTS)), weights=ITEM_KIND_WEIGHTS)[0]
+        for item_name in rng.sample(ITEMS, kinds):
+            item_rows.append((user_id, item_name, rng.randint(1, 20)))
+    return columns, pet_rows, item_rows
+
+
+def populate(db, pet_module, users: int, seed: int = 0, chunk: int = 20000) -> Dict[str, int]:
+    """向数据库追加users个模拟玩家，每chunk个玩家一个事务，返回写入的行数"""
+    rng = random.Random(seed)
+    templates = build_templates(pet_module)
+    db.cursor.execute("SELECT COUNT(*) FROM pet_data")
+    start = db.cursor.fetchone()[0]
+    pets = items = 0
+    for offset in range(0, users, chunk):
+        columns, pet_rows, item_rows = generate(pet_module, start + offset, min(chunk, users - offset), rng, templates)
+        with db.transaction():
+            db.cursor.executemany(
+                f"INSERT INTO pet_data ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                pet_rows
+            )
+            db.cursor.executemany(
+                "INSERT INTO user_inventory (user_id, item_name, quantity) VALUES (?, ?, ?)",
+                item_rows
+            )
+        pets += len(pet_rows)
+        items += len(item_rows)
+    return {"pets": pets, "inventory_rows": items}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--dir", help="数据库所在的插件目录，默认使用临时目录（结束后删除）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    quiet_logs()
+    with tempfile.TemporaryDirectory() as workdir:
+        module = load_plugin(workdir)
+        pet_module = importlib.import_module(f"{module.__package__}.pet")
+        db = pet_module.PetDatabase(args.dir or workdir)
+        start = time.perf_counter()
+        counts = populate(db, pet_module, args.users, args.seed)
+        elapsed = time.perf_counter() - start
+        db.conn.close()
+        print(f"写入{counts['pets']}只宠物、{counts['inventory_rows']}条背包记录，用时{elapsed:.1f}s：{db.db_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+import time
+import logging
+from typing import Any, Dict
+
+from .pet import Pet
+
+logger = logging.getLogger(__name__)
+
+
+class PetCacheCoherence:
+    """多进程共用同一个数据库时，保持本进程内存中的宠物（plugin.pets）与数据库一致
+
+    每只宠物有一个全表递增的row_version，每次写入都会分配新版本号。每条指令开始前调用sync()：
+    先查询PRAGMA data_version，其他进程没有提交过修改时直接返回，开销只有这一条语句；
+    有修改时按版本号查出变化的宠物，只重新加载本进程看到的版本已过期的那些。
+    写入时数据库检查版本号（乐观并发控制），其他进程抢先修改过的宠物写入失败，
+    下一次sync()时从数据库重新加载。正被指令使用（持有锁）的宠物推迟到下一个拿到锁的指令开始时由refresh()加载。
+    """
+
+    def __init__(self, plugin, enabled: bool = False):
+        self.plugin = plugin
+        self.enabled = False
+        self._data_version = None
+        self._since = None
+        self._pending: set = set()  # 需要重新加载但正被使用的用户
+
+        self.syncs = 0       # 发现其他进程有修改的次数
+        self.reloaded = 0    # 重新加载的宠物数
+        self.conflicts = 0   # 写入时发现版本冲突的次数
+        self.sync_time = 0.0
+
+        if enabled:
+            if not hasattr(plugin.db, "enable_versioning"):
+                logger.warning("当前存储后端不支持多进程模式，已忽略multi_process配置")
+                return
+            self.enabled = True
+            plugin.db.enable_versioning()
+            # 起点在加载宠物之前记录，加载期间其他进程的修改会在第一次sync()时补上
+            self._data_version = plugin.db.data_version()
+            self._since = plugin.db.latest_version()
+
+    def sync(self):
+        """重新加载其他进程修改过的宠物，以及上次写入冲突的宠物"""
+        if not self.enabled:
+            return
+        db = self.plugin.db
+        conflicts = db.pop_conflicts()
+        self.conflicts += len(conflicts)
+        stale = self._pending | conflicts
+        data_version = db.data_version()
+        if data_version == self._data_version and not stale:
+            return
+
+        start = time.perf_counter()
+        locks = self.plugin.locks
+        changed: Dict[str, Dict[str, Any]] = {}
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self.syncs += 1
+            rows, self._since = db.changed_pets(self._since)
+            for data in rows:
+                # 本进程自己写入的行版本号已经记录过，跳过
+                known = db.version_of(data['user_id'])
+                if known is None or data['row_version'] > known:
+                    changed[data['user_id']] = data
+
+        self._pending = {user_id for user_id in stale | changed.keys() if locks.locked(user_id)}
+        for user_id, data in changed.items():
+            if user_id not in self._pending:
+                self._load(data)
+        for user_id in stale - changed.keys() - self._pending:
+            self._reload(user_id)
+        self.sync_time += time.perf_counter() - start
+
+    def refresh(self, *user_ids: str):
+        """在持有这些用户的锁之后调用，加载sync()时因正被使用而推迟的宠物"""
+        if not self._pending:
+            return
+        for user_id in self._pending.intersection(user_ids):
+            self._pending.discard(user_id)
+            self._reload(user_id)
+
+    def reload(self, *user_ids: str):
+        """在持有这些用户的锁时调用：指令的事务回滚后丢弃内存中的修改，按数据库重新加载"""
+        for user_id in user_ids:
+            self._pending.discard(user_id)
+            data = self.plugin.db.get_pet_data(user_id)
+            if data is None:
+                # 回滚撤销了本次指令创建的宠物
+                self.plugin.pets.pop(user_id, None)
+            else:
+                self._load(data)
+
+    def _reload(self, user_id: str):
+        data = self.plugin.db.get_pet_data(user_id)
+        if data is not None:
+            self._load(data)
+
+    def _load(self, data: Dict[str, Any]):
+        self.plugin.pets[data['user_id']] = Pet.from_dict(data)
+        self.plugin.db.remember_version(data['user_id'], data['row_version'])
+        self.plugin.leaderboard.touch(data['user_id'])
+        self.reloaded += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "syncs": self.syncs,
+            "reloaded": self.reloaded,
+            "conflicts": self.conflicts,
+            "pending": len(self._pending),
+            "sync_time_ms": self.sync_time * 1000,
+        }
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import time
+import logging
+from typing import Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class _ProfiledStep:
+    """包装一次协程执行，只在协程自己运行的片段开启剖析
+
+    await期间事件循环会运行其他任务，这些时间不计入，多个剖析也不会同时开启。
+    """
+    __slots__ = ("coro", "profile")
+
+    def __init__(self, coro, profile):
+        self.coro = coro
+        self.profile = profile
+
+    def __await__(self):
+        value, error = None, None
+        while True:
+            self.profile.enable()
+            try:
+                if error is not None:
+                    future = self.coro.throw(error)
+                else:
+                    future = self.coro.send(value)
+            except StopIteration as e:
+                return e.value
+            finally:
+                self.profile.disable()
+            try:
+                value, error = (yield future), None
+            except BaseException as e:
+                value, error = None, e
+
+
+class CommandProfiler:
+    """按需剖析指令：管理员指定指令和次数后，接下来的N次执行用cProfile记录
+
+    armed为空时pet_command只做一次判断，不开启剖析时没有额外开销。
+    """
+
+    def __init__(self, directory: str, top: int = 25):
+        self.directory = directory
+        self.top = top
+        self.armed: Dict[str, int] = {}
+        self.captured: Dict[str, List[str]] = {}
+
+    def arm(self, command: str, count: int):
+        self.armed[command] = count
+        self.captured[command] = []
+
+    def disarm(self, command: str) -> bool:
+        return self.armed.pop(command, None) is not None
+
+    def take(self, command: str) -> bool:
+        """指令被剖析时返回True，并扣减剩余次数"""
+        remaining = self.armed.get(command)
+        if not remaining:
+            return False
+        if remaining <= 1:
+            del self.armed[command]
+        else:
+            self.armed[command] = remaining - 1
+        return True
+
+    async def run(self, command: str, agen):
+        """剖析一个异步生成器的执行，结束后写出结果"""
+        # 只在真正剖析时导入，插件加载时不需要
+        import cProfile
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            while True:
+                try:
+                    result = await _ProfiledStep(agen.__anext__(), profile)
+                except StopAsyncIteration:
+                    break
+                yield result
+        finally:
+            await agen.aclose()
+            self._save(command, profile, time.perf_counter() - start)
+
+    def _save(self, command: str, profile, elapsed: float):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            stamp = time.strftime("%Y%m%d-%H%M%S")
+            index = len(self.captured.setdefault(command, [])) + 1
+            base = os.path.join(self.directory, f"{command}-{stamp}-{index}")
+            profile.dump_stats(f"{base}.pstats")
+            with open(f"{base}.txt", "w", encoding="utf-8") as f:
+                f.write(f"指令: {command}\n总耗时: {elapsed * 1000:.1f}ms（含等待）\n\n")
+                f.write(self.summary(profile))
+            self.captured[command].append(f"{base}.pstats")
+            logger.info(f"已记录指令剖析: {base}.pstats")
+        except Exception as e:
+            logger.error(f"保存指令剖析失败: {str(e)}")
+
+    def summary(self, profile) -> str:
+        """按累计耗时排序的前top个函数"""
+        import pstats
+        stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stream)
+        stats.strip_dirs().sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+        return stream.getvalue()
+
+    def status(self) -> str:
+        lines = ["🔬 指令剖析"]
+        if self.armed:
+            lines.append("等待中：" + "，".join(f"{command}剩余{count}次" for command, count in self.armed.items()))
+        else:
+            lines.append("没有等待剖析的指令")
+        for command, paths in self.captured.items():
+            if paths:
+                lines.append(f"{command}：已记录{len(paths)}次，最近 {paths[-1]}")
+        return "\n".join(lines)
@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+import math
+import time
+import json
+import logging
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 默认限制：cooldown为指令冷却秒数，rate/burst为令牌桶（每秒补充rate个令牌，最多攒burst个）
+# "*"对所有指令生效，具体指令的配置覆盖"*"中的同名字段
+DEFAULT_COMMAND_LIMITS: Dict[str, Dict[str, float]] = {
+    "*": {"rate": 0.5, "burst": 5},
+    "探索": {"cooldown": 300},
+    "对决": {"cooldown": 1800},
+}
+
+
+class TimingWheel:
+    """分层时间轮：第0层每槽tick秒，第n层每槽覆盖第n-1层的一整圈
+
+    添加和取消都是O(1)，推进时只处理到期槽位，高层槽位到期时逐级下放。
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 64, levels: int = 4, now: float = None):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._wheels: List[List[List[Tuple[Hashable, int]]]] = [
+            [[] for _ in range(slots)] for _ in range(levels)
+        ]
+        self._deadlines: Dict[Hashable, int] = {}
+        self._current = self._to_tick(time.time() if now is None else now)
+
+    def __len__(self) -> int:
+        return len(self._deadlines)
+
+    def _to_tick(self, timestamp: float) -> int:
+        return int(math.ceil(timestamp / self.tick))
+
+    def schedule(self, key: Hashable, deadline: float):
+        """在deadline（时间戳）时让key到期，重复调度会覆盖之前的到期时间"""
+        tick = self._to_tick(deadline)
+        self._deadlines[key] = tick
+        self._place(key, tick)
+
+    def cancel(self, key: Hashable):
+        # 槽位里的旧记录在推进时会因为到期时间不匹配被丢弃
+        self._deadlines.pop(key, None)
+
+    def _place(self, key: Hashable, tick: int):
+        # 已经过期的记录放到下一个槽位，记录里保留原始到期时间用于校验
+        slot_tick = max(tick, self._current + 1)
+        delta = slot_tick - self._current
+        span = 1
+        for level in range(self.levels):
+            if delta < span * self.slots or level == self.levels - 1:
+                self._wheels[level][(slot_tick // span) % self.slots].append((key, tick))
+                return
+            span *= self.slots
+
+    def advance(self, now: float) -> List[Hashable]:
+        """推进到now，返回所有到期的key"""
+        target = self._to_tick(now) - 1
+        expired = []
+        if not self._deadlines:
+            self._current = max(self._current, target)
+            return expired
+
+        while self._current < target:
+            self._current += 1
+            # 跨过高层槽位边界时，把该槽位的记录下放到低层
+            span = self.slots
+            for level in range(1, self.levels):
+                if self._current % span:
+                    break
+                slot = (self._current // span) % self.slots
+                bucket, self._wheels[level][slot] = self._wheels[level][slot], []
+                for key, tick in bucket:
+                    if self._deadlines.get(key) == tick:
+                        self._place(key, tick)
+                span *= self.slots
+
+            slot = self._current % self.slots
+            bucket, self._wheels[0][slot] = self._wheels[0][slot], []
+            for key, tick in bucket:
+                if self._deadlines.get(key) != tick:
+                    continue
+                if tick <= self._current:
+                    del self._deadlines[key]
+                    expired.append(key)
+                else:
+                    self._place(key, tick)
+        return expired
+
+
+class CooldownService:
+    """统一的指令冷却与频率限制
+
+    频率限制使用令牌桶，冷却使用到期时间，检查都是一次字典查找。
+    到期的状态由时间轮清理，冷却状态通过persist回调持久化，重启后不会被重置。
+    """
+
+    def __init__(self, limits: Dict[str, Dict[str, float]] = None,
+                 group_limits: Dict[str, Dict[str, Dict[str, float]]] = None,
+                 persist: Callable[[str, str, int], None] = None):
+        self.limits = {command: dict(limit) for command, limit in DEFAULT_COMMAND_LIMITS.items()}
+        for command, limit in (limits or {}).items():
+            self.limits.setdefault(command, {}).update(limit)
+        self.group_limits = group_limits or {}
+        self.persist = persist
+
+        self._cooldowns: Dict[Tuple[str, str], float] = {}
+        # 令牌桶状态：[剩余令牌, 上次更新时间, 是否已提示过]
+        self._buckets: Dict[Tuple[Any, str, str], List] = {}
+        self._wheel = TimingWheel()
+
+        self.rejected_cooldown = 0
+        self.rejected_rate = 0
+
+    def limit_for(self, command: str, group_id: str = None) -> Dict[str, float]:
+        """合并默认、指令和群配置后的限制"""
+        limit = dict(self.limits.get("*", {}))
+        limit.update(self.limits.get(command, {}))
+        if group_id and group_id in self.group_limits:
+            group = self.group_limits[group_id]
+            limit.update(group.get("*", {}))
+            limit.update(group.get(command, {}))
+        return limit
+
+    def _expire(self, now: float):
+        for key in self._wheel.advance(now):
+            if key[0] == "cd":
+                self._cooldowns.pop(key[1:], None)
+            else:
+                self._buckets.pop(key[1:], None)
+
+    def check(self, command: str, user_id: str, group_id: str = None, now: float = None) -> Optional[str]:
+        """检查是否允许执行指令：允许返回None，拒绝返回提示文字（重复刷屏时为空字符串）"""
+        now = time.time() if now is None else now
+        self._expire(now)
+
+        rejection = self.check_cooldown(command, user_id, now)
+        if rejection is not None:
+            return rejection
+
+        limit = self.limit_for(command, group_id)
+        rate = limit.get("rate", 0)
+        burst = limit.get("burst", 0)
+        if rate <= 0 or burst <= 0:
+            return None
+
+        key = (group_id, command, user_id)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [burst, now, False]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+
+        if bucket[0] < 1:
+            self.rejected_rate += 1
+            # 同一轮刷屏只提示一次，之后静默丢弃
+            if bucket[2]:
+                return ""
+            bucket[2] = True
+            return "操作太频繁了，请稍后再试！"
+
+        bucket[0] -= 1
+        bucket[2] = False
+        # 令牌补满后该桶等价于不存在，到时由时间轮回收
+        self._wheel.schedule(("rl",) + key, now + (burst - bucket[0]) / rate)
+        return None
+
+    def check_cooldown(self, command: str, user_id: str, now: float = None) -> Optional[str]:
+        """只检查冷却，不消耗令牌：冷却中返回提示文字，否则返回None
+
+        同一用户的指令持锁后再检查一次：入口检查之后排队等锁的指令，可能在前一条指令开始冷却之后才执行。
+        """
+        now = time.time() if now is None else now
+        expires_at = self._cooldowns.get((command, user_id))
+        if expires_at is not None and expires_at > now:
+            self.rejected_cooldown += 1
+            return f"{command}冷却中，请等待{self._format_remaining(expires_at - now)}后再试！"
+        return None
+
+    def start(self, command: str, user_id: str, group_id: str = None, now: float = None):
+        """指令执行成功后开始冷却"""
+        now = time.time() if now is None else now
+        cooldown = self.limit_for(command, group_id).get("cooldown", 0)
+        if cooldown > 0:
+            self.restore(command, user_id, now + cooldown)
+            if self.persist:
+                self.persist(user_id, command, int(math.ceil(now + cooldown)))
+
+    def restore(self, command: str, user_id: str, expires_at: float):
+        """恢复一条冷却记录（启动时从数据库加载）"""
+        if expires_at <= time.time():
+            return
+        current = self._cooldowns.get((command, user_id))
+        if current is not None and current >= expires_at:
+            return
+        self._cooldowns[(command, user_id)] = expires_at
+        self._wheel.schedule(("cd", command, user_id), expires_at)
+
+    def cooldown_for(self, command: str, group_id: str = None) -> float:
+        return self.limit_for(command, group_id).get("cooldown", 0)
+
+    @staticmethod
+    def _format_remaining(seconds: float) -> str:
+        seconds = int(math.ceil(seconds))
+        if seconds >= 60:
+            return f"{max(1, round(seconds / 60))}分钟"
+        return f"{seconds}秒"
+
+    @staticmethod
+    def parse_limits(raw: Any) -> Dict[str, Any]:
+        """解析配置中的限制，支持JSON字符串或字典"""
+        if not raw:
+            return {}
+        if isinstance(raw, dict):
+            return raw
+        try:
+            return json.loads(raw)
+        except ValueError as e:
+            logger.error(f"指令限制配置不是有效的JSON: {str(e)}")
+            return {}
+
+    def stats(self) -> Dict[str, Any]:
+        """冷却与频率限制的统计数据"""
+        return {
+            "cooldowns": len(self._cooldowns),
+            "buckets": len(self._buckets),
+            "wheel_entries": len(self._wheel),
+            "rejected_cooldown": self.rejected_cooldown,
+            "rejected_rate": self.rejected_rate,
+        }
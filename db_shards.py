@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""数据库分片：按user_id的稳定哈希把玩家分到多个SQLite文件，以及离线重新分片的工具
+
+用法（只依赖标准库，需先停止机器人）：
+    python db_shards.py [插件目录] --shards 4
+
+会把plugins_db中现有的数据库（单文件或任意分片数）按新的分片数重写，
+原文件移动到plugins_db/backup-时间戳-原分片数/。--shards 1 还原为单文件。
+"""
+import os
+import re
+import time
+import zlib
+import argparse
+import shutil
+import sqlite3
+from typing import Dict, List
+
+DB_DIR_NAME = "plugins_db"
+DB_NAME = "astrbot_plugin_qq_pet.db"
+SHARD_PATTERN = re.compile(r"^astrbot_plugin_qq_pet\.shard(\d+)-of-(\d+)\.db$")
+BATCH_SIZE = 5000
+
+
+def shard_of(user_id: str, shards: int) -> int:
+    """稳定哈希，与ShardedLockManager相同，保证同一用户总是落在同一分片"""
+    return zlib.crc32(str(user_id).encode("utf-8")) % shards
+
+
+def shard_name(index: int, shards: int) -> str:
+    """分片的文件名，分片数为1时就是原来的单文件"""
+    if shards == 1:
+        return DB_NAME
+    return f"astrbot_plugin_qq_pet.shard{index:02d}-of-{shards:02d}.db"
+
+
+def shard_paths(db_dir: str, shards: int) -> List[str]:
+    return [os.path.join(db_dir, shard_name(index, shards)) for index in range(shards)]
+
+
+def existing_layouts(db_dir: str) -> Dict[int, List[str]]:
+    """目录中已有的数据库布局：分片数 -> 已存在的文件"""
+    layouts: Dict[int, List[str]] = {}
+    if not os.path.isdir(db_dir):
+        return layouts
+    for name in sorted(os.listdir(db_dir)):
+        if name == DB_NAME:
+            layouts.setdefault(1, []).append(os.path.join(db_dir, name))
+            continue
+        match = SHARD_PATTERN.match(name)
+        if match:
+            layouts.setdefault(int(match.group(2)), []).append(os.path.join(db_dir, name))
+    return layouts
+
+
+def _user_tables(conn: sqlite3.Connection) -> Dict[str, bool]:
+    """所有表 -> 是否按用户分片（有user_id列），没有user_id的表（如商店）每个分片各存一份"""
+    tables = {}
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%'"):
+        columns = [row[1] for row in conn.execute(f'PRAGMA table_info("{name}")')]
+        tables[name] = "user_id" in columns
+    return tables
+
+
+def _copy_schema(source: sqlite3.Connection, target: sqlite3.Connection):
+    for (sql,) in source.execute(
+            "SELECT sql FROM sqlite_master WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' "
+            "ORDER BY type = 'index'"):
+        target.execute(sql)
+
+
+def reshard(plugin_dir: str, shards: int) -> Dict[str, int]:
+    """把现有数据库重写为shards个分片，返回每张表写入的行数
+
+    先写入临时文件并核对行数，全部成功后才替换，原文件保留在备份目录。
+    """
+    db_dir = os.path.join(plugin_dir, DB_DIR_NAME)
+    layouts = existing_layouts(db_dir)
+    if not layouts:
+        raise SystemExit(f"没有找到数据库: {db_dir}")
+    if len(layouts) > 1:
+        raise SystemExit(f"目录中同时存在多种分片布局（{'、'.join(map(str, sorted(layouts)))}），请先手动清理: {db_dir}")
+    (source_shards, source_paths), = layouts.items()
+    if len(source_paths) != source_shards:
+        raise SystemExit(f"分片数为{source_shards}的数据库只找到{len(source_paths)}个文件，无法重新分片")
+    if source_shards == shards:
+        print(f"数据库已经是{shards}个分片，无需处理")
+        return {}
+
+    sources = [sqlite3.connect(path) for path in source_paths]
+    targets_final = shard_paths(db_dir, shards)
+    targets_tmp = [f"{path}.tmp" for path in targets_final]
+    for path in targets_tmp:
+        if os.path.exists(path):
+            os.remove(path)
+    targets = [sqlite3.connect(path) for path in targets_tmp]
+    try:
+        for target in targets:
+            _copy_schema(sources[0], target)
+        tables = _user_tables(sources[0])
+
+        counts: Dict[str, int] = {}
+        for table, by_user in tables.items():
+            columns = [row[1] for row in sources[0].execute(f'PRAGMA table_info("{table}")')]
+            insert = f'INSERT INTO "{table}" ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+            user_index = columns.index("user_id") if by_user else None
+            # 不分片的表各分片内容相同，只从第一个源文件复制
+            for source in (sources if by_user else sources[:1]):
+                batches: Dict[int, List[tuple]] = {}
+                pending = 0
+                for row in source.execute(f'SELECT {", ".join(columns)} FROM "{table}"'):
+                    if by_user:
+                        batches.setdefault(shard_of(row[user_index], shards), []).append(row)
+                    else:
+                        for index in range(shards):
+                            batches.setdefault(index, []).append(row)
+                    counts[table] = counts.get(table, 0) + 1
+                    pending += 1
+                    if pending >= BATCH_SIZE:
+                        for index, rows in batches.items():
+                            targets[index].executemany(insert, rows)
+                        batches, pending = {}, 0
+                for index, rows in batches.items():
+                    targets[index].executemany(insert, rows)
+
+            # 核对行数：分片表各分片之和等于源数据，不分片的表每个分片一份完整数据
+            written = [target.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0] for target in targets]
+            expected = counts.get(table, 0)
+            if (sum(written) if by_user else min(written)) != expected:
+                raise RuntimeError(f"表{table}行数不一致: 源数据{expected}，写入{written}")
+
+        for target in targets:
+            target.commit()
+    finally:
+        for conn in sources + targets:
+            conn.close()
+
+    backup_dir = os.path.join(db_dir, f"backup-{time.strftime('%Y%m%d-%H%M%S')}-{source_shards}")
+    os.makedirs(backup_dir)
+    for path in source_paths:
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                shutil.move(path + suffix, os.path.join(backup_dir, os.path.basename(path) + suffix))
+    for tmp, final in zip(targets_tmp, targets_final):
+        os.replace(tmp, final)
+
+    print(f"已将{source_shards}个分片重写为{shards}个分片: "
+          + "，".join(f"{table} {count}行" for table, count in counts.items()))
+    print(f"原数据库已移动到: {backup_dir}")
+    return counts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("plugin_dir", nargs="?", default=os.path.dirname(os.path.abspath(__file__)))
+    parser.add_argument("--shards", type=int, required=True, help="新的分片数，1为单文件")
+    args = parser.parse_args()
+    if args.shards < 1:
+        parser.error("--shards至少为1")
+    reshard(args.plugin_dir, args.shards)
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+import os
+import json
+import math
+import random
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+EVENTS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "explore_events.json")
+
+
+def _mean(value_range: Optional[Tuple[int, int]]) -> float:
+    """randint(a, b)的期望"""
+    return (value_range[0] + value_range[1]) / 2 if value_range else 0.0
+
+
+def _roll(value_range: Optional[Tuple[int, int]], rng) -> int:
+    return rng.randint(value_range[0], value_range[1]) if value_range else 0
+
+
+class AliasTable:
+    """Vose别名法：O(n)建表后每次按权重抽样都是O(1)"""
+
+    def __init__(self, weights: List[float]):
+        total = float(sum(weights))
+        if not weights or total <= 0:
+            raise ValueError("权重之和必须大于0")
+        n = len(weights)
+        self.size = n
+        self.prob = [0.0] * n
+        self.alias = [0] * n
+
+        scaled = [weight * n / total for weight in weights]
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] -= 1.0 - scaled[less]
+            (small if scaled[more] < 1.0 else large).append(more)
+        # 剩下的都是（受浮点误差影响的）满格
+        for i in small + large:
+            self.prob[i] = 1.0
+
+    def sample(self, rng=random) -> int:
+        column = int(rng.random() * self.size)
+        return column if rng.random() < self.prob[column] else self.alias[column]
+
+
+class ExploreEvent:
+    """一条探索事件：权重、奖励/损失区间、遇敌概率和消息模板"""
+    __slots__ = ("id", "name", "weight", "message", "coins", "exp", "items", "hp_loss", "battle")
+
+    def __init__(self, spec: Dict[str, Any]):
+        self.id: str = spec["id"]
+        self.name: str = spec.get("name", self.id)
+        self.weight: float = float(spec.get("weight", 0))
+        self.message: str = spec["message"]
+        self.coins = tuple(spec["coins"]) if spec.get("coins") else None
+        self.exp = tuple(spec["exp"]) if spec.get("exp") else None
+        self.items: Dict[str, Tuple[int, int]] = {name: tuple(value_range) for name, value_range in spec.get("items", {}).items()}
+        self.hp_loss = tuple(spec["hp_loss"]) if spec.get("hp_loss") else None
+        self.battle: float = float(spec.get("battle", 0))
+
+    def roll(self, rng=random) -> Dict[str, int]:
+        """按区间随机出本次事件的数值，物品以物品名为键，可直接用于消息模板"""
+        values = {"coins": _roll(self.coins, rng), "exp": _roll(self.exp, rng), "hp_loss": _roll(self.hp_loss, rng)}
+        for name, value_range in self.items.items():
+            values[name] = _roll(value_range, rng)
+        return values
+
+
+class ExploreOutcome:
+    """一次探索的结构化结果，battle为None表示没有战斗，否则表示是否胜利"""
+    __slots__ = ("event", "text", "battle")
+
+    def __init__(self, event: ExploreEvent, text: str, battle: Optional[bool] = None):
+        self.event = event
+        self.text = text
+        self.battle = battle
+
+    def __str__(self) -> str:
+        return self.text
+
+
+class ExploreEventRegistry:
+    """探索事件表，从explore_events.json加载，weights可以按事件id覆盖权重"""
+
+    def __init__(self, path: str = EVENTS_FILE, weights: Dict[str, float] = None):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        self.events: List[ExploreEvent] = [ExploreEvent(spec) for spec in data["events"]]
+        self.by_id: Dict[str, ExploreEvent] = {event.id: event for event in self.events}
+        overrides = {}
+        for event_id, weight in (weights or {}).items():
+            if event_id in self.by_id:
+                overrides[event_id] = float(weight)
+            else:
+                logger.warning(f"探索事件权重配置中的事件不存在: {event_id}")
+        # 覆盖后所有事件的权重都为0时无法抽样，忽略配置而不是让插件加载失败
+        if sum(overrides.get(event.id, event.weight) for event in self.events) <= 0:
+            logger.error("探索事件权重配置使所有事件的权重都为0，已忽略该配置，使用事件表中的权重")
+            overrides = {}
+        for event_id, weight in overrides.items():
+            self.by_id[event_id].weight = weight
+
+        # 权重为0的事件不参与抽样
+        self.events = [event for event in self.events if event.weight > 0]
+        self.total_weight = sum(event.weight for event in self.events)
+        self._table = AliasTable([event.weight for event in self.events])
+
+        reward = data.get("battle_reward", {})
+        self.battle_exp = tuple(reward.get("exp", (18, 24)))
+        self.battle_exp_growth = float(reward.get("exp_growth", 1.2))
+        self.battle_coins = tuple(reward.get("coins", (40, 120)))
+
+    @staticmethod
+    def parse_weights(raw: Any) -> Dict[str, float]:
+        """解析配置中的权重覆盖，支持JSON字符串或字典；必须是事件id到非负数的映射，无效的部分忽略"""
+        if not raw:
+            return {}
+        if not isinstance(raw, dict):
+            try:
+                raw = json.loads(raw)
+            except (TypeError, ValueError) as e:
+                logger.error(f"探索事件权重配置不是有效的JSON: {str(e)}")
+                return {}
+        if not isinstance(raw, dict):
+            logger.error("探索事件权重配置必须是对象，如 {\"wise_man\": 10}，已忽略")
+            return {}
+
+        weights = {}
+        for event_id, weight in raw.items():
+            if isinstance(weight, bool) or not isinstance(weight, (int, float)) or not weight >= 0 or math.isinf(weight):
+                logger.error(f"探索事件{event_id}的权重必须是非负数，已忽略: {weight!r}")
+                continue
+            weights[event_id] = float(weight)
+        return weights
+
+    def pick(self, rng=random) -> ExploreEvent:
+        """按权重抽取一个事件，O(1)"""
+        return self.events[self._table.sample(rng)]
+
+    def probability(self, event_id: str) -> float:
+        event = self.by_id.get(event_id)
+        if event is None or event.weight <= 0:
+            return 0.0
+        return event.weight / self.total_weight
+
+    def battle_exp_range(self, level: int) -> Tuple[int, int]:
+        """战斗胜利的经验区间，随宠物等级指数增长"""
+        multiplier = self.battle_exp_growth ** (level - 1)
+        return int(self.battle_exp[0] * multiplier), int(self.battle_exp[1] * multiplier)
+
+    def expected_value(self, level: int = 1, win_rate: float = 1.0) -> Dict[str, Any]:
+        """每次探索的解析期望值，战斗奖励按给定胜率计入"""
+        coins = exp = hp_loss = battle = 0.0
+        items: Dict[str, float] = {}
+        for event in self.events:
+            p = event.weight / self.total_weight
+            coins += p * _mean(event.coins)
+            exp += p * _mean(event.exp)
+            hp_loss += p * _mean(event.hp_loss)
+            battle += p * event.battle
+            for name, value_range in event.items.items():
+                items[name] = items.get(name, 0.0) + p * _mean(value_range)
+
+        wins = battle * win_rate
+        return {
+            "coins": coins + wins * _mean(self.battle_coins),
+            "exp": exp + wins * _mean(self.battle_exp_range(level)),
+            "items": items,
+            "hp_loss": hp_loss,
+            "battle": battle,
+        }
+
+    def report(self, level: int = 1) -> str:
+        """事件概率和期望收益的文字报告"""
+        lines = ["🧭 探索事件概率"]
+        for event in sorted(self.events, key=lambda e: -e.weight):
+            battle = f"（{event.battle:.0%}遇敌）" if event.battle else ""
+            lines.append(f"{event.name}：{event.weight / self.total_weight:.2%}{battle}")
+
+        base = self.expected_value(level, win_rate=0.0)
+        full = self.expected_value(level, win_rate=1.0)
+        exp_low, exp_high = self.battle_exp_range(level)
+        lines.append(f"\n📈 每次探索期望（Lv.{level}）")
+        lines.append(f"遇敌概率：{base['battle']:.1%}")
+        lines.append(f"战斗胜利奖励：经验{exp_low}~{exp_high}，金币{self.battle_coins[0]}~{self.battle_coins[1]}")
+        lines.append(f"事件收益：金币{base['coins']:.1f}，经验{base['exp']:.1f}")
+        lines.append(f"全胜时收益：金币{full['coins']:.1f}，经验{full['exp']:.1f}")
+        if base["items"]:
+            lines.append("物品：" + "，".join(f"{name}{quantity:.2f}" for name, quantity in base["items"].items()))
+        lines.append(f"陷阱损失血量：{base['hp_loss']:.1f}")
+        return "\n".join(lines)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import json
+import asyncio
+import logging
+import contextvars
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 挂机结算期间探索事件获得的物品先记在这里，由结算统一批量写入；普通指令中为None，直接写数据库
+item_sink: contextvars.ContextVar = contextvars.ContextVar("item_sink", default=None)
+
+
+class IdleExploreScheduler:
+    """挂机探索：一个asyncio定时任务在每个tick为所有报名用户结算一次探索
+
+    探索和战斗在内存中的宠物上进行，每个tick的结果按表各用一次executemany写入，
+    结算摘要累积起来，在用户下一次使用指令时发送。
+    """
+
+    def __init__(self, plugin, interval: float = 600.0):
+        self.plugin = plugin
+        self.interval = max(1.0, float(interval))
+        self.enrolled: Dict[str, Dict[str, Any]] = {}  # user_id -> 尚未发送的摘要
+        self._task: Optional[asyncio.Task] = None
+
+        self.ticks = 0
+        self.explores = 0
+        self.last_tick_seconds = 0.0
+
+        for user_id, digest in plugin.db.get_idle_enrollments().items():
+            self.enrolled[user_id] = json.loads(digest) if digest else self._empty_digest()
+
+    @staticmethod
+    def _empty_digest() -> Dict[str, Any]:
+        return {"explores": 0, "wins": 0, "losses": 0, "coins": 0, "exp": 0, "items": {}}
+
+    @staticmethod
+    def _merge_digest(digest: Dict[str, Any], result: Dict[str, Any], sign: int = 1):
+        """把一次探索的结果加到摘要上，sign为-1时撤销"""
+        for key in ("explores", "wins", "losses", "coins", "exp"):
+            digest[key] += sign * result[key]
+        items = digest["items"]
+        for item_name, quantity in result["items"].items():
+            items[item_name] = items.get(item_name, 0) + sign * quantity
+            if items[item_name] <= 0:
+                del items[item_name]
+
+    def start(self):
+        """启动定时任务，没有运行中的事件循环时等下一次调用再启动"""
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def enroll(self, user_id: str) -> bool:
+        """报名挂机探索，已经报名时返回False"""
+        if user_id in self.enrolled:
+            return False
+        self.enrolled[user_id] = self._empty_digest()
+        self.plugin.db.set_idle_enrolled(user_id, True)
+        self.start()
+        return True
+
+    def withdraw(self, user_id: str) -> bool:
+        """退出挂机探索，未报名时返回False"""
+        if user_id not in self.enrolled:
+            return False
+        del self.enrolled[user_id]
+        self.plugin.db.set_idle_enrolled(user_id, False)
+        return True
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"挂机探索结算失败: {str(e)}")
+
+    async def tick(self):
+        """为所有报名用户结算一次探索"""
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        plugin = self.plugin
+        explored: List[tuple] = []  # (user_id, 本次累积到的摘要, 本次探索的结果)
+        item_rows: Dict[tuple, int] = {}
+
+        plugin.coherence.sync()
+        sink: List[tuple] = []
+        token = item_sink.set(sink)
+        try:
+            for user_id in list(self.enrolled):
+                pet = plugin.pets.get(user_id)
+                if pet is None or not pet.is_alive():
+                    continue
+                # 与该用户的指令互斥，避免和进行中的指令交错修改宠物
+                async with plugin.locks.hold(user_id):
+                    plugin.coherence.refresh(user_id)
+                    # 等锁期间宠物可能被其他进程删除，或用户已退出挂机
+                    pet = plugin.pets.get(user_id)
+                    digest = self.enrolled.get(user_id)
+                    if pet is None or digest is None:
+                        continue
+                    coins_before = pet.coins
+                    exp_before = pet.total_exp
+                    items_start = len(sink)
+
+                    outcome = await plugin._explore_once(pet, user_id)
+
+                    result = self._empty_digest()
+                    result["explores"] = 1
+                    result["coins"] = pet.coins - coins_before
+                    result["exp"] = pet.total_exp - exp_before
+                    if outcome.battle is True:
+                        result["wins"] = 1
+                    elif outcome.battle is False:
+                        result["losses"] = 1
+                    for _, item_name, quantity in sink[items_start:]:
+                        result["items"][item_name] = result["items"].get(item_name, 0) + quantity
+                    self._merge_digest(digest, result)
+
+                    explored.append((user_id, digest, result))
+                    plugin.leaderboard.touch(user_id)
+        finally:
+            item_sink.reset(token)
+
+        # 等待后面用户的锁时，前面的用户可能已经执行了指令并提交（如购买扣除金币），
+        # 所以宠物行在写入前才从内存中的宠物生成，从这里到写入没有await
+        pet_rows: List[Dict[str, Any]] = []
+        digest_rows = []
+        for user_id, digest, _ in explored:
+            pet = plugin.pets.get(user_id)
+            if pet is not None:
+                row = pet.to_dict()
+                row["user_id"] = user_id
+                pet_rows.append(row)
+            # 摘要已被取走发送（或用户已退出挂机）时不再写回，避免重启后重复汇报
+            if self.enrolled.get(user_id) is digest:
+                digest_rows.append((json.dumps(digest, ensure_ascii=False), user_id))
+
+        for user_id, item_name, quantity in sink:
+            item_rows[(user_id, item_name)] = item_rows.get((user_id, item_name), 0) + quantity
+
+        conflicts = set()
+        if pet_rows:
+            conflicts = plugin.db.save_idle_tick(
+                pet_rows,
+                [(user_id, item_name, quantity) for (user_id, item_name), quantity in item_rows.items()],
+                digest_rows
+            )
+        # 多进程模式下被其他进程抢先修改的宠物没有写入，物品和摘要也没有写入，
+        # 从摘要中撤销这次探索，宠物在下一次sync()时从数据库重新加载
+        for user_id, digest, result in explored:
+            if user_id in conflicts and self.enrolled.get(user_id) is digest:
+                self._merge_digest(digest, result, -1)
+
+        self.ticks += 1
+        self.explores += len(explored) - len(conflicts)
+        self.last_tick_seconds = loop.time() - start
+
+    def pop_digest(self, user_id: str) -> Optional[str]:
+        """取出并清空用户的挂机摘要，没有新结果时返回None"""
+        digest = self.enrolled.get(user_id)
+        if not digest or not digest["explores"]:
+            return None
+        self.enrolled[user_id] = self._empty_digest()
+        self.plugin.db.set_idle_digest(user_id, None)
+
+        items = "，".join(f"{name}×{quantity}" for name, quantity in digest["items"].items()) or "无"
+        return (f"🌙 挂机探索报告：共探索{digest['explores']}次\n"
+                f"战斗：胜利{digest['wins']}场，失败{digest['losses']}场\n"
+                f"获得：金币【{digest['coins']}】，经验【{digest['exp']}】\n"
+                f"物品：{items}")
+
+    def stats(self) -> Dict[str, Any]:
+        """挂机探索的统计数据"""
+        return {
+            "enrolled": len(self.enrolled),
+            "ticks": self.ticks,
+            "explores": self.explores,
+            "last_tick_ms": self.last_tick_seconds * 1000,
+        }
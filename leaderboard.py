@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import heapq
+import logging
+from bisect import bisect_left, insort
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TopK:
+    """按战力值从高到低保存前capacity名，宠物属性变化时增量更新
+
+    条目按(-战力值, user_id)排序。不变量：不在表中的宠物都排在最后一名之后，
+    所以表中的前len名总是准确的。表中的宠物战力下降到最后一名之后时直接移出，表变短但仍然准确，
+    只有查询的名次超过表长时才调用refill(capacity)重新读取，查询本身是O(K)。
+    """
+
+    def __init__(self, capacity: int, refill: Callable[[int], Iterable[Tuple[str, int]]]):
+        self.capacity = max(1, int(capacity))
+        self._refill = refill
+        self._entries: List[Tuple[int, str]] = []
+        self._power: Dict[str, int] = {}
+        # 表中包含了所有宠物（总数不超过capacity），此时任何宠物都可以直接插入
+        self._complete = False
+        self._loaded = False
+        self.refills = 0
+
+    def _reload(self):
+        rows = list(self._refill(self.capacity))
+        self._entries = sorted((-power, user_id) for user_id, power in rows)[:self.capacity]
+        self._power = {user_id: -negative for negative, user_id in self._entries}
+        self._complete = len(rows) < self.capacity
+        self._loaded = True
+        self.refills += 1
+
+    def update(self, user_id: str, power: int):
+        if not self._loaded:
+            return
+        old = self._power.get(user_id)
+        if old == power:
+            return
+        key = (-power, user_id)
+        if old is not None:
+            last = self._entries[-1]
+            del self._entries[bisect_left(self._entries, (-old, user_id))]
+            del self._power[user_id]
+            # 表外的宠物都排在原来的最后一名之后，新名次在它之前时仍可确定
+            if not (self._complete or key < last):
+                return
+        elif not (self._complete or (self._entries and key < self._entries[-1])):
+            return
+
+        insort(self._entries, key)
+        self._power[user_id] = power
+        if len(self._entries) > self.capacity:
+            _, dropped = self._entries.pop()
+            del self._power[dropped]
+            self._complete = False
+
+    def top(self, k: int) -> List[Tuple[str, int]]:
+        """前k名(user_id, 战力值)，k不超过capacity"""
+        k = min(k, self.capacity)
+        if not self._loaded or (len(self._entries) < k and not self._complete):
+            self._reload()
+        return [(user_id, -negative) for negative, user_id in self._entries[:k]]
+
+    def invalidate(self):
+        self._loaded = False
+        self._entries = []
+        self._power = {}
+
+
+class PowerLeaderboard:
+    """战力排行榜：全服和各群各一个TopK
+
+    全服榜从数据库按战力索引读取前N名；群榜第一次查询时读取群成员，在内存中的宠物里选出前N名。
+    指令结束后middleware对涉及的用户调用touch()，只比较战力是否变化，变化时更新所在的榜单。
+    """
+
+    def __init__(self, plugin, capacity: int = 50):
+        self.plugin = plugin
+        self.capacity = max(1, int(capacity))
+        self.global_top = TopK(self.capacity, self._global_candidates)
+        self.groups: Dict[str, TopK] = {}
+        self.members: Dict[str, Set[str]] = {}      # 已加载的群 -> 成员
+        self.groups_of: Dict[str, Set[str]] = {}    # 用户 -> 已加载的群中包含该用户的群
+        self._recorded: Set[Tuple[str, str]] = set()  # 本次运行已写入数据库的(用户, 群)
+
+    def _global_candidates(self, limit: int) -> List[Tuple[str, int]]:
+        pets = self.plugin.pets
+        # 以内存中的宠物为准，数据库只用来按索引找出候选
+        return [(user_id, pets[user_id].power if user_id in pets else power)
+                for user_id, power in self.plugin.db.top_power(limit)]
+
+    def _group_candidates(self, group_id: str) -> Callable[[int], List[Tuple[str, int]]]:
+        def refill(limit: int) -> List[Tuple[str, int]]:
+            pets = self.plugin.pets
+            rows = ((user_id, pets[user_id].power) for user_id in self.members[group_id] if user_id in pets)
+            return heapq.nsmallest(limit, rows, key=lambda row: (-row[1], row[0]))
+        return refill
+
+    def record_member(self, user_id: str, group_id: Optional[str]):
+        """记录用户在群里使用过指令，每个(用户, 群)在每次运行中只写一次数据库"""
+        if not group_id or (user_id, group_id) in self._recorded:
+            return
+        self._recorded.add((user_id, group_id))
+        self.plugin.db.add_group_member(user_id, group_id)
+        members = self.members.get(group_id)
+        if members is not None and user_id not in members:
+            members.add(user_id)
+            self.groups_of.setdefault(user_id, set()).add(group_id)
+            pet = self.plugin.pets.get(user_id)
+            if pet is not None:
+                self.groups[group_id].update(user_id, pet.power)
+
+    def touch(self, *user_ids: str):
+        """宠物可能发生变化后调用，战力值变化时更新所在的榜单"""
+        pets = self.plugin.pets
+        for user_id in user_ids:
+            pet = pets.get(user_id)
+            if pet is None:
+                continue
+            power = pet.power
+            self.global_top.update(user_id, power)
+            for group_id in self.groups_of.get(user_id, ()):
+                self.groups[group_id].update(user_id, power)
+
+    def reset(self):
+        """大量宠物同时变化后（如发放经验）清空榜单，下一次查询时重新读取"""
+        self.global_top.invalidate()
+        for top in self.groups.values():
+            top.invalidate()
+
+    def top(self, k: int, group_id: str = None) -> List[Tuple[str, int]]:
+        if not group_id:
+            return self.global_top.top(k)
+        if group_id not in self.groups:
+            members = self.members[group_id] = set(self.plugin.db.get_group_members(group_id))
+            for user_id in members:
+                self.groups_of.setdefault(user_id, set()).add(group_id)
+            self.groups[group_id] = TopK(self.capacity, self._group_candidates(group_id))
+        return self.groups[group_id].top(k)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "capacity": self.capacity,
+            "groups": len(self.groups),
+            "refills": self.global_top.refills + sum(top.refills for top in self.groups.values()),
+        }
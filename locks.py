@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import time
+import zlib
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+
+class ShardedLockManager:
+    """固定数量的分片asyncio.Lock，按用户ID哈希到分片上串行执行
+
+    同一用户（或对决双方）的指令依次执行，不相关的用户大概率落在不同分片上并行执行。
+    需要多把锁时按分片序号从小到大获取，避免互相等待造成死锁。
+    """
+
+    def __init__(self, shards: int = 64):
+        self.shards = max(1, int(shards))
+        self._locks: List[asyncio.Lock] = [asyncio.Lock() for _ in range(self.shards)]
+
+        self.acquisitions = 0   # 获取锁的次数
+        self.contended = 0      # 需要等待的次数
+        self.total_wait = 0.0   # 累计等待时间（秒）
+        self.max_wait = 0.0     # 最长等待时间（秒）
+
+    def shard_of(self, key: str) -> int:
+        """稳定哈希，保证同一用户总是落在同一分片"""
+        return zlib.crc32(str(key).encode("utf-8")) % self.shards
+
+    def locked(self, key: str) -> bool:
+        """key所在的分片当前是否被持有（可能是同一分片上的其他用户）"""
+        return self._locks[self.shard_of(key)].locked()
+
+    @asynccontextmanager
+    async def hold(self, *keys: str):
+        """持有所有key对应分片的锁"""
+        indices = sorted({self.shard_of(key) for key in keys if key})
+        start = time.perf_counter()
+        contended = False
+        acquired = []
+        try:
+            for index in indices:
+                lock = self._locks[index]
+                if lock.locked():
+                    contended = True
+                await lock.acquire()
+                acquired.append(lock)
+
+            wait = time.perf_counter() - start
+            self.acquisitions += 1
+            self.total_wait += wait
+            if contended:
+                self.contended += 1
+            if wait > self.max_wait:
+                self.max_wait = wait
+
+            yield
+        finally:
+            for lock in reversed(acquired):
+                lock.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """锁等待的统计数据"""
+        return {
+            "shards": self.shards,
+            "held": sum(1 for lock in self._locks if lock.locked()),
+            "acquisitions": self.acquisitions,
+            "contended": self.contended,
+            "avg_wait_ms": self.total_wait / self.acquisitions * 1000 if self.acquisitions else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
@@ -3,19 +3,35 @@ import os
 import random
 import logging
 import json
-from typing import Dict, Any, List
+import time
+import uuid
+import asyncio
+import threading
+from typing import TYPE_CHECKING, Dict, Any, List, Optional, Union
 from datetime import datetime, timedelta
 from astrbot.api.event import filter, AstrMessageEvent
 from astrbot.api.star import Context, Star, register
-from astrbot.api import logger
-import os
-import sys
-import json
-import sqlite3
-from PIL import Image, ImageDraw, ImageFont
-from typing import Dict, Any, List, Optional, Union
-from datetime import datetime
-from .pet import Pet, PetDatabase
+from astrbot.api import logger, AstrBotConfig
+from .pet import Pet, HealKit, EnemyPet, StaleDataError, grant_exp
+from .species import SPECIES, STARTERS, STARTER_BY_TYPE, sprite_for
+from .asset_pipeline import CARD_SIZE, SPRITE_SIZE, load_manifest, prebuilt_path
+from .render_scheduler import RenderScheduler
+from .singleflight import SingleFlight
+from .locks import ShardedLockManager
+from .middleware import pet_command, after_unlock
+from .cooldowns import CooldownService
+from .idle_explore import IdleExploreScheduler, item_sink
+from .explore_events import ExploreEventRegistry, ExploreOutcome
+from .metrics import Metrics, MetricsExporter
+from .sql_profiler import SQLProfiler
+from .command_profiler import CommandProfiler
+from .storage import PetStorage, open_storage
+from .coherence import PetCacheCoherence
+from .leaderboard import PowerLeaderboard
+
+# PIL只在第一次生成图片（或后台预热）时导入，插件加载和不需要图片的指令不付出导入开销
+if TYPE_CHECKING:
+    from PIL import Image
 
 # PetImageGenerator类
 class PetImageGenerator:
@@ -27,27 +43,53 @@ class PetImageGenerator:
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
         
-        # 检查并修复背景图片
-        self._check_and_fix_background()
+        # 预处理资源清单（由asset_pipeline.py生成），以及解码后的图片缓存
+        self.manifest = load_manifest(plugin_dir)
+        self._image_cache: Dict[str, "Image.Image"] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+        
+        # 背景检查和预热推迟到后台任务或第一次渲染
+        self._ready = False
+        self._ready_lock = threading.Lock()
+    
+    def warm_up(self):
+        """导入PIL、检查背景图片并解码到缓存，只执行一次；在线程中调用"""
+        if self._ready:
+            return
+        with self._ready_lock:
+            if self._ready:
+                return
+            start = time.perf_counter()
+            self._check_and_fix_background()
+            self._load_image("background", self.bg_image, CARD_SIZE, "RGBA")
+            self._ready = True
+            logger.info(f"图片生成器预热完成，用时{(time.perf_counter() - start) * 1000:.0f}ms")
     
     def _check_and_fix_background(self):
         """检查并修复背景图片"""
+        from PIL import Image
+        # 清单中的哈希与文件一致时直接信任，不再打开图片校验
+        if prebuilt_path(self.plugin_dir, self.manifest, "background"):
+            logger.info(f"背景图片与资源清单一致: {self.bg_image}")
+            return
         try:
             # 检查背景图片是否存在且有效
             if os.path.exists(self.bg_image):
                 # 尝试打开背景图片
                 img = Image.open(self.bg_image)
                 img.verify()  # 验证图片完整性
-                print(f"背景图片正常: {self.bg_image}")
+                logger.info(f"背景图片正常: {self.bg_image}")
                 return
         except Exception as e:
-            print(f"背景图片损坏或无法打开: {e}")
+            logger.warning(f"背景图片损坏或无法打开: {e}")
         
         # 创建新的背景图片
         self._create_new_background()
     
     def _create_new_background(self):
         """创建新的背景图片"""
+        from PIL import Image
         # 确保assets目录存在
         assets_dir = os.path.join(self.plugin_dir, "assets")
         if not os.path.exists(assets_dir):
@@ -59,113 +101,144 @@ class PetImageGenerator:
         
         # 保存背景图片
         bg.save(self.bg_image)
-        print(f"新的背景图片已创建: {self.bg_image}")
+        self._image_cache.pop("background", None)
+        logger.info(f"新的背景图片已创建: {self.bg_image}")
+
+    def stats(self) -> Dict[str, Any]:
+        """图片缓存的统计数据"""
+        lookups = self.cache_hits + self.cache_misses
+        return {
+            "cached": len(self._image_cache),
+            "hits": self.cache_hits,
+            "misses": self.cache_misses,
+            "hit_ratio": self.cache_hits / lookups if lookups else 0.0,
+        }
+
+    def _load_image(self, key: str, source_path: str, size: tuple, mode: str) -> "Image.Image":
+        """加载指定尺寸和模式的图片，优先使用预处理产物，并缓存解码结果"""
+        img = self._image_cache.get(key)
+        if img is not None:
+            self.cache_hits += 1
+            return img
+        self.cache_misses += 1
+        from PIL import Image
+        
+        built = prebuilt_path(self.plugin_dir, self.manifest, key)
+        if built:
+            img = Image.open(built)
+            img.load()
+        else:
+            img = Image.open(source_path).convert(mode)
+        if img.mode != mode:
+            img = img.convert(mode)
+        if img.size != size:
+            img = img.resize(size)
+        self._image_cache[key] = img
+        return img
 
     async def create_pet_image(self, text: str, pet_type: str = None, font_size: int = 36) -> Union[str, None]:
         """生成宠物信息图片"""
+        # PIL绘制是纯CPU操作，放到线程中执行，避免阻塞事件循环
+        return await asyncio.to_thread(self._render_pet_image, text, pet_type)
+
+    def _render_pet_image(self, text: str, pet_type: str = None) -> Union[str, None]:
+        """同步绘制宠物信息卡并保存到临时目录"""
         try:
-            # 调整背景图片大小为800x600
-            W, H = 800, 600
-            bg = Image.open(self.bg_image)
-            bg = bg.resize((W, H))
+            bg = self.draw_card(text, pet_type)
 
-            draw = ImageDraw.Draw(bg)
+            # 同一秒内可能有多张卡片在渲染，用随机文件名避免互相覆盖
+            output_path = os.path.join(self.output_dir, f"pet_{uuid.uuid4().hex}.png")
+            bg.save(output_path)
+            logger.debug(f"图片已保存到: {output_path}")
+            return output_path
+        except Exception as e:
+            logger.error(f"生成图片失败: {str(e)}", exc_info=True)
+            return None
 
-            # 设置字体
-            try:
-                if os.path.exists(self.font_path):
-                    font_title = ImageFont.truetype(self.font_path, 40)
-                    font_text = ImageFont.truetype(self.font_path, 28)
-                else:
-                    font_title = ImageFont.load_default()
-                    font_text = ImageFont.load_default()
-            except Exception:
+    def draw_card(self, text: str, pet_type: str = None) -> "Image.Image":
+        """绘制宠物信息卡，返回RGBA图片"""
+        from PIL import ImageDraw, ImageFont
+        self.warm_up()
+        # 调整背景图片大小为800x600
+        W, H = CARD_SIZE
+        bg = self._load_image("background", self.bg_image, CARD_SIZE, "RGBA").copy()
+
+        draw = ImageDraw.Draw(bg)
+
+        # 设置字体
+        try:
+            if os.path.exists(self.font_path):
+                font_title = ImageFont.truetype(self.font_path, 40)
+                font_text = ImageFont.truetype(self.font_path, 28)
+            else:
                 font_title = ImageFont.load_default()
                 font_text = ImageFont.load_default()
+        except Exception:
+            font_title = ImageFont.load_default()
+            font_text = ImageFont.load_default()
 
-            # 如果提供了宠物类型，尝试添加宠物图片
-            # 首先检查pet_type是否直接在TYPE_IMAGES中
-            pet_image_name = None
-            if pet_type and pet_type in Pet.TYPE_IMAGES:
-                pet_image_name = Pet.TYPE_IMAGES[pet_type]
-            # 如果没有找到，尝试通过属性克制关系映射
-            elif pet_type and pet_type in Pet.TYPE_ADVANTAGES:
-                # 根据属性类型映射到具体的宠物名称
-                type_to_name = {
-                    "火": "烈焰",
-                    "水": "碧波兽",
-                    "草": "藤甲虫",
-                    "土": "碎裂岩",
-                    "金": "金刚"
-                }
-                pet_name = type_to_name.get(pet_type)
-                if pet_name and pet_name in Pet.TYPE_IMAGES:
-                    pet_image_name = Pet.TYPE_IMAGES[pet_name]
-            
-            if pet_image_name:
-                pet_image_path = os.path.join(os.path.dirname(self.bg_image), f"{pet_image_name}.png")
-                if os.path.exists(pet_image_path):
-                    try:
-                        pet_img = Image.open(pet_image_path).convert("RGBA")
-                        # 调整宠物图片大小
-                        pet_img = pet_img.resize((300, 300))
-                        # 将宠物图片粘贴到背景图片上(左侧)
-                        bg.paste(pet_img, (50, 150), pet_img)
-                    except Exception as e:
-                        print(f"加载宠物图片失败: {e}")
-                        import traceback
-                        traceback.print_exc()
+        # 如果提供了宠物类型（种族名或属性），尝试添加宠物图片
+        pet_image_name = sprite_for(pet_type) if pet_type else None
+        
+        if pet_image_name:
+            pet_image_path = os.path.join(os.path.dirname(self.bg_image), f"{pet_image_name}.png")
+            if os.path.exists(pet_image_path):
+                try:
+                    # 预处理过的精灵图已是300x300的RGBA，无需再转换和缩放
+                    pet_img = self._load_image(pet_image_name, pet_image_path, SPRITE_SIZE, "RGBA")
+                    # 将宠物图片粘贴到背景图片上(左侧)
+                    bg.paste(pet_img, (50, 150), pet_img)
+                except Exception as e:
+                    logger.error(f"加载宠物图片失败: {str(e)}", exc_info=True)
 
-            # 绘制标题(居中)
-            title = "宠物信息卡"
-            draw.text((W / 2, 50), title, font=font_title, fill=(0, 0, 0), anchor="mt")
+        # 绘制标题(居中)
+        title = "宠物信息卡"
+        draw.text((W / 2, 50), title, font=font_title, fill=(0, 0, 0), anchor="mt")
 
-            # 解析文本信息
-            lines = text.split('\n')
-            pet_info = {}
-            for line in lines:
-                if '：' in line:
-                    key, value = line.split('：', 1)
-                    pet_info[key] = value
+        # 解析文本信息
+        lines = text.split('\n')
+        pet_info = {}
+        for line in lines:
+            if '：' in line:
+                key, value = line.split('：', 1)
+                pet_info[key] = value
 
-            # 绘制信息卡排版
-            # 主人信息
-            if '主人' in pet_info:
-                draw.text((400, 150), f"主人：{pet_info['主人']}", font=font_text, fill=(0, 0, 0))
-            
-            # 宠物名称
-            if '名称' in pet_info:
-                draw.text((400, 200), f"名称：{pet_info['名称']}", font=font_text, fill=(0, 0, 0))
-            
-            # 宠物属性
-            if '属性' in pet_info:
-                draw.text((400, 250), f"属性：{pet_info['属性']}", font=font_text, fill=(0, 0, 0))
-            
-            # 战力值
-            if '战力值' in pet_info:
-                draw.text((400, 300), f"战力值：{pet_info['战力值']}", font=font_text, fill=(0, 0, 0))
-            
-            # 等级
-            if '等级' in pet_info:
-                draw.text((400, 350), f"等级：{pet_info['等级']}", font=font_text, fill=(0, 0, 0))
+        # 绘制信息卡排版
+        # 主人信息
+        if '主人' in pet_info:
+            draw.text((400, 150), f"主人：{pet_info['主人']}", font=font_text, fill=(0, 0, 0))
+        
+        # 宠物名称
+        if '名称' in pet_info:
+            draw.text((400, 200), f"名称：{pet_info['名称']}", font=font_text, fill=(0, 0, 0))
+        
+        # 宠物属性
+        if '属性' in pet_info:
+            draw.text((400, 250), f"属性：{pet_info['属性']}", font=font_text, fill=(0, 0, 0))
+        
+        # 战力值
+        if '战力值' in pet_info:
+            draw.text((400, 300), f"战力值：{pet_info['战力值']}", font=font_text, fill=(0, 0, 0))
+        
+        # 等级
+        if '等级' in pet_info:
+            draw.text((400, 350), f"等级：{pet_info['等级']}", font=font_text, fill=(0, 0, 0))
 
-            output_path = os.path.join(self.output_dir, f"pet_{int(datetime.now().timestamp())}.png")
-            bg.save(output_path)
-            print(f"图片已保存到: {output_path}")
-            return output_path
-        except Exception as e:
-            print(f"生成图片失败: {e}")
-            import traceback
-            traceback.print_exc()
-            return None
+        return bg
 
 logger = logging.getLogger(__name__)
 
 
 @register("宠物", "Tinyxi", "一个QQ宠物插件，包含创建宠物、喂养、对战等功能", "1.0.0", "https://github.com/520TinyXI/chongwu.git")
 class QQPetPlugin(Star):
-    def __init__(self, context: Context):
+    # 共享状态卡在去重窗口结束后再保留的秒数，避免仍在发送的图片被删除
+    CARD_CLEANUP_DELAY = 30
+    # 探索中随机战斗可能遇到的敌人属性
+    ENEMY_TYPES = tuple(EnemyPet.BASE_STATS)
+    
+    def __init__(self, context: Context, config: AstrBotConfig = None):
         super().__init__(context)
+        self.config = config or {}
         plugin_dir = os.path.dirname(__file__)
         
         # 确保资源目录存在
@@ -174,27 +247,175 @@ class QQPetPlugin(Star):
             os.makedirs(assets_dir)
             logger.warning(f"创建资源目录: {assets_dir}")
         
-        self.db = PetDatabase(plugin_dir)
-        self.img_gen = PetImageGenerator(plugin_dir)
+        self.plugin_dir = plugin_dir
+        self.diagnostics_dir = os.path.join(plugin_dir, "diagnostics")
+        self.metrics = Metrics()
+        self.metrics.watch_errors(logger)
+        self.db: PetStorage = open_storage(plugin_dir, self.config)
+        self.db.add_statement_listener(self.metrics.record_sql)
+        self.sql_profiler = SQLProfiler(self.db, slow_ms=self.config.get("sql_slow_ms", 50))
+        if self.config.get("sql_profiler", False):
+            self.sql_profiler.enable()
+        self.profiler = CommandProfiler(os.path.join(self.diagnostics_dir, "profiles"))
+        # 图片生成器在第一次使用时创建，预热在后台任务中进行
+        self._img_gen: Optional[PetImageGenerator] = None
+        self._renderer_warm_up: Optional[asyncio.Future] = None
+        self.render_scheduler = RenderScheduler(
+            max_concurrency=self.config.get("render_max_concurrency", 2),
+            max_queue=self.config.get("render_max_queue", 8),
+            max_wait=self.config.get("render_max_wait", 3.0)
+        )
+        self.single_flight = SingleFlight(window=self.config.get("dedup_window", 1.0))
+        self.locks = ShardedLockManager(shards=self.config.get("lock_shards", 64))
+        self.cooldowns = CooldownService(
+            limits=CooldownService.parse_limits(self.config.get("command_limits")),
+            group_limits=CooldownService.parse_limits(self.config.get("group_command_limits")),
+            persist=self.db.save_cooldown
+        )
+        for user_id, command, expires_at in self.db.load_cooldowns():
+            self.cooldowns.restore(command, user_id, expires_at)
+        self.explore_events = ExploreEventRegistry(
+            weights=ExploreEventRegistry.parse_weights(self.config.get("explore_event_weights", ""))
+        )
+        self.idle_explorer = IdleExploreScheduler(self, interval=self.config.get("idle_explore_interval", 600))
         self.pets: Dict[str, Pet] = {}
+        self.leaderboard = PowerLeaderboard(self, capacity=self.config.get("leaderboard_size", 50))
+        
+        # 各组件的统计汇总到性能报告和导出文件中
+        self.metrics.collectors.update({
+            "render_queue": self.render_scheduler.stats,
+            "image_cache": lambda: self._img_gen.stats() if self._img_gen else {},
+            "singleflight": self.single_flight.stats,
+            "locks": self.locks.stats,
+            "cooldowns": self.cooldowns.stats,
+            "idle_explore": self.idle_explorer.stats,
+            "coherence": lambda: self.coherence.stats(),
+            "leaderboard": self.leaderboard.stats,
+        })
+        self.metrics_exporter = MetricsExporter(
+            self.metrics,
+            os.path.join(self.diagnostics_dir, "metrics.prom"),
+            interval=self.config.get("metrics_export_interval", 60)
+        )
+        
+        # 多进程模式需要在加载宠物之前开启，加载时记录每只宠物的版本号
+        self.coherence = PetCacheCoherence(self, enabled=self.config.get("multi_process", False))
         
         # 初始化已有的宠物
         self._load_existing_pets()
+        
+        self._start_background_tasks()
+    
+    def _start_background_tasks(self):
+        """启动定时任务；插件初始化时可能还没有事件循环，收到指令时会再次调用补上"""
+        # 有用户在挂机时才需要挂机探索的定时任务
+        if self.idle_explorer.enrolled:
+            self.idle_explorer.start()
+        self.metrics_exporter.start()
+        self._warm_up_renderer()
+    
+    @property
+    def img_gen(self) -> PetImageGenerator:
+        if self._img_gen is None:
+            self._img_gen = PetImageGenerator(self.plugin_dir)
+        return self._img_gen
+    
+    def _warm_up_renderer(self):
+        """在线程中预热图片生成器，第一次渲染不必再导入PIL和解码背景"""
+        if self._renderer_warm_up is not None:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._renderer_warm_up = loop.run_in_executor(None, self.img_gen.warm_up)
+        self._renderer_warm_up.add_done_callback(self._on_renderer_warmed_up)
+    
+    @staticmethod
+    def _on_renderer_warmed_up(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            # 预热失败不影响使用，第一次渲染时会再次尝试
+            logger.error(f"图片生成器预热失败: {str(future.exception())}")
     
     async def terminate(self):
         '''插件终止时调用'''
-        pass
+        self.idle_explorer.stop()
+        self.metrics_exporter.stop()
+        self.metrics.close()
+        self.db.close()
+    
+    async def _render_pet_card(self, text: str, pet_type: str = None) -> Union[str, None]:
+        """经渲染调度器生成信息卡，过载时返回None，由调用方降级为文字输出"""
+        start = time.perf_counter()
+        image_path = await self.render_scheduler.run(self.img_gen.create_pet_image, text, pet_type)
+        if image_path:
+            # 渲染耗时包含排队等待的时间，即用户实际等待的时间
+            self.metrics.record_render(time.perf_counter() - start)
+        return image_path
+    
+    async def _refresh_pet_status(self, user_id: str) -> str:
+        """更新宠物状态并保存，返回状态文字"""
+        pet = self.pets[user_id]
+        pet.update_status()
+        self.db.update_pet_data(user_id, **pet.to_dict())
+        return str(pet)
+    
+    async def _build_status_card(self, text: str, pet_type: str):
+        """生成状态卡，返回(状态文字, 图片路径)"""
+        image_path = await self._render_pet_card(text, pet_type)
+        return text, image_path
+    
+    async def _send_pet_card(self, event: AstrMessageEvent, text: str, pet_type: str = None):
+        """渲染信息卡并回复，渲染失败或被降级时回复文字；在释放用户锁之后执行"""
+        try:
+            image_path = await self._render_pet_card(text, pet_type)
+        except Exception as e:
+            logger.error(f"生成图片失败: {str(e)}")
+            image_path = None
+        if not image_path:
+            yield event.plain_result(text)
+            return
+        yield event.image_result(image_path)
+        # 延迟删除临时文件，避免文件被占用
+        await asyncio.sleep(1)
+        self._remove_file(image_path)
+    
+    async def _send_status_card(self, event: AstrMessageEvent, user_id: str, text: str, pet_type: str):
+        """短时间内的重复请求共享同一次渲染，图片在去重窗口结束后再清理"""
+        result, image_path = await self.single_flight.do(
+            (user_id, "我的宠物"), self._build_status_card, text, pet_type,
+            on_evict=self._discard_shared_card
+        )
+        if image_path:
+            yield event.image_result(image_path)
+        else:
+            yield event.plain_result(result)
+    
+    def _discard_shared_card(self, shared):
+        """共享的状态卡离开去重窗口后，延迟删除图片文件，留出发送时间"""
+        _, image_path = shared
+        if image_path:
+            asyncio.get_running_loop().call_later(self.CARD_CLEANUP_DELAY, self._remove_file, image_path)
+    
+    @staticmethod
+    def _remove_file(path: str):
+        if os.path.exists(path):
+            os.remove(path)
     
     def _load_existing_pets(self):
-        """加载已有的宠物数据"""
-        # 获取所有用户ID
-        user_ids = self.db.get_all_user_ids()
-        for user_id in user_ids:
-            pet_data = self.db.get_pet_data(user_id)
-            if pet_data:
-                self.pets[user_id] = Pet.from_dict(pet_data)
+        """加载已有的宠物数据，一次查询读出所有宠物"""
+        duel_cooldown = self.cooldowns.cooldown_for("对决")
+        for pet_data in self.db.iter_pet_data():
+            user_id = pet_data['user_id']
+            self.pets[user_id] = Pet.from_dict(pet_data)
+            # 兼容旧数据：由宠物上保存的对战时间恢复对决冷却
+            self.cooldowns.restore(
+                "对决", user_id,
+                self.pets[user_id].last_battle_time.timestamp() + duel_cooldown
+            )
     
     @filter.command("领取宠物")
+    @pet_command("领取宠物")
     async def adopt_pet(self, event: AstrMessageEvent, pet_type: str = None, pet_name: str = None):
         """领取宠物"""
         try:
@@ -223,35 +444,20 @@ class QQPetPlugin(Star):
                 yield event.plain_result("您已经领取了宠物！")
                 return
             
-            # 预设宠物名称和类型
-            pet_options = [
-                {"name": "烈焰", "type": "火"},
-                {"name": "碧波兽", "type": "水"},
-                {"name": "藤甲虫", "type": "草"},
-                {"name": "碎裂岩", "type": "土"},
-                {"name": "金刚", "type": "金"}
-            ]
-            
             # 获取发送者名称
             sender_name = event.get_sender_name() or "未知"
             
             if pet_type and pet_name:
-                # 检查属性是否有效
-                valid_types = ["火", "水", "草", "土", "金"]
-                if pet_type not in valid_types:
-                    yield event.plain_result(f"无效的属性！请选择：{', '.join(valid_types)}")
+                # 检查属性是否有效（可领取的基础形态覆盖的属性）
+                if pet_type not in STARTER_BY_TYPE:
+                    yield event.plain_result(f"无效的属性！请选择：{', '.join(STARTER_BY_TYPE)}")
                     return
                 
-                # 检查是否是预设名称
-                matched_pet = next((p for p in pet_options if p["name"] == pet_name and p["type"] == pet_type), None)
-                if matched_pet:
-                    pet = Pet(matched_pet["name"], matched_pet["type"], sender_name)
-                else:
-                    # 自定义名称
-                    pet = Pet(pet_name, pet_type, sender_name)
+                # 预设名称和自定义名称都直接使用，种族由名称和属性共同确定
+                pet = Pet(pet_name, pet_type, sender_name)
             else:
                 # 如果没有提供属性和名称，提示正确的指令格式
-                yield event.plain_result("正确的领取指令：/领取宠物 属性 名字\n属性可选：火、水、草、土、金")
+                yield event.plain_result(f"正确的领取指令：/领取宠物 属性 名字\n属性可选：{'、'.join(STARTER_BY_TYPE)}")
                 return
             
             self.pets[user_id] = pet
@@ -263,27 +469,18 @@ class QQPetPlugin(Star):
             # 生成结果信息
             result = f"成功领取宠物！！！\n名称：{pet.name}\n属性：{pet.type}\n等级：{pet.level}\n经验值：{pet.exp}/{pet.level * 100}\n数值：\nHP={pet.hp},攻击={pet.attack}\n防御={pet.defense},速度={pet.speed}\n技能：无"
             
-            # 尝试生成图片
-            try:
-                image_path = await self.img_gen.create_pet_image(result, pet.type)
-                if image_path:
-                    yield event.image_result(image_path)
-                    # 延迟删除临时文件，避免文件被占用
-                    import asyncio
-                    await asyncio.sleep(1)
-                    if os.path.exists(image_path):
-                        os.remove(image_path)
-                else:
-                    yield event.plain_result(result)
-            except Exception as e:
-                logger.error(f"生成图片失败: {str(e)}")
-                yield event.plain_result(result)
+            # 尝试生成图片，渲染在释放锁之后进行
+            yield after_unlock(self._send_pet_card, event, result, pet.type)
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"领取宠物失败: {str(e)}")
             yield event.plain_result(f"领取宠物失败了~错误原因: {str(e)}")
 
     @filter.command("宠物进化")
+    @pet_command("宠物进化")
     async def evolve_pet(self, event: AstrMessageEvent):
         """宠物进化"""
         try:
@@ -298,7 +495,13 @@ class QQPetPlugin(Star):
             
             # 检查是否可以进化
             if not pet.can_evolve():
-                yield event.plain_result(f"{pet.name}还不能进化！需要达到{Pet.EVOLUTION_DATA.get(pet.name, {}).get('required_level', 10)}级")
+                species = SPECIES.get(pet.name)
+                if species is None:
+                    yield event.plain_result(f"{pet.name}无法进化！")
+                elif species.evolve_to is None:
+                    yield event.plain_result(f"{pet.name}已是最终形态，无法继续进化！")
+                else:
+                    yield event.plain_result(f"{pet.name}还不能进化！需要达到{species.evolve_level}级")
                 return
             
             # 执行进化
@@ -318,20 +521,18 @@ class QQPetPlugin(Star):
                 skills=pet.skills
             )
             
-            # 生成进化结果图片
-            image_path = await self.img_gen.create_pet_image(result, pet.type)
-            if image_path:
-                yield event.image_result(image_path)
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-            else:
-                yield event.plain_result(result)
+            # 生成进化结果图片，渲染在释放锁之后进行
+            yield after_unlock(self._send_pet_card, event, result, pet.type)
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"宠物进化失败: {str(e)}")
             yield event.plain_result("宠物进化失败了~请联系管理员检查日志")
 
     @filter.command("我的宠物")
+    @pet_command("我的宠物")
     async def my_pet(self, event: AstrMessageEvent):
         """生成宠物状态卡"""
         try:
@@ -342,29 +543,19 @@ class QQPetPlugin(Star):
                 yield event.plain_result("您还没有领养宠物！请先使用'领养宠物'命令")
                 return
             
-            pet = self.pets[user_id]
-            
-            # 更新宠物状态
-            pet.update_status()
-            
-            # 保存到数据库
-            self.db.update_pet_data(user_id, **pet.to_dict())
-            
-            # 生成状态卡图片
-            result = str(pet)
-            image_path = await self.img_gen.create_pet_image(result, pet.type)
-            if image_path:
-                yield event.image_result(image_path)
-                if os.path.exists(image_path):
-                    os.remove(image_path)
-            else:
-                yield event.plain_result(result)
+            # 状态更新在锁内进行，短时间内的重复请求共享同一次更新；渲染在释放锁之后进行
+            result = await self.single_flight.do((user_id, "宠物状态"), self._refresh_pet_status, user_id)
+            yield after_unlock(self._send_status_card, event, user_id, result, self.pets[user_id].type)
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"生成状态卡失败: {str(e)}")
             yield event.plain_result("生成状态卡失败了~请联系管理员检查日志")
 
     @filter.command("对决")
+    @pet_command("对决", peer_arg="opponent_id")
     async def duel_pet(self, event: AstrMessageEvent, opponent_id: str):
         """与其他玩家进行PVP对战"""
         try:
@@ -409,11 +600,6 @@ class QQPetPlugin(Star):
                 yield event.plain_result(f"对手的{opponent_pet.name}已经失去战斗能力，请等待对手治疗后再挑战！")
                 return
             
-            # 检查冷却时间
-            if not pet.is_battle_available():
-                yield event.plain_result(f"{pet.name}还在冷却中，请30分钟后再进行对决！")
-                return
-            
             # 对战过程
             battle_log = f"{pet.name} vs {opponent_pet.name}\n" + "="*30 + "\n"
             
@@ -616,20 +802,16 @@ class QQPetPlugin(Star):
                 # 添加分隔线
                 battle_log += "-"*20 + "\n"
             
-            # 更新对战时间
+            # 更新对战时间，开始对决冷却（冷却检查在指令入口统一进行）
             pet.update_battle_time()
+            self.cooldowns.start("对决", user_id, event.get_group_id())
             
             # 战斗结果
             if pet.is_alive():
                 # 玩家获胜
                 exp_gain = opponent_pet.level * 15
-                pet.exp += exp_gain
-                
-                # 检查是否升级
-                level_up = False
-                if pet.exp >= pet.level * 100:
-                    pet.level_up()
-                    level_up = True
+                # 增加经验，可能一次升多级
+                level_up = bool(pet.gain_exp(exp_gain))
                 
                 battle_log += f"\n战斗胜利！{pet.name}获得了{exp_gain}点经验值！"
                 if level_up:
@@ -659,11 +841,15 @@ class QQPetPlugin(Star):
             # 直接返回纯文字结果，不生成图片
             yield event.plain_result(battle_log)
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"宠物对决失败: {str(e)}")
             yield event.plain_result("宠物对决失败了~请联系管理员检查日志")
 
     @filter.command("宠物菜单")
+    @pet_command("宠物菜单", serialize=False)
     async def pet_menu(self, event: AstrMessageEvent):
         """显示宠物帮助菜单"""
         try:
@@ -675,6 +861,7 @@ class QQPetPlugin(Star):
 /对决 @某人 - 与其他玩家进行PVP对战（每30分钟冷却）
 /治疗宠物 - 治疗受伤的宠物
 /宠物大全 - 显示游戏内所有宠物
+/宠物排行 [全服] [数量] - 查看本群或全服的战力排行
 /宠物菜单 - 显示此帮助菜单
 /查看金币 - 查看当前拥有的金币数量
 /商店 - 查看商店可购买的物品
@@ -695,6 +882,7 @@ class QQPetPlugin(Star):
             yield event.plain_result("显示宠物菜单失败了~请联系管理员检查日志")
     
     @filter.command("查看宠物")
+    @pet_command("查看宠物")
     async def view_pet(self, event: AstrMessageEvent):
         """查看宠物信息"""
         try:
@@ -705,37 +893,26 @@ class QQPetPlugin(Star):
                 yield event.plain_result("您还没有创建宠物！请先使用'领取宠物'命令")
                 return
             
-            pet = self.pets[user_id]
-            
-            # 更新宠物状态
-            pet.update_status()
-            
-            # 保存到数据库
-            self.db.update_pet_data(user_id, **pet.to_dict())
+            # 短时间内的重复请求共享同一次状态更新
+            result = await self.single_flight.do((user_id, "查看宠物"), self._refresh_pet_status, user_id)
             
             # 直接返回纯文字结果，不生成图片
-            result = str(pet)
             yield event.plain_result(result)
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"查看宠物失败: {str(e)}")
             yield event.plain_result("查看宠物失败了~请联系管理员检查日志")
     
     @filter.command("宠物大全")
+    @pet_command("宠物大全", serialize=False)
     async def pet_catalog(self, event: AstrMessageEvent):
         """显示所有预设宠物"""
         try:
-            # 预设宠物名称和类型
-            pet_options = [
-                {"name": "烈焰", "type": "火"},
-                {"name": "碧波兽", "type": "水"},
-                {"name": "藤甲虫", "type": "草"},
-                {"name": "碎裂岩", "type": "土"},
-                {"name": "金刚", "type": "金"}
-            ]
-            
             # 生成宠物列表
-            pet_list = "\n".join([f"【{pet['name']}】 {pet['type']}" for pet in pet_options])
+            pet_list = "\n".join([f"【{species.name}】 {species.type}" for species in STARTERS])
             result = f"游戏内所有宠物:\n{pet_list}"
             
             # 直接返回纯文字结果，不生成图片
@@ -745,8 +922,46 @@ class QQPetPlugin(Star):
             logger.error(f"显示宠物大全失败: {str(e)}")
             yield event.plain_result("显示宠物大全失败了~请联系管理员检查日志")
 
+    @filter.command("宠物排行")
+    @pet_command("宠物排行", serialize=False)
+    async def power_ranking(self, event: AstrMessageEvent, scope: str = None, count: int = 10):
+        """战力排行榜，群聊中默认显示本群，加上“全服”显示所有玩家"""
+        try:
+            user_id = event.get_sender_id()
+
+            # 只写数量时（/宠物排行 20）第一个参数就是数量
+            if scope is not None and str(scope).isdigit():
+                scope, count = None, int(scope)
+            if scope not in (None, "全服", "本群"):
+                yield event.plain_result("请使用格式: /宠物排行 [全服] [数量]")
+                return
+            count = max(1, min(int(count), self.leaderboard.capacity))
+
+            group_id = None if scope == "全服" else event.get_group_id()
+            ranking = self.leaderboard.top(count, group_id)
+            title = "本群战力排行" if group_id else "全服战力排行"
+            if not ranking:
+                yield event.plain_result(f"{title}：还没有上榜的宠物~")
+                return
+
+            lines = [f"{title} 前{len(ranking)}名:"]
+            for rank, (ranked_id, power) in enumerate(ranking, 1):
+                pet = self.pets.get(ranked_id)
+                name = f"{pet.name}(Lv.{pet.level})" if pet else ranked_id
+                mark = " ←你" if ranked_id == user_id else ""
+                lines.append(f"{rank}. {name} 战力{power}{mark}")
+            if user_id in self.pets and all(ranked_id != user_id for ranked_id, _ in ranking):
+                lines.append(f"你的宠物战力: {self.pets[user_id].power}，未进入前{len(ranking)}名")
+
+            yield event.plain_result("\n".join(lines))
+
+        except Exception as e:
+            logger.error(f"显示宠物排行失败: {str(e)}")
+            yield event.plain_result("显示宠物排行失败了~请联系管理员检查日志")
+
 
     @filter.command("购买")
+    @pet_command("购买")
     async def buy_item(self, event: AstrMessageEvent, item_name: str = None, quantity: int = 1):
         """购买物品"""
         try:
@@ -790,11 +1005,15 @@ class QQPetPlugin(Star):
             
             yield event.plain_result(f"成功购买{quantity}个{item_name}，花费{total_price}金币！您还剩余{pet.coins}金币。")
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"购买物品失败: {str(e)}")
             yield event.plain_result("购买物品失败了~请联系管理员检查日志")
     
     @filter.command("探索")
+    @pet_command("探索")
     async def explore(self, event: AstrMessageEvent):
         """探索功能"""
         try:
@@ -820,14 +1039,8 @@ class QQPetPlugin(Star):
                 # 增加金币
                 pet.coins += gold
                 
-                # 增加宠物经验
-                pet.exp += exp
-                
-                # 检查是否升级
-                level_up = False
-                if pet.exp >= pet.level * 100:
-                    pet.level_up()
-                    level_up = True
+                # 增加宠物经验，可能一次升多级
+                level_up = bool(pet.gain_exp(exp))
                 
                 # 更新数据库
                 self.db.update_pet_data(
@@ -864,13 +1077,8 @@ class QQPetPlugin(Star):
                 elif "老太太" in event_result:
                     # 增加宠物经验
                     exp = 500
-                    pet.exp += exp
-                    
-                    # 检查是否升级
-                    level_up = False
-                    if pet.exp >= pet.level * 100:
-                        pet.level_up()
-                        level_up = True
+                    # 增加经验，可能一次升多级
+                    level_up = bool(pet.gain_exp(exp))
                     
                     # 更新数据库
                     self.db.update_pet_data(
@@ -1018,32 +1226,18 @@ class QQPetPlugin(Star):
                 
                 battle_log += "==============================\n"
                 
+                # 开战前读取一次背包中的治疗瓶，战斗中只在内存里消耗
+                heal_kit = HealKit(self.db.get_heal_items(user_id)) if pet.auto_heal_threshold > 0 else None
+                
                 # 战斗循环
                 while pet.is_alive() and opponent.is_alive():
                     # 检查是否需要自动使用治疗瓶
                     used_heal_bottle = False
-                    if pet.hp <= pet.auto_heal_threshold and pet.auto_heal_threshold > 0:
-                        # 检查背包中是否有治疗瓶
-                        inventory = self.db.get_user_inventory(user_id)
-                        heal_bottle = None
-                        for item in inventory:
-                            if item['name'] in ['小治疗瓶', '中治疗瓶', '大治疗瓶'] and item['quantity'] > 0:
-                                heal_bottle = item['name']
-                                break
-                        
-                        if heal_bottle:
-                            # 使用治疗瓶
-                            heal_result = self.db.use_item_on_pet(user_id, heal_bottle, pet)
+                    if heal_kit and pet.hp <= pet.auto_heal_threshold:
+                        heal_result = heal_kit.use(pet)
+                        if heal_result:
                             battle_log += f"{heal_result}\n"
                             used_heal_bottle = True
-                            
-                            # 更新数据库
-                            self.db.update_pet_data(
-                                user_id,
-                                hp=pet.hp,
-                                hunger=pet.hunger,
-                                mood=pet.mood
-                            )
                         
                     if player_first:
                         # 如果使用了治疗瓶，玩家本回合无法攻击
@@ -1319,17 +1513,16 @@ class QQPetPlugin(Star):
                     battle_log += f"{opponent.name}剩余生命值={opponent.hp}\n"
                     battle_log += "--------------------\n"
                 
+                # 战斗结束后一次性扣除消耗的治疗瓶
+                if heal_kit and heal_kit.used:
+                    self.db.consume_items(user_id, heal_kit.used)
+                
                 # 战斗结果
                 if pet.is_alive():
                     # 玩家获胜
                     exp_gain = opponent.level * 20
-                    pet.exp += exp_gain
-                    
-                    # 检查是否升级
-                    level_up = False
-                    if pet.exp >= pet.level * 100:
-                        pet.level_up()
-                        level_up = True
+                    # 增加经验，可能一次升多级
+                    level_up = bool(pet.gain_exp(exp_gain))
                     
                     # 获得金币奖励
                     coins_gain = opponent.level * 10
@@ -1372,11 +1565,15 @@ class QQPetPlugin(Star):
             
             yield event.plain_result(result)
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"探索失败: {str(e)}")
             yield event.plain_result("探索失败了~请联系管理员检查日志")
     
     @filter.command("宠物背包")
+    @pet_command("宠物背包")
     async def pet_inventory(self, event: AstrMessageEvent):
         """查看宠物背包"""
         try:
@@ -1417,6 +1614,7 @@ class QQPetPlugin(Star):
             yield event.plain_result("查看宠物背包失败了~请联系管理员检查日志")
     
     @filter.command("投喂")
+    @pet_command("投喂")
     async def feed_pet(self, event: AstrMessageEvent, item_name: str = None):
         """投喂宠物"""
         try:
@@ -1459,11 +1657,15 @@ class QQPetPlugin(Star):
             
             yield event.plain_result(result)
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"投喂宠物失败: {str(e)}")
             yield event.plain_result("投喂宠物失败了~请联系管理员检查日志")
     
     @filter.command("查看技能")
+    @pet_command("查看技能")
     async def check_skills(self, event: AstrMessageEvent):
         """查看宠物技能"""
         try:
@@ -1488,6 +1690,7 @@ class QQPetPlugin(Star):
             yield event.plain_result("查看技能失败了~请联系管理员检查日志")
     
     @filter.command("使用技能")
+    @pet_command("使用技能")
     async def use_skill(self, event: AstrMessageEvent, skill_name: str = None):
         """使用技能"""
         try:
@@ -1538,6 +1741,7 @@ class QQPetPlugin(Star):
             yield event.plain_result("使用技能失败了~请联系管理员检查日志")
     
     @filter.command("商店")
+    @pet_command("商店", serialize=False)
     async def shop(self, event: AstrMessageEvent):
         """查看商店物品"""
         try:
@@ -1564,6 +1768,7 @@ class QQPetPlugin(Star):
             yield event.plain_result("查看商店失败了~请联系管理员检查日志")
     
     @filter.command("购买")
+    @pet_command("购买")
     async def buy_item(self, event: AstrMessageEvent, item_id: str = None):
         """购买商店物品"""
         try:
@@ -1609,11 +1814,15 @@ class QQPetPlugin(Star):
             
             yield event.plain_result(f"成功购买{item['name']}！花费了{item['price']}金币，剩余金币：{pet.coins}")
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"购买物品失败: {str(e)}")
             yield event.plain_result("购买物品失败了~请联系管理员检查日志")
     
     @filter.command("战斗设置")
+    @pet_command("战斗设置")
     async def battle_settings(self, event: AstrMessageEvent):
         """查看战斗设置"""
         try:
@@ -1635,6 +1844,7 @@ class QQPetPlugin(Star):
             yield event.plain_result("查看战斗设置失败了~请联系管理员检查日志")
     
     @filter.command("修改最低血量")
+    @pet_command("修改最低血量")
     async def modify_auto_heal_threshold(self, event: AstrMessageEvent, threshold: int = None):
         """修改自动使用治疗瓶的最低血量阈值"""
         try:
@@ -1661,11 +1871,15 @@ class QQPetPlugin(Star):
             # 返回结果
             yield event.plain_result(f"已将自动使用治疗瓶的最低血量阈值修改为{threshold}")
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"修改最低血量失败: {str(e)}")
             yield event.plain_result("修改最低血量失败了~请联系管理员检查日志")
     
     @filter.command("宠物背包")
+    @pet_command("宠物背包")
     async def pet_inventory(self, event: AstrMessageEvent):
         """查看宠物背包"""
         try:
@@ -1702,6 +1916,7 @@ class QQPetPlugin(Star):
             yield event.plain_result("查看宠物背包失败了~请联系管理员检查日志")
     
     @filter.command("宠物详细")
+    @pet_command("宠物详细")
     async def pet_details(self, event: AstrMessageEvent):
         """显示宠物的详细信息"""
         try:
@@ -1742,13 +1957,159 @@ class QQPetPlugin(Star):
             
             yield event.plain_result(details)
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"显示宠物详细信息失败: {str(e)}")
             yield event.plain_result("显示宠物详细信息失败了~请联系管理员检查日志")
     
+    @filter.command("宠物性能")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @pet_command("宠物性能", serialize=False)
+    async def performance_report(self, event: AstrMessageEvent):
+        """管理员查看各指令的延迟分位数、错误数、SQL和渲染统计"""
+        try:
+            yield event.plain_result(self.metrics.report())
+        except Exception as e:
+            logger.error(f"查看性能统计失败: {str(e)}")
+            yield event.plain_result("查看性能统计失败了~请联系管理员检查日志")
+    
+    @filter.command("宠物SQL")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @pet_command("宠物SQL", serialize=False)
+    async def sql_report(self, event: AstrMessageEvent, action: str = None):
+        """管理员查看SQL语句统计：/宠物SQL [开启|关闭|重置|导出]"""
+        try:
+            profiler = self.sql_profiler
+            if action == "开启":
+                profiler.enable()
+                yield event.plain_result(f"SQL统计已开启，超过{profiler.slow_ms:.0f}ms的语句会连同执行计划写入日志")
+            elif action == "关闭":
+                profiler.disable()
+                yield event.plain_result("SQL统计已关闭")
+            elif action == "重置":
+                profiler.reset()
+                yield event.plain_result("SQL统计已清空")
+            elif action == "导出":
+                path = profiler.dump(os.path.join(self.diagnostics_dir, "sql_profile.txt"))
+                yield event.plain_result(f"SQL统计报告已导出到: {path}")
+            elif not profiler.enabled and not profiler.statements:
+                yield event.plain_result("SQL统计未开启，请使用: /宠物SQL 开启")
+            else:
+                yield event.plain_result(profiler.report())
+        except Exception as e:
+            logger.error(f"查看SQL统计失败: {str(e)}")
+            yield event.plain_result("查看SQL统计失败了~请联系管理员检查日志")
+    
+    @filter.command("宠物剖析")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @pet_command("宠物剖析", serialize=False)
+    async def profile_command(self, event: AstrMessageEvent, target: str = None, count: str = "1"):
+        """管理员剖析指令接下来的N次执行：/宠物剖析 [指令] [次数|关闭]"""
+        try:
+            if not target:
+                yield event.plain_result(self.profiler.status())
+                return
+
+            # 指令名和处理器方法名都可以
+            commands = {name: getattr(method, "command") for name, method in vars(type(self)).items()
+                        if hasattr(method, "command")}
+            command = commands.get(target, target)
+            if commands and command not in commands.values():
+                yield event.plain_result(f"没有找到指令: {target}")
+                return
+
+            if count == "关闭":
+                if self.profiler.disarm(command):
+                    yield event.plain_result(f"已取消{command}的剖析")
+                else:
+                    yield event.plain_result(f"{command}没有在等待剖析")
+                return
+
+            try:
+                times = int(count)
+            except ValueError:
+                yield event.plain_result("次数必须是整数！")
+                return
+            if not 1 <= times <= 100:
+                yield event.plain_result("次数必须在1到100之间！")
+                return
+
+            self.profiler.arm(command, times)
+            yield event.plain_result(f"将剖析{command}接下来的{times}次执行，结果保存在: {self.profiler.directory}")
+        except Exception as e:
+            logger.error(f"设置指令剖析失败: {str(e)}")
+            yield event.plain_result("设置指令剖析失败了~请联系管理员检查日志")
+    
+    @filter.command("发放经验")
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @pet_command("发放经验", serialize=False)
+    async def grant_exp_all(self, event: AstrMessageEvent, amount: int = 0):
+        """管理员给所有宠物发放经验，所有宠物的数据一次写入"""
+        try:
+            if amount <= 0:
+                yield event.plain_result("请使用格式: /发放经验 数量")
+                return
+            
+            # 发放和写入之间没有await，不会与其他指令交错
+            leveled = grant_exp(self.pets.values(), amount)
+            self.db.update_pets([dict(pet.to_dict(), user_id=user_id) for user_id, pet in self.pets.items()])
+            self.leaderboard.reset()
+            
+            yield event.plain_result(f"已为{len(self.pets)}只宠物发放{amount}点经验，其中{len(leveled)}只升级了！")
+            
+        except Exception as e:
+            logger.error(f"发放经验失败: {str(e)}")
+            yield event.plain_result("发放经验失败了~请联系管理员检查日志")
+    
+    @filter.command("挂机探索")
+    @pet_command("挂机探索")
+    async def idle_explore(self, event: AstrMessageEvent, action: str = None):
+        """开启或关闭挂机探索，开启后定时自动探索，结果在下次使用指令时汇报"""
+        try:
+            user_id = event.get_sender_id()
+            
+            # 检查是否有宠物
+            if user_id not in self.pets:
+                yield event.plain_result("您还没有创建宠物！请先使用'领取宠物'命令")
+                return
+            
+            pet = self.pets[user_id]
+            minutes = max(1, int(self.idle_explorer.interval // 60))
+            
+            if action in ("关闭", "停止", "退出"):
+                if self.idle_explorer.withdraw(user_id):
+                    yield event.plain_result(f"{pet.name}结束了挂机探索。")
+                else:
+                    yield event.plain_result(f"{pet.name}没有在挂机探索。")
+                return
+            
+            if self.idle_explorer.enroll(user_id):
+                yield event.plain_result(f"{pet.name}开始挂机探索！每{minutes}分钟自动探索一次，结果会在您下次使用指令时汇报。\n关闭请使用: /挂机探索 关闭")
+            else:
+                yield event.plain_result(f"{pet.name}已经在挂机探索中了！关闭请使用: /挂机探索 关闭")
+            
+        except Exception as e:
+            logger.error(f"挂机探索设置失败: {str(e)}")
+            yield event.plain_result("挂机探索设置失败了~请联系管理员检查日志")
+    
+    @filter.command("探索期望")
+    @pet_command("探索期望", serialize=False)
+    async def explore_expectation(self, event: AstrMessageEvent):
+        """查看探索事件的概率和按宠物等级计算的期望收益"""
+        try:
+            pet = self.pets.get(event.get_sender_id())
+            level = pet.level if pet else 1
+            yield event.plain_result(self.explore_events.report(level))
+        except Exception as e:
+            logger.error(f"查看探索期望失败: {str(e)}")
+            yield event.plain_result("查看探索期望失败了~请联系管理员检查日志")
+    
     @filter.command("探索")
-    async def explore(self, event: AstrMessageEvent):
-        """探索功能，触发随机事件"""
+    @pet_command("探索")
+    async def explore(self, event: AstrMessageEvent, count: int = 1):
+        """探索功能，触发随机事件；/探索 N 连续探索N次并汇总结果"""
         try:
             user_id = event.get_sender_id()
             
@@ -1762,178 +2123,121 @@ class QQPetPlugin(Star):
             # 更新宠物状态
             pet.update_status()
             
-            # 检查冷却时间（探索有5分钟冷却）
-            now = datetime.now()
-            if hasattr(pet, 'last_explore_time'):
-                time_since_last_explore = (now - pet.last_explore_time).total_seconds() / 60  # 分钟
-                if time_since_last_explore < 5:
-                    remaining_time = int(5 - time_since_last_explore)
-                    yield event.plain_result(f"探索冷却中，请等待{remaining_time}分钟后再试！")
-                    return
-            
-            # 随机事件触发
-            event_type = random.random()
+            # 连续探索次数受配置上限约束
+            try:
+                count = int(count)
+            except (TypeError, ValueError):
+                yield event.plain_result("请使用格式: /探索 [次数]")
+                return
+            batch_max = self.config.get("explore_batch_max", 10)
+            count = max(1, min(count, batch_max))
             
-            # 好事件（20%总概率）
-            if event_type < 0.05:  # 5%概率 - 世外高人
-                result = await self._good_event_wise_man(pet)
-            elif event_type < 0.20:  # 15%概率 - 其他好事件
-                result = await self._good_event_random(pet)
-            # 坏事件（80%概率）
+            if count == 1:
+                result = (await self._explore_once(pet, user_id)).text
+                self.db.update_pet_data(user_id, **pet.to_dict())
             else:
-                result = await self._bad_event_battle(pet, user_id)
+                result = await self._explore_batch(pet, user_id, count)
             
-            # 更新探索时间
-            pet.last_explore_time = now
-            
-            # 更新数据库
-            self.db.update_pet_data(
-                user_id,
-                coins=pet.coins,
-                exp=pet.exp,
-                hp=pet.hp,
-                hunger=pet.hunger,
-                mood=pet.mood
-            )
+            # 开始探索冷却（冷却检查在指令入口统一进行）
+            self.cooldowns.start("探索", user_id, event.get_group_id())
             
             yield event.plain_result(result)
             
+        except StaleDataError:
+            # 交给pet_command回滚事务并提示重试
+            raise
         except Exception as e:
             logger.error(f"探索失败: {str(e)}")
             yield event.plain_result("探索失败了~请联系管理员检查日志")
     
-    async def _good_event_wise_man(self, pet):
-        """世外高人事件"""
-        coins_reward = 2000
-        exp_reward = random.randint(500, 1000)
-        
-        pet.coins += coins_reward
-        pet.exp += exp_reward
-        
-        # 检查升级
-        level_up_result = ""
-        if pet.exp >= pet.level * 100:
-            old_level = pet.level
-            level_up_result = pet.level_up()
-            if "进化" in level_up_result:
-                level_up_result = f"\n{level_up_result}"
-            else:
-                level_up_result = f"\n{pet.name}从{old_level}级升到了{pet.level}级！"
-        
-        return f"🎭 探索事件：世外高人\n云游时碰到一位世外高人，他见你骨骼精奇，给了你一个储物袋！\n获得：金币【{coins_reward}】，经验【{exp_reward}】{level_up_result}"
-    
-    async def _good_event_random(self, pet):
-        """随机好事件"""
-        events = [
-            self._good_event_grandma,
-            self._good_event_medical_kit,
-            self._good_event_merchant,
-            self._good_event_little_girl
-        ]
-        
-        event_func = random.choice(events)
-        return await event_func(pet)
-    
-    async def _good_event_grandma(self, pet):
-        """老奶奶事件"""
-        coins_reward = random.randint(100, 240)
-        pet.coins += coins_reward
-        return f"👵 探索事件：善良老奶奶\n一个老奶奶见你可怜，给了你一些金币！\n获得：金币【{coins_reward}】"
-    
-    async def _good_event_medical_kit(self, pet):
-        """医疗箱事件"""
-        small_potions = random.randint(20, 50)
-        medium_potions = random.randint(10, 15)
-        large_potions = random.randint(1, 8)
-        
-        user_id = None
-        for uid, p in self.pets.items():
-            if p == pet:
-                user_id = uid
-                break
-        
-        if user_id:
-            self.db.add_item_to_inventory(user_id, "小治疗瓶", small_potions)
-            self.db.add_item_to_inventory(user_id, "中治疗瓶", medium_potions)
-            self.db.add_item_to_inventory(user_id, "大治疗瓶", large_potions)
-        
-        return f"🎁 探索事件：医疗箱\n你在路边看到一个被丢弃的医疗箱！\n获得：小治疗瓶【{small_potions}瓶】，中治疗瓶【{medium_potions}瓶】，大治疗瓶【{large_potions}瓶】"
+    async def _explore_once(self, pet, user_id) -> ExploreOutcome:
+        """在内存中的宠物上执行一次探索，事件按事件表的权重抽取
+
+        不能真正挂起：_explore_batch在事务中await本函数，见其说明
+        """
+        return await self._apply_explore_event(pet, user_id, self.explore_events.pick())
     
-    async def _good_event_merchant(self, pet):
-        """商人事件"""
-        small_potions = random.randint(3, 8)
-        
-        user_id = None
-        for uid, p in self.pets.items():
-            if p == pet:
-                user_id = uid
-                break
+    async def _apply_explore_event(self, pet, user_id, explore_event) -> ExploreOutcome:
+        """结算一个探索事件：发放奖励、扣除血量，按遇敌概率触发战斗"""
+        values = explore_event.roll()
+        pet.coins += values["coins"]
+        if values["hp_loss"]:
+            pet.hp = max(1, pet.hp - values["hp_loss"])  # 至少保留1点血量
+        for item_name in explore_event.items:
+            self._grant_item(user_id, item_name, values[item_name])
         
-        if user_id:
-            self.db.add_item_to_inventory(user_id, "小治疗瓶", small_potions)
+        text = explore_event.message.format_map(values)
+        if values["exp"]:
+            text += self._level_up_message(pet.gain_exp(values["exp"]))
         
-        return f"🏪 探索事件：好心商人\n遇到一个好心的商人，他免费送给你一些治疗瓶！\n获得：小治疗瓶【{small_potions}瓶】"
+        if explore_event.battle and random.random() < explore_event.battle:
+            won, battle_text = await self._trigger_random_battle(pet, user_id)
+            return ExploreOutcome(explore_event, f"{text}\n{battle_text}", won)
+        return ExploreOutcome(explore_event, text)
     
-    async def _good_event_little_girl(self, pet):
-        """小女孩事件"""
-        food_cans = random.randint(10, 15)
-        
-        user_id = None
-        for uid, p in self.pets.items():
-            if p == pet:
-                user_id = uid
-                break
+    async def _explore_batch(self, pet, user_id, count):
+        """连续探索count次，所有写入在一个事务中提交，返回汇总信息
+
+        注意：事务状态（_tx_depth）属于整个数据库连接，不属于当前协程。事务期间如果让出事件循环，
+        其他协程的写入会被推迟到这个事务一起提交，这次连续探索出错时还会被一起回滚。
+        所以事务中await的_explore_once及其调用的探索事件、战斗都不能真正挂起（不能等待锁、sleep、
+        渲染、线程或网络），目前它们只是为了沿用原有的async接口。修改这些函数时需要保持这一点，
+        否则要把事务拆到同步代码中。
+        """
+        inventory_before = {item['name']: item['quantity'] for item in self.db.get_user_inventory(user_id)}
+        coins_before = pet.coins
+        level_before = pet.level
+        exp_before = pet.total_exp
         
-        if user_id:
-            self.db.add_item_to_inventory(user_id, "美味罐头", food_cans)
+        event_counts: Dict[str, int] = {}
+        wins = losses = done = 0
+        with self.db.transaction(user_id):
+            for _ in range(count):
+                outcome = await self._explore_once(pet, user_id)
+                done += 1
+                
+                name = outcome.event.name
+                event_counts[name] = event_counts.get(name, 0) + 1
+                if outcome.battle is True:
+                    wins += 1
+                elif outcome.battle is False:
+                    losses += 1
+                
+                if not pet.is_alive():
+                    break
+            
+            self.db.update_pet_data(user_id, **pet.to_dict())
+            inventory_after = {item['name']: item['quantity'] for item in self.db.get_user_inventory(user_id)}
         
-        return f"👧 探索事件：可爱小女孩\n一个小女孩撞到了你，她给你道歉后送你美味罐头！\n获得：美味罐头【{food_cans}个】"
-    
-    async def _bad_event_battle(self, pet, user_id):
-        """坏事件战斗"""
-        events = [
-            self._bad_event_trap,
-            self._bad_event_goblin,
-            self._bad_event_evil_trainer,
-            self._bad_event_magic_eye_rabbit,
-            self._bad_event_twin_flower_vine
-        ]
+        items_gained = []
+        for item_name, quantity in inventory_after.items():
+            gained = quantity - inventory_before.get(item_name, 0)
+            if gained > 0:
+                items_gained.append(f"{item_name}×{gained}")
         
-        event_func = random.choice(events)
-        return await event_func(pet, user_id)
+        result = f"🧭 连续探索{done}次\n"
+        result += "事件：" + "，".join(f"{name}×{n}" for name, n in event_counts.items()) + "\n"
+        result += f"战斗：胜利{wins}场，失败{losses}场\n"
+        result += f"获得：金币【{pet.coins - coins_before}】，经验【{pet.total_exp - exp_before}】\n"
+        result += f"物品：{'，'.join(items_gained) if items_gained else '无'}"
+        if pet.level != level_before:
+            result += f"\n等级：{level_before}级 → {pet.level}级"
+        if done < count:
+            result += f"\n{pet.name}失去了战斗能力，探索提前结束！"
+        return result
     
-    async def _bad_event_trap(self, pet, user_id):
-        """陷阱事件"""
-        hp_loss = random.randint(20, 50)
-        pet.hp = max(1, pet.hp - hp_loss)  # 至少保留1点血量
-        
-        # 80%概率触发战斗
-        if random.random() < 0.8:
-            return await self._trigger_random_battle(pet, user_id, f"💀 探索事件：陷阱\n你掉进了陷阱！！减少了【{hp_loss}】血量。")
+    def _grant_item(self, user_id: str, item_name: str, quantity: int):
+        """探索事件发放物品：挂机结算时交给结算批量写入，否则直接写入背包"""
+        sink = item_sink.get()
+        if sink is not None:
+            sink.append((user_id, item_name, quantity))
         else:
-            return f"💀 探索事件：陷阱\n你掉进了陷阱！！减少了【{hp_loss}】血量。"
-    
-    async def _bad_event_goblin(self, pet, user_id):
-        """哥布林事件"""
-        return await self._trigger_random_battle(pet, user_id, "👹 探索事件：哥布林\n血量遇到了哥布林，你不得不和他对战！！！")
-    
-    async def _bad_event_evil_trainer(self, pet, user_id):
-        """邪恶训练师事件"""
-        return await self._trigger_random_battle(pet, user_id, "😈 探索事件：邪恶训练师\n碰到了邪恶训练师，你不得不和他对战！！！")
-    
-    async def _bad_event_magic_eye_rabbit(self, pet, user_id):
-        """魔眼兔事件"""
-        return await self._trigger_random_battle(pet, user_id, "🐰 探索事件：魔眼兔\n你发现了一只魔眼兔，你打算为民除害!")
-    
-    async def _bad_event_twin_flower_vine(self, pet, user_id):
-        """孖花藤事件"""
-        return await self._trigger_random_battle(pet, user_id, "🌿 探索事件：孖花藤\n你看到孖花藤，你怒火中烧，对他发起了战斗！")
+            self.db.add_item_to_inventory(user_id, item_name, quantity)
     
-    async def _trigger_random_battle(self, pet, user_id, prefix_message):
-        """触发随机战斗"""
+    async def _trigger_random_battle(self, pet, user_id):
+        """触发随机战斗，返回(是否胜利, 战斗记录)"""
         # 随机敌人属性
-        enemy_types = ['金', '木', '水', '火', '土']
-        enemy_type = random.choice(enemy_types)
+        enemy_type = random.choice(self.ENEMY_TYPES)
         
         # 计算敌人等级
         if pet.level < 10:
@@ -1946,48 +2250,18 @@ class QQPetPlugin(Star):
         enemy_pet = self._create_enemy_pet(enemy_type, enemy_level)
         
         # 执行战斗
-        battle_result = await self._execute_battle(pet, enemy_pet, user_id)
+        won, battle_result = await self._execute_battle(pet, enemy_pet, user_id)
         
         # 如果胜利，给予奖励
-        if "胜利" in battle_result:
+        if won:
             reward_result = self._calculate_battle_rewards(pet)
-            return f"{prefix_message}\n{battle_result}\n{reward_result}"
+            return won, f"{battle_result}\n{reward_result}"
         else:
-            return f"{prefix_message}\n{battle_result}"
+            return won, battle_result
     
     def _create_enemy_pet(self, enemy_type, enemy_level):
-        """创建敌人宠物"""
-        # 基础属性
-        base_stats = {
-            "火": {"hp": 600, "attack": 158, "defense": 61, "speed": 125},
-            "水": {"hp": 643, "attack": 121, "defense": 83, "speed": 103},
-            "木": {"hp": 728, "attack": 101, "defense": 124, "speed": 83},
-            "土": {"hp": 813, "attack": 89, "defense": 103, "speed": 73},
-            "金": {"hp": 636, "attack": 144, "defense": 73, "speed": 134}
-        }
-        
-        base = base_stats[enemy_type]
-        
-        # 根据等级调整属性
-        hp = base["hp"] + (enemy_level - 1) * 50
-        attack = base["attack"] + (enemy_level - 1) * 8
-        defense = base["defense"] + (enemy_level - 1) * 5
-        speed = base["speed"] + (enemy_level - 1) * 6
-        
-        # 创建临时宠物对象
-        enemy_pet = type('EnemyPet', (), {
-            'name': f"{enemy_type}属性敌人",
-            'type': enemy_type,
-            'level': enemy_level,
-            'hp': hp,
-            'max_hp': hp,
-            'attack': attack,
-            'defense': defense,
-            'speed': speed,
-            'skills': []
-        })()
-        
-        return enemy_pet
+        """创建敌人宠物，属性直接取自预先计算的模板"""
+        return EnemyPet(enemy_type, enemy_level)
     
     async def _execute_battle(self, player_pet, enemy_pet, user_id):
         """执行战斗逻辑"""
@@ -2025,39 +2299,25 @@ class QQPetPlugin(Star):
         # 判断战斗结果
         if player_pet.hp > 0:
             battle_log += f"\n🎉 战斗胜利！{player_pet.name}获得了胜利！"
-            return battle_log
+            return True, battle_log
         else:
             battle_log += f"\n💀 战斗失败！{player_pet.name}被击败了！"
-            return battle_log
+            return False, battle_log
     
     def _calculate_battle_rewards(self, pet):
-        """计算战斗奖励"""
-        # 基础奖励（1级）
-        base_exp_min = 18
-        base_exp_max = 24
-        base_coins_min = 40
-        base_coins_max = 120
-        
-        # 根据等级计算奖励
-        level_multiplier = 1.2 ** (pet.level - 1)
-        exp_reward = random.randint(
-            int(base_exp_min * level_multiplier),
-            int(base_exp_max * level_multiplier)
-        )
-        coins_reward = random.randint(base_coins_min, base_coins_max)
+        """计算战斗奖励，奖励区间来自事件表"""
+        exp_min, exp_max = self.explore_events.battle_exp_range(pet.level)
+        coins_min, coins_max = self.explore_events.battle_coins
+        exp_reward = random.randint(exp_min, exp_max)
+        coins_reward = random.randint(coins_min, coins_max)
         
         # 给予奖励
-        pet.exp += exp_reward
         pet.coins += coins_reward
-        
-        # 检查升级
-        level_up_result = ""
-        if pet.exp >= pet.level * 100:
-            old_level = pet.level
-            level_up_result = pet.level_up()
-            if "进化" in level_up_result:
-                level_up_result = f"\n{level_up_result}"
-            else:
-                level_up_result = f"\n{pet.name}从{old_level}级升到了{pet.level}级！"
+        level_up_result = self._level_up_message(pet.gain_exp(exp_reward))
         
         return f"🏆 战斗奖励：经验【{exp_reward}】，金币【{coins_reward}】{level_up_result}"
+    
+    @staticmethod
+    def _level_up_message(level_up_result: str) -> str:
+        """升级信息前加换行，没有升级时为空字符串"""
+        return f"\n{level_up_result}" if level_up_result else ""
@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+import os
+import time
+import asyncio
+import logging
+import contextvars
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 当前正在执行的指令，数据库语句和错误日志按它归属到指令上
+current_command: contextvars.ContextVar = contextvars.ContextVar("current_command", default=None)
+
+# 延迟直方图的桶上界（毫秒），与Prometheus的le标签一致
+LATENCY_BUCKETS_MS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class Histogram:
+    """固定桶直方图，记录是O(桶数)的计数，分位数在桶内线性插值估算"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个是+Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, bound in enumerate(self.buckets):
+            in_bucket = self.counts[i]
+            if in_bucket and seen + in_bucket >= rank:
+                return min(self.max, lower + (bound - lower) * (rank - seen) / in_bucket)
+            seen += in_bucket
+            lower = bound
+        return self.max
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class CommandStats:
+    __slots__ = ("latency", "calls", "errors", "sql_count", "sql_time_ms")
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.calls = 0
+        self.errors = 0
+        self.sql_count = 0
+        self.sql_time_ms = 0.0
+
+
+class _ErrorCounter(logging.Handler):
+    """把执行指令期间的ERROR日志计入该指令的错误数（指令处理器会自己捕获异常并记日志）"""
+
+    def __init__(self, metrics: "Metrics"):
+        super().__init__(level=logging.ERROR)
+        self.metrics = metrics
+
+    def emit(self, record: logging.LogRecord):
+        command = current_command.get()
+        if command is not None:
+            self.metrics.command(command).errors += 1
+
+
+class Metrics:
+    """指令延迟、错误、SQL和渲染的统计，以及其他组件的统计汇总
+
+    collectors中的函数返回{名称: 数值}，在报告和导出时调用，组件自己维护计数。
+    """
+
+    def __init__(self):
+        self.commands: Dict[str, CommandStats] = {}
+        self.render = Histogram()
+        self.sql_count = 0
+        self.sql_time_ms = 0.0
+        self.started_at = time.time()
+        self.collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+        self._error_counter = _ErrorCounter(self)
+        self._watched_loggers: List[logging.Logger] = []
+
+    def command(self, name: str) -> CommandStats:
+        stats = self.commands.get(name)
+        if stats is None:
+            stats = self.commands[name] = CommandStats()
+        return stats
+
+    def watch_errors(self, target_logger: logging.Logger):
+        """统计该logger在指令执行期间输出的错误日志"""
+        if target_logger not in self._watched_loggers:
+            target_logger.addHandler(self._error_counter)
+            self._watched_loggers.append(target_logger)
+
+    def close(self):
+        for target_logger in self._watched_loggers:
+            target_logger.removeHandler(self._error_counter)
+        self._watched_loggers = []
+
+    def start_command(self, name: str):
+        """开始记录一次指令执行，返回交给finish_command的令牌"""
+        self.command(name).calls += 1
+        return current_command.set(name), time.perf_counter()
+
+    def finish_command(self, name: str, token, failed: bool = False):
+        context_token, start = token
+        try:
+            current_command.reset(context_token)
+        except ValueError:
+            # 生成器在其他上下文中被关闭（如事件循环关闭时回收），此时无需恢复
+            pass
+        stats = self.command(name)
+        stats.latency.observe((time.perf_counter() - start) * 1000)
+        if failed:
+            stats.errors += 1
+
+    def record_sql(self, sql: str, elapsed: float):
+        """数据库语句监听器，elapsed为秒"""
+        elapsed_ms = elapsed * 1000
+        self.sql_count += 1
+        self.sql_time_ms += elapsed_ms
+        name = current_command.get()
+        if name is not None:
+            stats = self.command(name)
+            stats.sql_count += 1
+            stats.sql_time_ms += elapsed_ms
+
+    def record_render(self, elapsed: float):
+        self.render.observe(elapsed * 1000)
+
+    def collect(self) -> Dict[str, Dict[str, Any]]:
+        result = {}
+        for name, collector in self.collectors.items():
+            try:
+                result[name] = collector()
+            except Exception as e:
+                logger.error(f"收集{name}统计失败: {str(e)}")
+        return result
+
+    def report(self) -> str:
+        """管理员查看的文字报告"""
+        lines = [f"📊 宠物插件性能（运行{(time.time() - self.started_at) / 3600:.1f}小时）"]
+        if not self.commands:
+            lines.append("暂无指令记录")
+        for name, stats in sorted(self.commands.items(), key=lambda item: -item[1].latency.sum):
+            latency = stats.latency
+            calls = max(stats.calls, 1)
+            lines.append(
+                f"{name}：{stats.calls}次 错误{stats.errors} "
+                f"p50 {latency.quantile(0.5):.1f}ms p95 {latency.quantile(0.95):.1f}ms "
+                f"p99 {latency.quantile(0.99):.1f}ms SQL {stats.sql_count / calls:.1f}条/{stats.sql_time_ms / calls:.2f}ms"
+            )
+        lines.append(f"\nSQL：{self.sql_count}条，共{self.sql_time_ms:.1f}ms")
+        if self.render.count:
+            lines.append(f"渲染：{self.render.count}次 p50 {self.render.quantile(0.5):.1f}ms "
+                         f"p95 {self.render.quantile(0.95):.1f}ms p99 {self.render.quantile(0.99):.1f}ms")
+        for name, values in self.collect().items():
+            lines.append(f"{name}：" + "，".join(f"{key}={_format_value(value)}" for key, value in values.items()))
+        return "\n".join(lines)
+
+    def exposition(self) -> str:
+        """Prometheus文本格式"""
+        lines = [
+            "# TYPE chongwu_command_latency_ms histogram",
+        ]
+        for name, stats in self.commands.items():
+            label = f'command="{_escape(name)}"'
+            lines.extend(_histogram_lines("chongwu_command_latency_ms", label, stats.latency))
+        lines.append("# TYPE chongwu_command_errors_total counter")
+        lines.extend(f'chongwu_command_errors_total{{command="{_escape(name)}"}} {stats.errors}'
+                     for name, stats in self.commands.items())
+        lines.append("# TYPE chongwu_command_sql_statements_total counter")
+        lines.extend(f'chongwu_command_sql_statements_total{{command="{_escape(name)}"}} {stats.sql_count}'
+                     for name, stats in self.commands.items())
+        lines.append("# TYPE chongwu_command_sql_time_ms_total counter")
+        lines.extend(f'chongwu_command_sql_time_ms_total{{command="{_escape(name)}"}} {stats.sql_time_ms:.3f}'
+                     for name, stats in self.commands.items())
+        lines.append("# TYPE chongwu_sql_statements_total counter")
+        lines.append(f"chongwu_sql_statements_total {self.sql_count}")
+        lines.append("# TYPE chongwu_sql_time_ms_total counter")
+        lines.append(f"chongwu_sql_time_ms_total {self.sql_time_ms:.3f}")
+        lines.append("# TYPE chongwu_render_ms histogram")
+        lines.extend(_histogram_lines("chongwu_render_ms", "", self.render))
+        for group, values in self.collect().items():
+            for key, value in values.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    lines.append(f"chongwu_{group}_{key} {value}")
+        return "\n".join(lines) + "\n"
+
+    def write_exposition(self, path: str):
+        """原子地写入导出文件，抓取方不会读到写了一半的内容"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write(self.exposition())
+        os.replace(temp_path, path)
+
+
+class MetricsExporter:
+    """定时把统计写到文本文件，供node_exporter的textfile collector等抓取"""
+
+    def __init__(self, metrics: Metrics, path: str, interval: float = 60.0):
+        self.metrics = metrics
+        self.path = path
+        self.interval = float(interval)
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """interval不大于0时不导出；没有运行中的事件循环时等下一次调用再启动"""
+        if self.interval <= 0 or (self._task is not None and not self._task.done()):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        self._task = loop.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                self.metrics.write_exposition(self.path)
+            except Exception as e:
+                logger.error(f"导出性能统计失败: {str(e)}")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+def _histogram_lines(metric: str, label: str, histogram: Histogram) -> List[str]:
+    lines = []
+    prefix = f"{label}," if label else ""
+    cumulative = 0
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        cumulative += count
+        lines.append(f'{metric}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+    lines.append(f'{metric}_bucket{{{prefix}le="+Inf"}} {histogram.count}')
+    suffix = f"{{{label}}}" if label else ""
+    lines.append(f"{metric}_sum{suffix} {histogram.sum:.3f}")
+    lines.append(f"{metric}_count{suffix} {histogram.count}")
+    return lines
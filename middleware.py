@@ -0,0 +1,132 @@
+# -*- coding: utf-8 -*-
+import inspect
+import functools
+from contextlib import nullcontext
+
+from .pet import StaleDataError
+
+# 多进程模式下写入冲突、整条指令回滚后的回复
+STALE_DATA_REPLY = "数据已被其他进程更新，请重试"
+
+
+class Deferred:
+    """处理器产出的延后回复，由pet_command在释放用户锁之后执行"""
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+
+def after_unlock(func, *args) -> Deferred:
+    """把不需要锁的耗时回复（渲染图片、发送后清理文件）推迟到释放锁之后
+
+    func是异步生成器函数，产出要发送的结果。处理器中写 yield after_unlock(func, ...)
+    """
+    return Deferred(func, args)
+
+
+async def _deliver(reply):
+    """产出一条回复，延后回复在这里执行"""
+    if isinstance(reply, Deferred):
+        async for result in reply.func(*reply.args):
+            yield result
+    else:
+        yield reply
+
+
+def pet_command(command: str, peer_arg: str = None, serialize: bool = True):
+    """指令处理器的公共包装，写在@filter.command下面：先做冷却和频率检查，再按用户加锁执行
+
+    锁只在处理器修改宠物和数据库期间持有：处理器产出的回复先缓存，释放锁之后再交给框架发送，
+    after_unlock()包装的渲染等操作也在释放锁之后执行，同一锁分片上的其他用户不用等待渲染和网络发送。
+    通过检查的指令会记录延迟、错误和执行期间的SQL统计；管理员开启剖析时用cProfile记录。
+    多进程模式下处理器在一个数据库事务中执行，写入冲突（StaleDataError）时整体回滚，
+    重新加载涉及的宠物并提示重试，处理器不要吞掉StaleDataError。事务状态属于整个连接，
+    所以事务中的处理器不能真正挂起，耗时操作用after_unlock()推迟（见_explore_batch的说明）。
+
+    command: 指令名
+    peer_arg: 处理器中表示另一位玩家ID的参数名（如对决的对手），会和发送者一起加锁
+    serialize: 是否按用户串行执行，不读写宠物数据的指令可以关闭
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        async def run(self, event, *args, **kwargs):
+            if event is not None:
+                # 插件初始化时可能还没有事件循环，定时任务在收到指令时补上
+                self._start_background_tasks()
+
+                # 挂机探索的结算摘要在用户下一次使用指令时发送
+                digest = self.idle_explorer.pop_digest(event.get_sender_id())
+                if digest:
+                    yield event.plain_result(digest)
+
+                # 记录群成员，群排行榜只统计在该群使用过指令的玩家
+                self.leaderboard.record_member(event.get_sender_id(), event.get_group_id())
+
+            # 多进程模式下先加载其他进程修改过的宠物
+            self.coherence.sync()
+
+            if not serialize:
+                async for reply in func(self, event, *args, **kwargs):
+                    async for result in _deliver(reply):
+                        yield result
+                return
+
+            keys = [event.get_sender_id()] if event is not None else []
+            if peer_arg:
+                peer = signature.bind_partial(self, event, *args, **kwargs).arguments.get(peer_arg)
+                if peer:
+                    keys.append(str(peer).replace("@", ""))
+
+            async with self.locks.hold(*keys):
+                # 等锁期间同一用户的上一条指令可能已经开始冷却，持锁后再检查一次
+                rejection = self.cooldowns.check_cooldown(command, keys[0]) if event is not None else None
+                if rejection is not None:
+                    replies = [event.plain_result(rejection)]
+                else:
+                    self.coherence.refresh(*keys)
+                    transaction = self.db.transaction(*keys) if self.coherence.enabled else nullcontext()
+                    try:
+                        with transaction:
+                            replies = [result async for result in func(self, event, *args, **kwargs)]
+                    except StaleDataError:
+                        # 事务已回滚，内存中的宠物可能带着未写入的修改，从数据库重新加载
+                        self.coherence.reload(*keys)
+                        replies = [event.plain_result(STALE_DATA_REPLY)] if event is not None else []
+                    # 在释放锁之前检查战力是否变化，有变化时更新排行榜
+                    self.leaderboard.touch(*keys)
+
+            for reply in replies:
+                async for result in _deliver(reply):
+                    yield result
+
+        @functools.wraps(func)
+        async def wrapper(self, event, *args, **kwargs):
+            # 冷却和频率限制在加锁和任何数据库操作之前检查
+            if event is not None:
+                rejection = self.cooldowns.check(command, event.get_sender_id(), event.get_group_id())
+                if rejection is not None:
+                    if rejection:
+                        yield event.plain_result(rejection)
+                    return
+
+            steps = run(self, event, *args, **kwargs)
+            if self.profiler.armed and self.profiler.take(command):
+                steps = self.profiler.run(command, steps)
+
+            token = self.metrics.start_command(command)
+            failed = False
+            try:
+                async for result in steps:
+                    yield result
+            except Exception:
+                failed = True
+                raise
+            finally:
+                self.metrics.finish_command(command, token, failed)
+
+        wrapper.command = command
+        return wrapper
+    return decorator
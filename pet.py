@@ -2,20 +2,53 @@ import random
 import json
 import os
 import random
+import time
 import sqlite3
-from typing import Dict, Any, List
+import logging
+import math
+import contextvars
+from contextlib import ExitStack, contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Iterable, List, Tuple
 from datetime import datetime, timedelta
 
-class Pet:
-    # 宠物类型和对应的进化信息
-    EVOLUTION_DATA = {
-        "烈焰": {"evolve_to": "炽焰龙", "required_level": 10, "type": "火"},
-        "碧波兽": {"evolve_to": "瀚海蛟", "required_level": 10, "type": "水"},
-        "藤甲虫": {"evolve_to": "赤镰战甲", "required_level": 10, "type": "草"},
-        "碎裂岩": {"evolve_to": "岩脊守护者", "required_level": 10, "type": "土"},
-        "金刚": {"evolve_to": "破甲战犀", "required_level": 10, "type": "金"}
-    }
+from .db_shards import DB_DIR_NAME, DB_NAME, existing_layouts, shard_name, shard_of
+from .species import (DEFAULT_BASE, DEFAULT_CRITICAL, EVOLVED_BASE_LEVEL, FALLBACK_TYPE, ELEMENTS, SPECIES,
+                      ADVANTAGE_TYPE_NAMES, TYPE_SKILLS, get_element, get_species)
+
+logger = logging.getLogger(__name__)
+
+
+def total_exp_for(level: int) -> int:
+    """从1级升到level级所需的累计经验，即100×(1+2+…+(level-1))，每升一级需要 等级×100 经验"""
+    return 50 * level * (level - 1)
+
+
+def level_for_exp(total_exp: int) -> int:
+    """累计经验对应的等级，按 50×L×(L-1) ≤ total_exp 直接求根，O(1)"""
+    if total_exp <= 0:
+        return 1
+    level = (1 + math.isqrt(1 + total_exp * 2 // 25)) // 2
+    # 整除和取整平方根可能让估计值差1，修正到满足条件的最大等级
+    while total_exp_for(level + 1) <= total_exp:
+        level += 1
+    while level > 1 and total_exp_for(level) > total_exp:
+        level -= 1
+    return level
 
+
+def grant_exp(pets: Iterable["Pet"], amount: int) -> List[Tuple["Pet", int, str]]:
+    """给一批宠物发放相同的经验，返回升级了的(宠物, 原等级, 升级信息)"""
+    leveled = []
+    for pet in pets:
+        old_level = pet.level
+        message = pet.gain_exp(amount)
+        if message:
+            leveled.append((pet, old_level, message))
+    return leveled
+
+
+class Pet:
     # 属性克制关系
     TYPE_ADVANTAGES = {
         "金": {"木": 1.2, "火": 0.8, "金": 1.0, "水": 1.0, "土": 1.0},
@@ -27,19 +60,6 @@ class Pet:
         "普通": {"暗": 1.2, "土": 1.1, "金": 1.0, "木": 1.0, "火": 1.0, "水": 1.0}
     }
 
-    # 宠物类型对应的基础图片
-    TYPE_IMAGES = {
-        "烈焰": "FirePup_1",
-        "碧波兽": "WaterSprite_1",
-        "藤甲虫": "LeafyCat_1",
-        "碎裂岩": "cataclastic_rock_1",
-        "金刚": "King_Kong_1",
-        "炽焰龙": "FirePup_2",
-        "瀚海蛟": "WaterSprite_2",
-        "赤镰战甲": "LeafyCat_2",
-        "岩脊守护者": "cataclastic_rock_2",
-        "破甲战犀": "King_Kong_2"
-    }
     def __init__(self, name: str, pet_type: str, owner: str = "未知"):
         self.name = name
         self.type = pet_type
@@ -48,21 +68,12 @@ class Pet:
         self.exp = 0
         
         # 根据宠物类型设置基础属性
-        base_stats = {
-            "火": {"hp": 40, "attack": 16, "defense": 5, "speed": 13},
-            "水": {"hp": 50, "attack": 10, "defense": 8, "speed": 10},
-            "草": {"hp": 60, "attack": 8, "defense": 12, "speed": 8},
-            "土": {"hp": 70, "attack": 7, "defense": 10, "speed": 6},
-            "金": {"hp": 45, "attack": 14, "defense": 6, "speed": 14},
-            "暗": {"hp": 55, "attack": 12, "defense": 7, "speed": 11},
-            "普通": {"hp": 50, "attack": 10, "defense": 6, "speed": 9}
-        }
-        
-        stats = base_stats.get(pet_type, {"hp": 40, "attack": 10, "defense": 5, "speed": 10})
-        self.hp = stats["hp"]
-        self.attack = stats["attack"]
-        self.defense = stats["defense"]
-        self.speed = stats["speed"]
+        element = get_element(pet_type)
+        stats = element.base if element else DEFAULT_BASE
+        self.hp = stats.hp
+        self.attack = stats.attack
+        self.defense = stats.defense
+        self.speed = stats.speed
         
         self.hunger = 50  # 饥饿度 (0-100)
         self.mood = 50    # 心情 (0-100)
@@ -78,18 +89,13 @@ class Pet:
         self.last_battle_time = datetime.now() - timedelta(hours=1)  # 初始设置为1小时前
         self.auto_heal_threshold = 100  # 自动使用治疗瓶的最低血量阈值
         
-        # 暴击属性
-        self.critical_rate = 0.05  # 基础暴击率
-        self.critical_damage = 1.5  # 基础暴击伤害
-        
-        # 金属性专属暴击属性
-        if self.type == "金":
-            if self.name == "金刚":
-                self.critical_rate = 0.15  # 15%暴击率
-                self.critical_damage = 1.8  # 180%暴击伤害
-            elif self.name == "破甲战犀":
-                self.critical_rate = 0.25  # 25%暴击率
-                self.critical_damage = 1.8  # 180%暴击伤害
+        # 暴击属性，金刚和破甲战犀有专属暴击属性
+        species = get_species(name, pet_type)
+        if species:
+            self.critical_rate = species.critical_rate
+            self.critical_damage = species.critical_damage
+        else:
+            self.critical_rate, self.critical_damage = DEFAULT_CRITICAL
         
     @classmethod
     def from_dict(cls, data: Dict[str, Any]):
@@ -104,9 +110,10 @@ class Pet:
         pet.hunger = data.get('hunger', 50)
         pet.mood = data.get('mood', 50)
         pet.coins = data.get('coins', 0)
-        # 解析技能列表
+        # 解析技能列表，数据库读出的数据中已经是列表
+        skills = data.get('skills', '[]')
         try:
-            pet.skills = json.loads(data.get('skills', '[]'))
+            pet.skills = skills if isinstance(skills, list) else json.loads(skills)
         except:
             pet.skills = []
         pet.last_updated = datetime.fromisoformat(data.get('last_updated', datetime.now().isoformat()))
@@ -171,120 +178,41 @@ class Pet:
             
     def update_stats(self):
         """更新宠物属性"""
-        # 根据宠物类型和等级计算属性
-        type_growth = {
-            "火": {"hp": 15, "attack": 3.8, "defense": 1.5, "speed": 3.0},
-            "水": {"hp": 16, "attack": 3.0, "defense": 2.0, "speed": 2.5},
-            "草": {"hp": 18, "attack": 2.5, "defense": 3.0, "speed": 2.0},
-            "土": {"hp": 20, "attack": 2.2, "defense": 2.5, "speed": 1.8},
-            "金": {"hp": 16, "attack": 3.5, "defense": 1.8, "speed": 3.2},
-            "暗": {"hp": 17, "attack": 3.2, "defense": 2.0, "speed": 2.8},
-            "普通": {"hp": 16, "attack": 3.0, "defense": 1.8, "speed": 2.4}
-        }
+        species = get_species(self.name, self.type)
+        element = get_element(self.type) or ELEMENTS[FALLBACK_TYPE]
         
-        # 进化形态属性
-        evolved_growth = {
-            "火": {"hp": 19, "attack": 4.8, "defense": 1.9, "speed": 3.8},
-            "水": {"hp": 20, "attack": 3.8, "defense": 2.5, "speed": 3.1},
-            "草": {"hp": 23, "attack": 3.1, "defense": 3.8, "speed": 2.5},
-            "土": {"hp": 25, "attack": 2.8, "defense": 3.1, "speed": 2.3},
-            "金": {"hp": 20, "attack": 4.4, "defense": 2.3, "speed": 4.0},
-            "暗": {"hp": 22, "attack": 4.2, "defense": 2.5, "speed": 3.5},
-            "普通": {"hp": 21, "attack": 4.0, "defense": 2.3, "speed": 3.1}
-        }
-        
-        # 基础形态基础属性
-        base_stats = {
-            "火": {"hp": 40, "attack": 16, "defense": 5, "speed": 13},
-            "水": {"hp": 50, "attack": 10, "defense": 8, "speed": 10},
-            "草": {"hp": 60, "attack": 8, "defense": 12, "speed": 8},
-            "土": {"hp": 70, "attack": 7, "defense": 10, "speed": 6},
-            "金": {"hp": 45, "attack": 14, "defense": 6, "speed": 14},
-            "暗": {"hp": 55, "attack": 12, "defense": 7, "speed": 11},
-            "普通": {"hp": 50, "attack": 10, "defense": 6, "speed": 9}
-        }
-        
-        # 进化形态基础属性（30级）
-        evolved_base = {
-            "火": {"hp": 600, "attack": 158, "defense": 61, "speed": 125},
-            "水": {"hp": 643, "attack": 121, "defense": 83, "speed": 103},
-            "草": {"hp": 728, "attack": 101, "defense": 124, "speed": 83},
-            "土": {"hp": 813, "attack": 89, "defense": 103, "speed": 73},
-            "金": {"hp": 636, "attack": 144, "defense": 73, "speed": 134},
-            "暗": {"hp": 620, "attack": 135, "defense": 75, "speed": 110},
-            "普通": {"hp": 630, "attack": 130, "defense": 70, "speed": 105}
-        }
-        
-        # 判断是否为进化形态
-        is_evolved = self.level >= 30 and self.name in ["炽焰龙", "瀚海蛟", "赤镰战甲", "岩脊守护者", "破甲战犀"]
+        # 判断是否为进化形态，只按名称判断，与属性无关
+        by_name = SPECIES.get(self.name)
+        is_evolved = self.level >= EVOLVED_BASE_LEVEL and by_name is not None and by_name.stage == 2
         
         if is_evolved:
-            # 进化形态属性计算
-            growth = evolved_growth.get(self.type, evolved_growth["火"])
-            base = evolved_base.get(self.type, evolved_base["火"])
-            # 30级基础属性 + (当前等级-30) * 每级成长
-            level_diff = self.level - 30
-            self.hp = int(base["hp"] + level_diff * growth["hp"])
-            self.attack = int(base["attack"] + level_diff * growth["attack"])
-            self.defense = int(base["defense"] + level_diff * growth["defense"])
-            self.speed = int(base["speed"] + level_diff * growth["speed"])
+            # 进化形态属性计算：30级基础属性 + (当前等级-30) * 每级成长
+            base, growth = element.evolved_base, element.evolved_growth
+            level_diff = self.level - EVOLVED_BASE_LEVEL
         else:
-            # 基础形态属性计算
-            growth = type_growth.get(self.type, type_growth["火"])
-            base = base_stats.get(self.type, base_stats["火"])
-            # 基础属性 + (当前等级-1) * 每级成长
+            # 基础形态属性计算：基础属性 + (当前等级-1) * 每级成长
+            base, growth = element.base, element.growth
             level_diff = self.level - 1
-            self.hp = int(base["hp"] + level_diff * growth["hp"])
-            self.attack = int(base["attack"] + level_diff * growth["attack"])
-            self.defense = int(base["defense"] + level_diff * growth["defense"])
-            self.speed = int(base["speed"] + level_diff * growth["speed"])
-        
-        # 金属性宠物暴击属性成长
-        if self.type == "金":
-            if self.name == "金刚":
-                # 每级暴击率+0.2%、暴伤+0.3%
-                level_diff = self.level - 1
-                self.critical_rate = 0.15 + level_diff * 0.002
-                self.critical_damage = 1.8 + level_diff * 0.003
-            elif self.name == "破甲战犀":
-                # 每级暴击率+0.3%、暴伤+0.4%
-                level_diff = self.level - 1
-                self.critical_rate = 0.25 + level_diff * 0.003
-                self.critical_damage = 1.8 + level_diff * 0.004
-            else:
-                # 其他金属性宠物使用基础暴击属性
-                self.critical_rate = 0.05
-                self.critical_damage = 1.5
+        self.hp = int(base.hp + level_diff * growth.hp)
+        self.attack = int(base.attack + level_diff * growth.attack)
+        self.defense = int(base.defense + level_diff * growth.defense)
+        self.speed = int(base.speed + level_diff * growth.speed)
+        
+        # 暴击属性成长（金刚每级暴击率+0.2%、暴伤+0.3%，破甲战犀每级+0.3%、+0.4%）
+        if species:
+            level_diff = self.level - 1
+            self.critical_rate = species.critical_rate + level_diff * species.critical_rate_growth
+            self.critical_damage = species.critical_damage + level_diff * species.critical_damage_growth
         else:
-            # 非金属性宠物使用基础暴击属性
-            self.critical_rate = 0.05
-            self.critical_damage = 1.5
+            self.critical_rate, self.critical_damage = DEFAULT_CRITICAL
         
-        # 10级解锁技能
+        # 10级解锁技能，进化形态也继承技能
         if self.level >= 10 and not self.skill_unlocked:
             self.skill_unlocked = True
             # 根据宠物名称设置对应的技能
-            if self.name == "烈焰":
-                self.skills = ["火焰焚烧"]
-            elif self.name == "碧波兽":
-                self.skills = ["巨浪淹没"]
-            elif self.name == "藤甲虫":
-                self.skills = ["根须缠绕"]
-            elif self.name == "碎裂岩":
-                self.skills = ["大地堡垒"]
-            elif self.name == "金刚":
-                self.skills = ["金属风暴"]
-            # 进化形态也继承技能
-            elif self.name == "炽焰龙":
-                self.skills = ["火焰焚烧"]
-            elif self.name == "瀚海蛟":
-                self.skills = ["巨浪淹没"]
-            elif self.name == "赤镰战甲":
-                self.skills = ["根须缠绕"]
-            elif self.name == "岩脊守护者":
-                self.skills = ["大地堡垒"]
-            elif self.name == "破甲战犀":
-                self.skills = ["金属风暴"]
+            species_by_name = SPECIES.get(self.name)
+            if species_by_name:
+                self.skills = [species_by_name.skill]
                 
     def is_alive(self) -> bool:
         """检查宠物是否存活"""
@@ -373,16 +301,8 @@ class Pet:
     def learn_new_skill(self) -> str:
         """学习新技能"""
         # 根据宠物类型学习不同的技能
-        type_skills = {
-            '金': ['金属风暴'],
-            '木': ['根须缠绕'],
-            '土': ['大地堡垒'],
-            '水': ['巨浪淹没'],
-            '火': ['火焰焚烧']
-        }
-
-        # 获取可用技能
-        available_skills = type_skills.get(self.type, [])
+        skill = TYPE_SKILLS.get(self.type)
+        available_skills = [skill] if skill else []
 
         # 过滤掉已经学会的技能
         new_skills = [skill for skill in available_skills if skill not in self.skills]
@@ -393,35 +313,27 @@ class Pet:
 
     def can_evolve(self) -> bool:
         """检查宠物是否可以进化"""
-        return self.name in self.EVOLUTION_DATA and self.level >= self.EVOLUTION_DATA[self.name]['required_level']
+        species = SPECIES.get(self.name)
+        return species is not None and species.evolve_to is not None and self.level >= species.evolve_level
 
     def evolve(self) -> str:
         """宠物进化"""
         if not self.can_evolve():
             return f"{self.name}还不能进化！"
 
-        evolution_info = self.EVOLUTION_DATA[self.name]
+        evolved = SPECIES[SPECIES[self.name].evolve_to]
         old_name = self.name
-        old_type = self.type
 
         # 更新宠物信息
-        self.name = evolution_info['evolve_to']
-        self.type = evolution_info['type']
-
-        # 重置属性为进化形态的1级属性
-        evolved_base = {
-            "火": {"hp": 600, "attack": 158, "defense": 61, "speed": 125},
-            "水": {"hp": 643, "attack": 121, "defense": 83, "speed": 103},
-            "草": {"hp": 728, "attack": 101, "defense": 124, "speed": 83},
-            "土": {"hp": 813, "attack": 89, "defense": 103, "speed": 73},
-            "金": {"hp": 636, "attack": 144, "defense": 73, "speed": 134}
-        }
-        
-        base = evolved_base.get(self.type, evolved_base["火"])
-        self.hp = base["hp"]
-        self.attack = base["attack"]
-        self.defense = base["defense"]
-        self.speed = base["speed"]
+        self.name = evolved.name
+        self.type = evolved.type
+
+        # 重置属性为进化形态的基础属性
+        base = get_element(self.type).evolved_base
+        self.hp = base.hp
+        self.attack = base.attack
+        self.defense = base.defense
+        self.speed = base.speed
 
         # 学习新技能
         new_skill = self.learn_new_skill()
@@ -440,10 +352,36 @@ class Pet:
         """更新最后对战时间"""
         self.last_battle_time = datetime.now()
 
+    @property
+    def total_exp(self) -> int:
+        """宠物累计获得的经验"""
+        return total_exp_for(self.level) + self.exp
+
+    def gain_exp(self, amount: int) -> str:
+        """增加经验，一次结算跨越的所有等级，属性、技能和进化只按最终等级处理一次
+
+        返回升级信息，没有升级时返回空字符串
+        """
+        total = self.total_exp + amount
+        new_level = max(self.level, level_for_exp(total))
+        self.exp = total - total_exp_for(new_level)
+        if new_level == self.level:
+            return ""
+        old_level = self.level
+        self.level = new_level
+        result = self._on_level_changed()
+        if "进化" in result:
+            return result
+        return f"{self.name}从{old_level}级升到了{self.level}级！"
+
     def level_up(self):
-        """升级处理"""
+        """升一级并清空经验"""
         self.level += 1
         self.exp = 0  # 重置经验值
+        return self._on_level_changed()
+
+    def _on_level_changed(self) -> str:
+        """等级变化后更新属性、学习技能并检查进化"""
         self.update_stats()  # 更新属性
         
         # 学习新技能
@@ -457,10 +395,14 @@ class Pet:
         
         return f"{self.name}升级到{self.level}级！"
 
+    @property
+    def power(self) -> int:
+        """战力值（简化计算），与数据库中的POWER_EXPR一致"""
+        return self.attack + self.defense + self.speed
+
     def __str__(self) -> str:
         """返回宠物的详细信息"""
-        # 计算战力值（简化计算）
-        power = self.attack + self.defense + self.speed
+        power = self.power
         
         # 格式化技能列表
         skills_str = "、".join(self.skills) if self.skills else "无"
@@ -482,18 +424,285 @@ class Pet:
 暴击伤害：{self.critical_damage:.0%}
 技能：{skills_str}"""
 
+class HealKit:
+    """战斗中的治疗瓶快照：开战前读取一次背包，战斗中在内存里消耗，战斗结束后一次性写回"""
+
+    def __init__(self, heal_items: Dict[str, Dict[str, int]]):
+        # [物品名, 治疗量, 剩余数量]，按治疗量从小到大排列
+        self.bottles = sorted(
+            ([name, info['heal'], info['quantity']] for name, info in heal_items.items() if info['quantity'] > 0),
+            key=lambda bottle: bottle[1]
+        )
+        self.used: Dict[str, int] = {}
+
+    def pick(self, deficit: int):
+        """选择能补满缺口的最小治疗瓶，都补不满时选择最大的"""
+        largest = None
+        for bottle in self.bottles:
+            if bottle[2] <= 0:
+                continue
+            if bottle[1] >= deficit:
+                return bottle
+            largest = bottle
+        return largest
+
+    def use(self, pet: Pet) -> str:
+        """对宠物使用一个治疗瓶，返回使用结果，没有可用的治疗瓶时返回空字符串"""
+        # 最大生命值的算法与use_item_on_pet一致
+        max_hp = 100 + pet.level * 20
+        deficit = max_hp - pet.hp
+        if deficit <= 0:
+            return ""
+        bottle = self.pick(deficit)
+        if not bottle:
+            return ""
+
+        name, heal, _ = bottle
+        bottle[2] -= 1
+        self.used[name] = self.used.get(name, 0) + 1
+        hp_restored = min(heal, deficit)
+        pet.hp += hp_restored
+        return f"使用了{name}！\n{pet.name}的HP恢复了{hp_restored}点！"
+
+
+class EnemyPet:
+    """探索中遇到的敌人，属性来自按(属性, 等级)预先计算好的模板
+
+    使用__slots__避免每个敌人分配实例字典，伤害计算与Pet共用同一套规则。
+    """
+    __slots__ = ("name", "type", "level", "hp", "max_hp", "attack", "defense", "speed",
+                 "skills", "critical_rate", "critical_damage")
+
+    TYPE_ADVANTAGES = Pet.TYPE_ADVANTAGES
+
+    # 1级基础属性取各属性进化形态的基础属性，敌人属性按克制表的写法，"木"对应草属性
+    BASE_STATS = {ADVANTAGE_TYPE_NAMES.get(element, element): ELEMENTS[element].evolved_base
+                  for element in ("火", "水", "草", "土", "金")}
+    # 每升一级增加的属性
+    LEVEL_GROWTH = {"hp": 50, "attack": 8, "defense": 5, "speed": 6}
+    # 预先计算模板的等级上限，更高等级第一次遇到时再计算并缓存
+    TEMPLATE_MAX_LEVEL = 100
+
+    # (属性, 等级) -> (名称, hp, 攻击, 防御, 速度)
+    _templates: Dict[tuple, tuple] = {}
+
+    def __init__(self, enemy_type: str, level: int):
+        name, hp, attack, defense, speed = self.template(enemy_type, level)
+        self.name = name
+        self.type = enemy_type
+        self.level = level
+        self.hp = hp
+        self.max_hp = hp
+        self.attack = attack
+        self.defense = defense
+        self.speed = speed
+        self.skills = []
+        self.critical_rate = 0.05
+        self.critical_damage = 1.5
+
+    @classmethod
+    def _build_template(cls, enemy_type: str, level: int) -> tuple:
+        base = cls.BASE_STATS[enemy_type]
+        growth = cls.LEVEL_GROWTH
+        return (
+            f"{enemy_type}属性敌人",
+            base.hp + (level - 1) * growth["hp"],
+            base.attack + (level - 1) * growth["attack"],
+            base.defense + (level - 1) * growth["defense"],
+            base.speed + (level - 1) * growth["speed"],
+        )
+
+    @classmethod
+    def template(cls, enemy_type: str, level: int) -> tuple:
+        """获取(属性, 等级)对应的模板"""
+        key = (enemy_type, level)
+        template = cls._templates.get(key)
+        if template is None:
+            template = cls._templates[key] = cls._build_template(enemy_type, level)
+        return template
+
+    def is_alive(self) -> bool:
+        return self.hp > 0
+
+    calculate_damage = Pet.calculate_damage
+
+
+EnemyPet._templates = {
+    (enemy_type, level): EnemyPet._build_template(enemy_type, level)
+    for enemy_type in EnemyPet.BASE_STATS
+    for level in range(1, EnemyPet.TEMPLATE_MAX_LEVEL + 1)
+}
+
+
+# 商店初始物品：(名称, 描述, 价格, 效果类型, 效果值, 效果值2)
+DEFAULT_SHOP_ITEMS = [
+    ("普通口粮", "能快速填饱肚子的基础食物。", 20, "hunger", 20, 0),
+    ("美味罐头", "营养均衡，宠物非常爱吃。", 50, "hunger_mood", 20, 20),
+    ("开心饼干", "能让宠物心情愉悦的神奇零食。", 35, "mood", 20, 0),
+    ("小治疗瓶", "能恢复宠物20血量", 20, "hp", 20, 0),
+    ("中治疗瓶", "能恢复宠物50血量", 100, "hp", 50, 0),
+    ("大治疗瓶", "能恢复宠物100血量", 200, "hp", 100, 0)
+]
+
+
+def apply_item_effect(pet: Pet, item_name: str, effect_type: str, effect_value: int, effect_value2: int) -> str:
+    """对宠物应用物品效果，返回使用结果"""
+    result = f"使用了{item_name}！"
+    if effect_type == "hunger":
+        pet.hunger = min(100, pet.hunger + effect_value)
+        result += f"\n{pet.name}的饥饿度恢复了{effect_value}点！"
+    elif effect_type == "mood":
+        pet.mood = min(100, pet.mood + effect_value)
+        result += f"\n{pet.name}的心情恢复了{effect_value}点！"
+    elif effect_type == "hp":
+        hp_restored = min(effect_value, (100 + pet.level * 20) - pet.hp)
+        pet.hp = min(100 + pet.level * 20, pet.hp + effect_value)
+        result += f"\n{pet.name}的HP恢复了{hp_restored}点！"
+    elif effect_type == "hunger_mood":
+        pet.hunger = min(100, pet.hunger + effect_value)
+        pet.mood = min(100, pet.mood + effect_value2)
+        result += f"\n{pet.name}的饥饿度恢复了{effect_value}点，心情恢复了{effect_value2}点！"
+    return result
+
+
+# get_pet_data返回的字段
+PET_COLUMNS = (
+    'user_id', 'pet_name', 'pet_type', 'owner', 'level', 'exp', 'hp', 'attack', 'defense', 'speed',
+    'hunger', 'mood', 'coins', 'skills', 'last_updated', 'last_battle_time', 'auto_heal_threshold',
+    'critical_rate', 'critical_damage', 'skill_unlocked', 'burn_turns', 'heal_blocked_turns',
+    'defense_boost', 'crit_rate_boost', 'revive_used', 'row_version'
+)
+# 战力值在数据库中的表达式，与Pet.power一致，排行榜索引和查询共用
+POWER_EXPR = "(attack + defense + speed)"
+# 多进程模式下每次写入宠物时分配的新版本号：全表递增，既能比较单行是否被修改，也能按版本号查出变化的行
+NEXT_ROW_VERSION = "(SELECT COALESCE(MAX(row_version), 0) + 1 FROM pet_data)"
+
+
+class StaleDataError(Exception):
+    """多进程模式下宠物已被其他进程修改，本次写入被拒绝"""
+
+
+def pet_row_to_data(row: tuple) -> Dict[str, Any]:
+    """按PET_COLUMNS顺序的一行转为get_pet_data返回的字典"""
+    data = dict(zip(PET_COLUMNS, row))
+
+    # 解析技能列表
+    try:
+        data['skills'] = json.loads(data['skills'])
+    except:
+        data['skills'] = []
+
+    return data
+
+
+class TimedCursor:
+    """sqlite3游标的包装：每条语句执行后把(SQL, 耗时秒数)通知给监听者"""
+    __slots__ = ("_cursor", "_listeners")
+
+    def __init__(self, cursor: sqlite3.Cursor, listeners: List):
+        self._cursor = cursor
+        self._listeners = listeners
+
+    def execute(self, sql: str, parameters=()):
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(sql, parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            for listener in self._listeners:
+                listener(sql, elapsed)
+        return self
+
+    def executemany(self, sql: str, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, seq_of_parameters)
+        finally:
+            elapsed = time.perf_counter() - start
+            for listener in self._listeners:
+                listener(sql, elapsed)
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
 # PetDatabase类
 class PetDatabase:
-    def __init__(self, plugin_dir: str):
-        db_dir = os.path.join(plugin_dir, "plugins_db")
+    def __init__(self, plugin_dir: str, db_name: str = DB_NAME, threaded: bool = False):
+        db_dir = os.path.join(plugin_dir, DB_DIR_NAME)
         if not os.path.exists(db_dir):
             os.makedirs(db_dir)
-        self.db_path = os.path.join(db_dir, "astrbot_plugin_qq_pet.db")
+        self.db_path = os.path.join(db_dir, db_name)
+        # 分片模式下批量写入在分片自己的写线程中执行，连接需要允许跨线程使用
+        self._threaded = threaded
+        self._tx_depth = 0
+        # 多进程模式：记录本进程最后看到的每只宠物的版本号，写入时检查，冲突的用户记入conflicts
+        self.versioning = False
+        self.versions: Dict[str, int] = {}
+        self.conflicts: set = set()
+        # 语句监听者，为空时使用原始游标，没有任何额外开销
+        self._statement_listeners: List = []
         self.init_db()
 
+    def add_statement_listener(self, listener):
+        """监听每条语句的执行耗时：listener(sql, elapsed)，提交以"COMMIT"报告"""
+        if listener in self._statement_listeners:
+            return
+        self._statement_listeners.append(listener)
+        if not isinstance(self.cursor, TimedCursor):
+            self.cursor = TimedCursor(self.cursor, self._statement_listeners)
+
+    def remove_statement_listener(self, listener):
+        if listener in self._statement_listeners:
+            self._statement_listeners.remove(listener)
+        if not self._statement_listeners and isinstance(self.cursor, TimedCursor):
+            self.cursor = self.cursor._cursor
+
+    def _commit_now(self):
+        if not self._statement_listeners:
+            self.conn.commit()
+            return
+        start = time.perf_counter()
+        try:
+            self.conn.commit()
+        finally:
+            elapsed = time.perf_counter() - start
+            for listener in self._statement_listeners:
+                listener("COMMIT", elapsed)
+
+    def _commit(self):
+        """提交修改，处于transaction()中时推迟到事务结束统一提交"""
+        if self._tx_depth == 0:
+            self._commit_now()
+
+    @contextmanager
+    def transaction(self, *user_ids: str):
+        """在一个事务中执行多次写操作，结束时只提交一次，出错时整体回滚
+
+        user_ids只在分片模式下用于选择分片，单文件时忽略。
+        """
+        self._tx_depth += 1
+        try:
+            yield self
+        except BaseException:
+            self._tx_depth -= 1
+            if self._tx_depth == 0:
+                self.conn.rollback()
+            raise
+        self._tx_depth -= 1
+        if self._tx_depth == 0:
+            self._commit_now()
+
+    def close(self):
+        self.conn.close()
+
     def init_db(self):
         """初始化数据库连接和表结构"""
-        self.conn = sqlite3.connect(self.db_path)
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=not self._threaded)
         self.cursor = self.conn.cursor()
 
         # 创建宠物数据表
@@ -525,73 +734,86 @@ class PetDatabase:
         # 为已存在的记录添加默认的暴击属性值
         try:
             self.cursor.execute('ALTER TABLE pet_data ADD COLUMN critical_rate REAL DEFAULT 0.05')
-            print("已添加critical_rate字段")
+            logger.info("已添加critical_rate字段")
         except sqlite3.OperationalError as e:
             # 列已存在，忽略错误
-            print(f"critical_rate字段已存在: {e}")
+            logger.debug(f"critical_rate字段已存在: {e}")
             pass
             
         try:
             self.cursor.execute('ALTER TABLE pet_data ADD COLUMN critical_damage REAL DEFAULT 1.5')
-            print("已添加critical_damage字段")
+            logger.info("已添加critical_damage字段")
         except sqlite3.OperationalError as e:
             # 列已存在，忽略错误
-            print(f"critical_damage字段已存在: {e}")
+            logger.debug(f"critical_damage字段已存在: {e}")
             pass
 
         # 添加技能解锁字段
         try:
             self.cursor.execute('ALTER TABLE pet_data ADD COLUMN skill_unlocked TEXT DEFAULT ""')
-            print("已添加skill_unlocked字段")
+            logger.info("已添加skill_unlocked字段")
         except sqlite3.OperationalError as e:
             # 列已存在，忽略错误
-            print(f"skill_unlocked字段已存在: {e}")
+            logger.debug(f"skill_unlocked字段已存在: {e}")
             pass
 
         # 添加灼烧效果字段
         try:
             self.cursor.execute('ALTER TABLE pet_data ADD COLUMN burn_turns INTEGER DEFAULT 0')
-            print("已添加burn_turns字段")
+            logger.info("已添加burn_turns字段")
         except sqlite3.OperationalError as e:
             # 列已存在，忽略错误
-            print(f"burn_turns字段已存在: {e}")
+            logger.debug(f"burn_turns字段已存在: {e}")
             pass
 
         # 添加禁疗效果字段
         try:
             self.cursor.execute('ALTER TABLE pet_data ADD COLUMN heal_blocked_turns INTEGER DEFAULT 0')
-            print("已添加heal_blocked_turns字段")
+            logger.info("已添加heal_blocked_turns字段")
         except sqlite3.OperationalError as e:
             # 列已存在，忽略错误
-            print(f"heal_blocked_turns字段已存在: {e}")
+            logger.debug(f"heal_blocked_turns字段已存在: {e}")
             pass
 
         # 添加防御加成字段
         try:
             self.cursor.execute('ALTER TABLE pet_data ADD COLUMN defense_boost INTEGER DEFAULT 0')
-            print("已添加defense_boost字段")
+            logger.info("已添加defense_boost字段")
         except sqlite3.OperationalError as e:
             # 列已存在，忽略错误
-            print(f"defense_boost字段已存在: {e}")
+            logger.debug(f"defense_boost字段已存在: {e}")
             pass
 
         # 添加暴击率加成字段
         try:
             self.cursor.execute('ALTER TABLE pet_data ADD COLUMN crit_rate_boost INTEGER DEFAULT 0')
-            print("已添加crit_rate_boost字段")
+            logger.info("已添加crit_rate_boost字段")
         except sqlite3.OperationalError as e:
             # 列已存在，忽略错误
-            print(f"crit_rate_boost字段已存在: {e}")
+            logger.debug(f"crit_rate_boost字段已存在: {e}")
             pass
 
         # 添加复活使用标记字段
         try:
             self.cursor.execute('ALTER TABLE pet_data ADD COLUMN revive_used INTEGER DEFAULT 0')
-            print("已添加revive_used字段")
+            logger.info("已添加revive_used字段")
+        except sqlite3.OperationalError as e:
+            # 列已存在，忽略错误
+            logger.debug(f"revive_used字段已存在: {e}")
+            pass
+
+        # 添加行版本号字段，多进程模式下用于缓存失效和乐观并发控制
+        try:
+            self.cursor.execute('ALTER TABLE pet_data ADD COLUMN row_version INTEGER DEFAULT 0')
+            logger.info("已添加row_version字段")
         except sqlite3.OperationalError as e:
             # 列已存在，忽略错误
-            print(f"revive_used字段已存在: {e}")
+            logger.debug(f"row_version字段已存在: {e}")
             pass
+        self.cursor.execute('CREATE INDEX IF NOT EXISTS idx_pet_data_row_version ON pet_data (row_version)')
+
+        # 战力值的表达式索引：索引中保存计算结果，排行榜按索引顺序读取前N名（不需要生成列，SQLite 3.9起支持）
+        self.cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_pet_data_power ON pet_data ({POWER_EXPR} DESC, user_id)')
 
         # 创建商店物品表
         self.cursor.execute('''
@@ -616,6 +838,34 @@ class PetDatabase:
             )
         ''')
 
+        # 创建指令冷却表，只保存尚未到期的冷却
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS command_cooldowns (
+                user_id TEXT NOT NULL,
+                command TEXT NOT NULL,
+                expires_at INTEGER NOT NULL,
+                PRIMARY KEY (user_id, command)
+            ) WITHOUT ROWID
+        ''')
+
+        # 创建群成员表，记录在群里使用过指令的用户，用于群内排行
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS group_members (
+                group_id TEXT NOT NULL,
+                user_id TEXT NOT NULL,
+                PRIMARY KEY (group_id, user_id)
+            ) WITHOUT ROWID
+        ''')
+
+        # 创建挂机探索表，digest保存尚未发送给用户的结算摘要
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS idle_explore (
+                user_id TEXT PRIMARY KEY,
+                enrolled_at TEXT DEFAULT CURRENT_TIMESTAMP,
+                digest TEXT
+            )
+        ''')
+
         self.conn.commit()
 
         # 初始化商店物品
@@ -629,21 +879,12 @@ class PetDatabase:
         
         if count == 0:
             # 插入商店物品
-            items = [
-                ("普通口粮", "能快速填饱肚子的基础食物。", 20, "hunger", 20, 0),
-                ("美味罐头", "营养均衡，宠物非常爱吃。", 50, "hunger_mood", 20, 20),
-                ("开心饼干", "能让宠物心情愉悦的神奇零食。", 35, "mood", 20, 0),
-                ("小治疗瓶", "能恢复宠物20血量", 20, "hp", 20, 0),
-                ("中治疗瓶", "能恢复宠物50血量", 100, "hp", 50, 0),
-                ("大治疗瓶", "能恢复宠物100血量", 200, "hp", 100, 0)
-            ]
-            
             self.cursor.executemany('''
                 INSERT INTO shop_items (name, description, price, effect_type, effect_value, effect_value2)
                 VALUES (?, ?, ?, ?, ?, ?)
-            ''', items)
+            ''', DEFAULT_SHOP_ITEMS)
             
-            self.conn.commit()
+            self._commit()
 
     def get_shop_items(self) -> List[Dict[str, Any]]:
         """获取商店物品列表"""
@@ -702,7 +943,7 @@ class PetDatabase:
                 VALUES (?, ?, ?)
             ''', (user_id, item_name, quantity))
         
-        self.conn.commit()
+        self._commit()
 
     def remove_item_from_inventory(self, user_id: str, item_name: str, quantity: int = 1) -> bool:
         """从用户背包移除物品"""
@@ -736,9 +977,32 @@ class PetDatabase:
                 WHERE user_id = ? AND item_name = ?
             ''', (new_quantity, user_id, item_name))
         
-        self.conn.commit()
+        self._commit()
         return True
 
+    def get_heal_items(self, user_id: str) -> Dict[str, Dict[str, int]]:
+        """一次查询用户背包中的所有回血物品及其治疗量"""
+        self.cursor.execute('''
+            SELECT inv.item_name, inv.quantity, shop.effect_value
+            FROM user_inventory AS inv
+            JOIN shop_items AS shop ON shop.name = inv.item_name
+            WHERE inv.user_id = ? AND inv.quantity > 0 AND shop.effect_type = 'hp'
+        ''', (user_id,))
+        return {name: {'quantity': quantity, 'heal': heal} for name, quantity, heal in self.cursor.fetchall()}
+
+    def consume_items(self, user_id: str, used: Dict[str, int]):
+        """批量扣除物品并只提交一次，数量扣完的记录会被删除"""
+        self.cursor.executemany('''
+            UPDATE user_inventory
+            SET quantity = MAX(quantity - ?, 0)
+            WHERE user_id = ? AND item_name = ?
+        ''', [(quantity, user_id, item_name) for item_name, quantity in used.items()])
+        self.cursor.execute('''
+            DELETE FROM user_inventory
+            WHERE user_id = ? AND quantity <= 0
+        ''', (user_id,))
+        self._commit()
+
     def use_item_on_pet(self, user_id: str, item_name: str, pet: Pet) -> str:
         """对宠物使用物品"""
         # 检查是否拥有该物品
@@ -761,24 +1025,8 @@ class PetDatabase:
         if not item_row:
             return f"无效的物品{item_name}！"
         
-        effect_type, effect_value, effect_value2 = item_row
-        
         # 应用效果
-        result = f"使用了{item_name}！"
-        if effect_type == "hunger":
-            pet.hunger = min(100, pet.hunger + effect_value)
-            result += f"\n{pet.name}的饥饿度恢复了{effect_value}点！"
-        elif effect_type == "mood":
-            pet.mood = min(100, pet.mood + effect_value)
-            result += f"\n{pet.name}的心情恢复了{effect_value}点！"
-        elif effect_type == "hp":
-            hp_restored = min(effect_value, (100 + pet.level * 20) - pet.hp)
-            pet.hp = min(100 + pet.level * 20, pet.hp + effect_value)
-            result += f"\n{pet.name}的HP恢复了{hp_restored}点！"
-        elif effect_type == "hunger_mood":
-            pet.hunger = min(100, pet.hunger + effect_value)
-            pet.mood = min(100, pet.mood + effect_value2)
-            result += f"\n{pet.name}的饥饿度恢复了{effect_value}点，心情恢复了{effect_value2}点！"
+        result = apply_item_effect(pet, item_name, *item_row)
         
         # 从背包中移除物品
         self.remove_item_from_inventory(user_id, item_name, 1)
@@ -792,46 +1040,81 @@ class PetDatabase:
             if self.get_pet_data(user_id):
                 return False
 
-            self.cursor.execute('''
+            self.cursor.execute(f'''
                 INSERT INTO pet_data 
-                (user_id, pet_name, pet_type, skills, owner)
-                VALUES (?, ?, ?, ?, ?)
+                (user_id, pet_name, pet_type, skills, owner, row_version)
+                VALUES (?, ?, ?, ?, ?, {NEXT_ROW_VERSION if self.versioning else 0})
             ''', (user_id, pet_name, pet_type, json.dumps([]), owner))
+            if self.versioning:
+                self._remember_current_version(user_id)
 
-            self.conn.commit()
+            self._commit()
             return True
         except Exception as e:
-            print(f"创建宠物失败: {str(e)}")
+            logger.error(f"创建宠物失败: {str(e)}")
             return False
 
     def get_pet_data(self, user_id: str) -> Dict[str, Any] | None:
         """获取宠物数据"""
-        self.cursor.execute('''
-            SELECT user_id, pet_name, pet_type, owner, level, exp, hp, attack, defense, speed, 
-                   hunger, mood, coins, skills, last_updated, last_battle_time, auto_heal_threshold,
-                   critical_rate, critical_damage, skill_unlocked, burn_turns, heal_blocked_turns,
-                   defense_boost, crit_rate_boost, revive_used
-            FROM pet_data 
-            WHERE user_id = ?
-        ''', (user_id,))
+        self.cursor.execute(f'SELECT {", ".join(PET_COLUMNS)} FROM pet_data WHERE user_id = ?', (user_id,))
         
         row = self.cursor.fetchone()
         if not row:
             return None
+        return pet_row_to_data(row)
 
-        columns = ['user_id', 'pet_name', 'pet_type', 'owner', 'level', 'exp', 'hp', 'attack', 'defense', 'speed', 
-                  'hunger', 'mood', 'coins', 'skills', 'last_updated', 'last_battle_time', 'auto_heal_threshold',
-                  'critical_rate', 'critical_damage', 'skill_unlocked', 'burn_turns', 'heal_blocked_turns',
-                  'defense_boost', 'crit_rate_boost', 'revive_used']
-        data = dict(zip(columns, row))
+    def iter_pet_data(self):
+        """一次查询遍历所有宠物数据，启动时代替逐个用户的get_pet_data
 
-        # 解析技能列表
-        try:
-            data['skills'] = json.loads(data['skills'])
-        except:
-            data['skills'] = []
+        多进程模式下记录读到的版本号（get_pet_data不记录，读到的数据不一定会放进缓存）。
+        """
+        cursor = self.conn.execute(f'SELECT {", ".join(PET_COLUMNS)} FROM pet_data')
+        for row in cursor:
+            data = pet_row_to_data(row)
+            if self.versioning:
+                self.versions[data['user_id']] = data['row_version']
+            yield data
+
+    def enable_versioning(self):
+        """开启多进程模式：写入宠物时分配新版本号并检查本进程看到的版本，改用WAL让读写互不阻塞"""
+        self.versioning = True
+        self.conn.execute('PRAGMA journal_mode=WAL')
+
+    def data_version(self) -> int:
+        """其他连接提交修改后会变化的计数，本连接自己的提交不影响它"""
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def changed_pets(self, since: int):
+        """版本号大于since的宠物（包括本进程自己写入的），返回(宠物数据列表, 最大版本号)
+
+        只读取数据，不更新versions，由调用方比较后决定是否重新加载。
+        """
+        rows = self.conn.execute(
+            f'SELECT {", ".join(PET_COLUMNS)} FROM pet_data WHERE row_version > ? ORDER BY row_version', (since,)
+        ).fetchall()
+        changed = [pet_row_to_data(row) for row in rows]
+        return changed, (changed[-1]['row_version'] if changed else since)
+
+    def latest_version(self) -> int:
+        """当前最大的版本号，作为changed_pets的起点"""
+        return self.conn.execute('SELECT COALESCE(MAX(row_version), 0) FROM pet_data').fetchone()[0]
 
-        return data
+    def version_of(self, user_id: str):
+        return self.versions.get(user_id)
+
+    def remember_version(self, user_id: str, version: int):
+        self.versions[user_id] = version
+
+    def pop_conflicts(self) -> set:
+        """取出并清空写入冲突的用户"""
+        conflicts, self.conflicts = self.conflicts, set()
+        return conflicts
+
+    def _remember_current_version(self, user_id: str):
+        self.cursor.execute('SELECT row_version FROM pet_data WHERE user_id = ?', (user_id,))
+        row = self.cursor.fetchone()
+        if row:
+            self.versions[user_id] = row[0]
 
     def update_pet_data(self, user_id: str, **kwargs):
         """更新宠物数据"""
@@ -842,17 +1125,376 @@ class PetDatabase:
         set_clause = ', '.join([f"{key}=?" for key in kwargs.keys()])
         values = list(kwargs.values()) + [user_id]
         
-        query = f"UPDATE pet_data SET {set_clause} WHERE user_id=?"
+        if not self.versioning:
+            query = f"UPDATE pet_data SET {set_clause} WHERE user_id=?"
+            self.cursor.execute(query, values)
+            self._commit()
+            return
+
+        # 多进程模式：只有数据库中的版本仍是本进程看到的版本时才写入
+        expected = self.versions.get(user_id)
+        query = f"UPDATE pet_data SET {set_clause}, row_version={NEXT_ROW_VERSION} WHERE user_id=?"
+        if expected is not None:
+            query += " AND row_version=?"
+            values.append(expected)
         self.cursor.execute(query, values)
-        self.conn.commit()
+        if self.cursor.rowcount == 0 and expected is not None:
+            self.conflicts.add(user_id)
+            # 结束UPDATE开启的隐式事务，释放写锁；处于transaction()中时由它整体回滚
+            if self._tx_depth == 0:
+                self.conn.rollback()
+            raise StaleDataError(f"宠物数据已被其他进程修改: {user_id}")
+        self._remember_current_version(user_id)
+        self._commit()
 
     def delete_pet(self, user_id: str):
         """删除宠物"""
         self.cursor.execute('DELETE FROM pet_data WHERE user_id = ?', (user_id,))
-        self.conn.commit()
+        self._commit()
 
     def get_all_user_ids(self) -> List[str]:
         """获取所有用户ID"""
         self.cursor.execute('SELECT user_id FROM pet_data')
         rows = self.cursor.fetchall()
-        return [row[0] for row in rows]
\ No newline at end of file
+        return [row[0] for row in rows]
+
+    def top_power(self, limit: int) -> List[Tuple[str, int]]:
+        """战力值最高的limit只宠物(user_id, 战力值)，按索引顺序读取，与总人数无关"""
+        # ORDER BY中的表达式与索引完全一致时才会使用表达式索引
+        self.cursor.execute(
+            f'SELECT user_id, {POWER_EXPR} FROM pet_data ORDER BY {POWER_EXPR} DESC, user_id LIMIT ?', (limit,)
+        )
+        return self.cursor.fetchall()
+
+    def add_group_member(self, user_id: str, group_id: str):
+        """记录用户在该群出现过"""
+        self.cursor.execute('INSERT OR IGNORE INTO group_members (group_id, user_id) VALUES (?, ?)', (group_id, user_id))
+        self._commit()
+
+    def get_group_members(self, group_id: str) -> List[str]:
+        """群内出现过的所有用户"""
+        self.cursor.execute('SELECT user_id FROM group_members WHERE group_id = ?', (group_id,))
+        return [row[0] for row in self.cursor.fetchall()]
+
+    def save_cooldown(self, user_id: str, command: str, expires_at: int):
+        """保存指令冷却的到期时间"""
+        self.cursor.execute('''
+            INSERT OR REPLACE INTO command_cooldowns (user_id, command, expires_at)
+            VALUES (?, ?, ?)
+        ''', (user_id, command, expires_at))
+        self._commit()
+
+    def load_cooldowns(self) -> List[tuple]:
+        """清理已到期的冷却，返回仍有效的(user_id, command, expires_at)"""
+        now = int(datetime.now().timestamp())
+        self.cursor.execute('DELETE FROM command_cooldowns WHERE expires_at <= ?', (now,))
+        self._commit()
+        self.cursor.execute('SELECT user_id, command, expires_at FROM command_cooldowns')
+        return self.cursor.fetchall()
+
+    def get_idle_enrollments(self) -> Dict[str, Any]:
+        """获取所有挂机探索的用户及其未发送的摘要"""
+        self.cursor.execute('SELECT user_id, digest FROM idle_explore')
+        return dict(self.cursor.fetchall())
+
+    def set_idle_enrolled(self, user_id: str, enrolled: bool):
+        """报名或退出挂机探索"""
+        if enrolled:
+            self.cursor.execute('INSERT OR IGNORE INTO idle_explore (user_id) VALUES (?)', (user_id,))
+        else:
+            self.cursor.execute('DELETE FROM idle_explore WHERE user_id = ?', (user_id,))
+        self._commit()
+
+    def set_idle_digest(self, user_id: str, digest: str = None):
+        """更新挂机探索的摘要"""
+        self.cursor.execute('UPDATE idle_explore SET digest = ? WHERE user_id = ?', (digest, user_id))
+        self._commit()
+
+    def update_pets(self, pet_rows: List[Dict[str, Any]]) -> set:
+        """批量更新多只宠物，每行是to_dict()的结果加上user_id，只执行一次executemany
+
+        返回因版本冲突没有写入的用户（只在多进程模式下可能非空）
+        """
+        if not pet_rows:
+            return set()
+        last_updated = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        columns = [key for key in pet_rows[0] if key not in ('user_id', 'last_updated')]
+        set_clause = ', '.join(f"{column}=?" for column in columns)
+        if not self.versioning:
+            self.cursor.executemany(
+                f"UPDATE pet_data SET {set_clause}, last_updated=? WHERE user_id=?",
+                [[row[column] for column in columns] + [last_updated, row['user_id']] for row in pet_rows]
+            )
+            self._commit()
+            return set()
+
+        # 多进程模式：逐行检查版本，被其他进程修改过的宠物跳过并记入conflicts，其余照常写入
+        before = self.latest_version()
+        written, conflicts = set(), set()
+        for row in pet_rows:
+            user_id = row['user_id']
+            values = [row[column] for column in columns] + [last_updated, user_id]
+            query = f"UPDATE pet_data SET {set_clause}, last_updated=?, row_version={NEXT_ROW_VERSION} WHERE user_id=?"
+            if user_id in self.versions:
+                query += " AND row_version=?"
+                values.append(self.versions[user_id])
+            self.cursor.execute(query, values)
+            if self.cursor.rowcount:
+                written.add(user_id)
+            elif user_id in self.versions:
+                conflicts.add(user_id)
+        # 只记录本次写入的宠物的新版本，其他进程在这期间写入的行留给下一次同步
+        self.cursor.execute('SELECT user_id, row_version FROM pet_data WHERE row_version > ?', (before,))
+        self.versions.update((user_id, version) for user_id, version in self.cursor.fetchall() if user_id in written)
+        if conflicts:
+            self.conflicts |= conflicts
+            logger.warning(f"批量更新时{len(conflicts)}只宠物已被其他进程修改，已跳过")
+        self._commit()
+        return conflicts
+
+    def save_idle_tick(self, pet_rows: List[Dict[str, Any]], item_rows: List[tuple], digest_rows: List[tuple]) -> set:
+        """在一个事务中保存一轮挂机结算，每张表只执行一次executemany
+
+        宠物因版本冲突没有写入的用户，这一轮的物品和摘要也不写入，返回这些用户
+        """
+        with self.transaction():
+            conflicts = self.update_pets(pet_rows)
+            if conflicts:
+                item_rows = [row for row in item_rows if row[0] not in conflicts]
+                digest_rows = [row for row in digest_rows if row[1] not in conflicts]
+            if item_rows:
+                self.cursor.executemany('''
+                    INSERT INTO user_inventory (user_id, item_name, quantity)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(user_id, item_name) DO UPDATE SET quantity = quantity + excluded.quantity
+                ''', item_rows)
+            self.cursor.executemany('UPDATE idle_explore SET digest = ? WHERE user_id = ?', digest_rows)
+        return conflicts
+
+
+def _by_user(name: str):
+    """ShardedPetDatabase中按第一个参数user_id转发到所在分片的方法"""
+    def method(self, user_id: str, *args, **kwargs):
+        return getattr(self.shard(user_id), name)(user_id, *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(PetDatabase, name).__doc__
+    return method
+
+
+# 分片写线程中执行的语句耗时先记在这里，写完后由调用线程交给监听器，监听器不需要是线程安全的
+_statement_buffer: contextvars.ContextVar = contextvars.ContextVar("statement_buffer", default=None)
+
+
+def _run_buffered(func, buffer: List[tuple]):
+    _statement_buffer.set(buffer)
+    return func()
+
+
+class ShardedPetDatabase:
+    """按user_id的稳定哈希把玩家分到多个SQLite文件，接口与PetDatabase相同
+
+    每个分片是一个独立的PetDatabase（独立的文件、连接和写锁），并有一个自己的写线程：
+    挂机结算等跨分片的批量写入按分片拆开，在各自的写线程中同时执行和提交，
+    总耗时取决于最慢的分片而不是所有分片之和。单个用户的读写直接在所在分片上执行。
+    商店物品不按用户分片，每个分片各存一份。
+    跨分片的指令（如对决）由ShardedLockManager按分片序号顺序加锁，transaction()也按序号进入各分片的事务。
+    """
+
+    def __init__(self, plugin_dir: str, shards: int):
+        self.shards = shards
+        self.dbs = [PetDatabase(plugin_dir, shard_name(index, shards), threaded=True) for index in range(shards)]
+        self._writers = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"pet-db-shard{index}") for index in range(shards)
+        ]
+        self._statement_listeners: List = []
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """第一个分片的连接，供EXPLAIN QUERY PLAN等只关心表结构的场合使用"""
+        return self.dbs[0].conn
+
+    @property
+    def db_paths(self) -> List[str]:
+        return [db.db_path for db in self.dbs]
+
+    def shard(self, user_id: str) -> PetDatabase:
+        return self.dbs[shard_of(user_id, self.shards)]
+
+    def close(self):
+        for writer in self._writers:
+            writer.shutdown(wait=True)
+        for db in self.dbs:
+            db.close()
+
+    def add_statement_listener(self, listener):
+        """各分片只注册一个转发监听，写线程中的语句由_write_parallel在调用线程中补报"""
+        if listener in self._statement_listeners:
+            return
+        if not self._statement_listeners:
+            for db in self.dbs:
+                db.add_statement_listener(self._on_statement)
+        self._statement_listeners.append(listener)
+
+    def remove_statement_listener(self, listener):
+        if listener in self._statement_listeners:
+            self._statement_listeners.remove(listener)
+        if not self._statement_listeners:
+            for db in self.dbs:
+                db.remove_statement_listener(self._on_statement)
+
+    def _on_statement(self, sql: str, elapsed: float):
+        buffer = _statement_buffer.get()
+        if buffer is not None:
+            buffer.append((sql, elapsed))
+            return
+        self._report_statement(sql, elapsed)
+
+    def _report_statement(self, sql: str, elapsed: float):
+        for listener in self._statement_listeners:
+            listener(sql, elapsed)
+
+    @contextmanager
+    def transaction(self, *user_ids: str):
+        """在user_ids所在的分片（未指定时为所有分片）上开启事务，按分片序号依次进入和提交"""
+        indices = sorted({shard_of(user_id, self.shards) for user_id in user_ids}) or range(self.shards)
+        with ExitStack() as stack:
+            for index in indices:
+                stack.enter_context(self.dbs[index].transaction())
+            yield self
+
+    def _write_parallel(self, work: Dict[int, Any]) -> List[Any]:
+        """在各分片的写线程中同时执行work[分片序号]()，等待全部完成，按分片序号返回结果，有错误时抛出第一个"""
+        if len(work) == 1:
+            (index, func), = work.items()
+            return [func()]
+        # 每个任务复制一份上下文，SQL统计仍能归到当前指令
+        buffers: Dict[int, List[tuple]] = {index: [] for index in work}
+        futures = [
+            self._writers[index].submit(contextvars.copy_context().run, _run_buffered, func, buffers[index])
+            for index, func in sorted(work.items())
+        ]
+        errors = [future.exception() for future in futures]
+        # 监听器（SQL剖析、性能统计）修改共享的计数，等写线程全部结束后在调用线程中按分片顺序汇报
+        for index in sorted(buffers):
+            for sql, elapsed in buffers[index]:
+                self._report_statement(sql, elapsed)
+        for error in errors:
+            if error is not None:
+                raise error
+        return [future.result() for future in futures]
+
+    def _split(self, rows: Iterable, user_of) -> Dict[int, List]:
+        groups: Dict[int, List] = {}
+        for row in rows:
+            groups.setdefault(shard_of(user_of(row), self.shards), []).append(row)
+        return groups
+
+    get_user_inventory = _by_user("get_user_inventory")
+    add_item_to_inventory = _by_user("add_item_to_inventory")
+    remove_item_from_inventory = _by_user("remove_item_from_inventory")
+    get_heal_items = _by_user("get_heal_items")
+    consume_items = _by_user("consume_items")
+    use_item_on_pet = _by_user("use_item_on_pet")
+    create_pet = _by_user("create_pet")
+    get_pet_data = _by_user("get_pet_data")
+    update_pet_data = _by_user("update_pet_data")
+    delete_pet = _by_user("delete_pet")
+    save_cooldown = _by_user("save_cooldown")
+    add_group_member = _by_user("add_group_member")
+    version_of = _by_user("version_of")
+    remember_version = _by_user("remember_version")
+    set_idle_enrolled = _by_user("set_idle_enrolled")
+    set_idle_digest = _by_user("set_idle_digest")
+
+    def get_shop_items(self) -> List[Dict[str, Any]]:
+        """获取商店物品列表"""
+        return self.dbs[0].get_shop_items()
+
+    def enable_versioning(self):
+        for db in self.dbs:
+            db.enable_versioning()
+
+    def data_version(self) -> tuple:
+        return tuple(db.data_version() for db in self.dbs)
+
+    def latest_version(self) -> tuple:
+        return tuple(db.latest_version() for db in self.dbs)
+
+    def changed_pets(self, since):
+        """各分片的版本号相互独立，since为每个分片的最大版本号"""
+        changed, latest = [], []
+        for db, shard_since in zip(self.dbs, since):
+            rows, shard_latest = db.changed_pets(shard_since)
+            changed.extend(rows)
+            latest.append(shard_latest)
+        return changed, tuple(latest)
+
+    def pop_conflicts(self) -> set:
+        return set().union(*(db.pop_conflicts() for db in self.dbs))
+
+    def iter_pet_data(self):
+        """依次遍历所有分片的宠物数据"""
+        for db in self.dbs:
+            yield from db.iter_pet_data()
+
+    def get_all_user_ids(self) -> List[str]:
+        """获取所有用户ID"""
+        return [user_id for db in self.dbs for user_id in db.get_all_user_ids()]
+
+    def top_power(self, limit: int) -> List[Tuple[str, int]]:
+        """合并各分片的前limit名"""
+        rows = [row for db in self.dbs for row in db.top_power(limit)]
+        return sorted(rows, key=lambda row: (-row[1], row[0]))[:limit]
+
+    def get_group_members(self, group_id: str) -> List[str]:
+        """群成员按用户分片保存，合并所有分片"""
+        return [user_id for db in self.dbs for user_id in db.get_group_members(group_id)]
+
+    def load_cooldowns(self) -> List[tuple]:
+        """清理已到期的冷却，返回仍有效的(user_id, command, expires_at)"""
+        return [row for db in self.dbs for row in db.load_cooldowns()]
+
+    def get_idle_enrollments(self) -> Dict[str, Any]:
+        """获取所有挂机探索的用户及其未发送的摘要"""
+        enrollments = {}
+        for db in self.dbs:
+            enrollments.update(db.get_idle_enrollments())
+        return enrollments
+
+    def update_pets(self, pet_rows: List[Dict[str, Any]]) -> set:
+        """按分片拆开批量更新，各分片同时写入，返回因版本冲突没有写入的用户"""
+        return set().union(*self._write_parallel({
+            index: (lambda db=self.dbs[index], rows=rows: db.update_pets(rows))
+            for index, rows in self._split(pet_rows, lambda row: row['user_id']).items()
+        }))
+
+    def save_idle_tick(self, pet_rows: List[Dict[str, Any]], item_rows: List[tuple], digest_rows: List[tuple]) -> set:
+        """按分片拆开一轮挂机结算，每个分片在自己的写线程中用一个事务保存，返回版本冲突的用户"""
+        pets = self._split(pet_rows, lambda row: row['user_id'])
+        items = self._split(item_rows, lambda row: row[0])
+        digests = self._split(digest_rows, lambda row: row[1])
+        return set().union(*self._write_parallel({
+            index: (lambda db=self.dbs[index], index=index:
+                    db.save_idle_tick(pets.get(index, []), items.get(index, []), digests.get(index, [])))
+            for index in set(pets) | set(items) | set(digests)
+        }))
+
+
+def open_database(plugin_dir: str, shards: int = 1):
+    """按配置的分片数打开数据库
+
+    目录中已有其他分片数的数据库时拒绝启动，避免玩家数据"消失"，需要先用db_shards.py重新分片。
+    """
+    shards = max(1, int(shards))
+    layouts = existing_layouts(os.path.join(plugin_dir, DB_DIR_NAME))
+    others = sorted(count for count in layouts if count != shards)
+    if others and shards not in layouts:
+        raise RuntimeError(
+            f"数据库现在是{others[0]}个分片，配置为{shards}个分片，"
+            f"请先停止机器人并运行: python db_shards.py {plugin_dir} --shards {shards}"
+        )
+    if others:
+        logger.warning(f"数据库目录中还有{'、'.join(map(str, others))}个分片的旧数据库文件，已忽略")
+    if shards == 1:
+        return PetDatabase(plugin_dir)
+    return ShardedPetDatabase(plugin_dir, shards)
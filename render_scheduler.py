@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class RenderScheduler:
+    """图片渲染的准入控制：限制并发数、排队长度和排队时长，超限时直接放弃渲染
+
+    被放弃的请求返回None，调用方沿用原有的纯文字结果作为降级输出。
+    """
+
+    def __init__(self, max_concurrency: int = 2, max_queue: int = 8, max_wait: float = 3.0):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.max_wait = max(0.0, float(max_wait))
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+
+        self.active = 0           # 正在渲染的数量
+        self.waiting = 0          # 正在排队的数量
+        self.rendered = 0         # 完成渲染的次数
+        self.queued = 0           # 需要排队才拿到名额的次数
+        self.shed_queue_full = 0  # 因队列已满被拒绝的次数
+        self.shed_timeout = 0     # 因排队超时被放弃的次数
+
+    @property
+    def shed(self) -> int:
+        return self.shed_queue_full + self.shed_timeout
+
+    async def run(self, render: Callable[..., Awaitable[Any]], *args, **kwargs) -> Optional[Any]:
+        """在准入限制内执行渲染，被降级时返回None"""
+        # 用自身计数判断是否需要排队，信号量的获取可能要到下一轮事件循环才发生
+        pending = self.active + self.waiting
+        if pending >= self.max_concurrency:
+            if pending >= self.max_concurrency + self.max_queue:
+                self.shed_queue_full += 1
+                logger.warning(f"渲染队列已满({self.waiting})，降级为文字输出，累计降级{self.shed}次")
+                return None
+            self.queued += 1
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_wait)
+        except asyncio.TimeoutError:
+            self.shed_timeout += 1
+            logger.warning(f"渲染排队超过{self.max_wait}秒，降级为文字输出，累计降级{self.shed}次")
+            return None
+        finally:
+            self.waiting -= 1
+
+        self.active += 1
+        try:
+            result = await render(*args, **kwargs)
+            self.rendered += 1
+            return result
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, Any]:
+        """渲染调度器的统计数据"""
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "max_wait": self.max_wait,
+            "active": self.active,
+            "waiting": self.waiting,
+            "rendered": self.rendered,
+            "queued": self.queued,
+            "shed": self.shed,
+            "shed_queue_full": self.shed_queue_full,
+            "shed_timeout": self.shed_timeout,
+        }
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """合并同一个键上的并发请求：同一时刻只执行一次计算，其余请求共享结果
+
+    计算完成后结果还会保留window秒，窗口内的重复请求直接复用，不再产生任何开销。
+    """
+
+    def __init__(self, window: float = 1.0):
+        self.window = max(0.0, float(window))
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._recent: Dict[Hashable, Tuple[float, Any]] = {}
+
+        self.executed = 0   # 实际执行计算的次数
+        self.coalesced = 0  # 搭上进行中计算的次数
+        self.reused = 0     # 在去重窗口内直接复用结果的次数
+
+    async def do(self, key: Hashable, func: Callable[..., Awaitable[Any]], *args,
+                 on_evict: Optional[Callable[[Any], None]] = None) -> Any:
+        """执行或共享key对应的计算，on_evict会在结果离开去重窗口时被调用一次"""
+        loop = asyncio.get_running_loop()
+
+        recent = self._recent.get(key)
+        if recent is not None and recent[0] > loop.time():
+            self.reused += 1
+            return recent[1]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = loop.create_future()
+        self._inflight[key] = future
+        self.executed += 1
+        try:
+            result = await func(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            # 没有其他等待者时也要取走异常，避免"exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+        future.set_result(result)
+        entry = (loop.time() + self.window, result)
+        self._recent[key] = entry
+        loop.call_later(self.window, self._expire, key, entry, on_evict)
+        return result
+
+    def _expire(self, key: Hashable, entry: Tuple[float, Any], on_evict: Optional[Callable[[Any], None]]):
+        if self._recent.get(key) is entry:
+            del self._recent[key]
+        if on_evict is not None:
+            try:
+                on_evict(entry[1])
+            except Exception as e:
+                logger.error(f"清理共享结果失败: {str(e)}")
+
+    def stats(self) -> Dict[str, Any]:
+        """合并请求的统计数据"""
+        return {
+            "window": self.window,
+            "inflight": len(self._inflight),
+            "executed": self.executed,
+            "coalesced": self.coalesced,
+            "reused": self.reused,
+        }
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""宠物种族数据的唯一来源
+
+属性（元素）决定基础属性和成长，种族决定图片、技能、进化和暴击成长。
+所有记录在导入时构建一次，之后只读；按名称、属性和图片名查找都是一次字典查找。
+"""
+import sys
+from types import MappingProxyType
+from typing import Mapping, NamedTuple, Optional, Tuple
+
+
+class Stats(NamedTuple):
+    hp: float
+    attack: float
+    defense: float
+    speed: float
+
+
+class Element(NamedTuple):
+    """一种属性的数值：基础形态1级属性和每级成长，进化形态30级属性和每级成长"""
+    type: str
+    base: Stats
+    growth: Stats
+    evolved_base: Stats
+    evolved_growth: Stats
+
+
+class Species(NamedTuple):
+    """一个种族：stage为1是基础形态，2是进化形态"""
+    name: str
+    type: str
+    stage: int
+    sprite: str
+    skill: str
+    evolve_to: Optional[str] = None
+    evolve_level: int = 0
+    # 暴击率、暴击伤害，以及每级的成长
+    critical_rate: float = 0.05
+    critical_damage: float = 1.5
+    critical_rate_growth: float = 0.0
+    critical_damage_growth: float = 0.0
+
+
+# 不属于任何种族的宠物使用的暴击属性
+DEFAULT_CRITICAL = (0.05, 1.5)
+# 属性不存在时使用的1级属性
+DEFAULT_BASE = Stats(40, 10, 5, 10)
+# 属性不存在时按火属性成长
+FALLBACK_TYPE = "火"
+# 属性克制表和技能表里草属性写作"木"。只用于查找可学的技能和敌人属性，
+# 不影响宠物数值：属性为"木"的宠物仍按不存在的属性计算
+ADVANTAGE_TYPE_NAMES: Mapping[str, str] = MappingProxyType({"草": "木"})
+# 进化形态的属性从这个等级开始计算
+EVOLVED_BASE_LEVEL = 30
+
+_ELEMENTS = (
+    Element("火", Stats(40, 16, 5, 13), Stats(15, 3.8, 1.5, 3.0), Stats(600, 158, 61, 125), Stats(19, 4.8, 1.9, 3.8)),
+    Element("水", Stats(50, 10, 8, 10), Stats(16, 3.0, 2.0, 2.5), Stats(643, 121, 83, 103), Stats(20, 3.8, 2.5, 3.1)),
+    Element("草", Stats(60, 8, 12, 8), Stats(18, 2.5, 3.0, 2.0), Stats(728, 101, 124, 83), Stats(23, 3.1, 3.8, 2.5)),
+    Element("土", Stats(70, 7, 10, 6), Stats(20, 2.2, 2.5, 1.8), Stats(813, 89, 103, 73), Stats(25, 2.8, 3.1, 2.3)),
+    Element("金", Stats(45, 14, 6, 14), Stats(16, 3.5, 1.8, 3.2), Stats(636, 144, 73, 134), Stats(20, 4.4, 2.3, 4.0)),
+    Element("暗", Stats(55, 12, 7, 11), Stats(17, 3.2, 2.0, 2.8), Stats(620, 135, 75, 110), Stats(22, 4.2, 2.5, 3.5)),
+    Element("普通", Stats(50, 10, 6, 9), Stats(16, 3.0, 1.8, 2.4), Stats(630, 130, 70, 105), Stats(21, 4.0, 2.3, 3.1)),
+)
+
+_SPECIES = (
+    Species("烈焰", "火", 1, "FirePup_1", "火焰焚烧", evolve_to="炽焰龙", evolve_level=10),
+    Species("碧波兽", "水", 1, "WaterSprite_1", "巨浪淹没", evolve_to="瀚海蛟", evolve_level=10),
+    Species("藤甲虫", "草", 1, "LeafyCat_1", "根须缠绕", evolve_to="赤镰战甲", evolve_level=10),
+    Species("碎裂岩", "土", 1, "cataclastic_rock_1", "大地堡垒", evolve_to="岩脊守护者", evolve_level=10),
+    Species("金刚", "金", 1, "King_Kong_1", "金属风暴", evolve_to="破甲战犀", evolve_level=10,
+            critical_rate=0.15, critical_damage=1.8, critical_rate_growth=0.002, critical_damage_growth=0.003),
+    Species("炽焰龙", "火", 2, "FirePup_2", "火焰焚烧"),
+    Species("瀚海蛟", "水", 2, "WaterSprite_2", "巨浪淹没"),
+    Species("赤镰战甲", "草", 2, "LeafyCat_2", "根须缠绕"),
+    Species("岩脊守护者", "土", 2, "cataclastic_rock_2", "大地堡垒"),
+    Species("破甲战犀", "金", 2, "King_Kong_2", "金属风暴",
+            critical_rate=0.25, critical_damage=1.8, critical_rate_growth=0.003, critical_damage_growth=0.004),
+)
+
+
+def _interned(species: Species) -> Species:
+    return species._replace(**{field: sys.intern(getattr(species, field))
+                               for field in ("name", "type", "sprite", "skill")})
+
+
+ELEMENTS: Mapping[str, Element] = MappingProxyType({element.type: element for element in _ELEMENTS})
+SPECIES: Mapping[str, Species] = MappingProxyType({species.name: species for species in map(_interned, _SPECIES)})
+BY_SPRITE: Mapping[str, Species] = MappingProxyType({species.sprite: species for species in SPECIES.values()})
+# 可以领取的基础形态，按属性索引
+STARTERS: Tuple[Species, ...] = tuple(species for species in SPECIES.values() if species.stage == 1)
+STARTER_BY_TYPE: Mapping[str, Species] = MappingProxyType({species.type: species for species in STARTERS})
+# 每种属性能学会的技能，按技能表的写法索引（草属性的技能在"木"下）
+TYPE_SKILLS: Mapping[str, str] = MappingProxyType(
+    {ADVANTAGE_TYPE_NAMES.get(species.type, species.type): species.skill for species in STARTERS}
+)
+
+
+def get_species(name: str, pet_type: str = None) -> Optional[Species]:
+    """按名称查找种族，给出属性时要求属性一致（自定义名字碰巧同名的宠物不算该种族）"""
+    species = SPECIES.get(name)
+    if species is None or (pet_type is not None and species.type != pet_type):
+        return None
+    return species
+
+
+def get_element(pet_type: str) -> Optional[Element]:
+    return ELEMENTS.get(pet_type)
+
+
+def sprite_for(key: str) -> Optional[str]:
+    """按种族名或属性查找图片名，属性对应该属性的基础形态"""
+    species = SPECIES.get(key) or STARTER_BY_TYPE.get(key)
+    return species.sprite if species else None
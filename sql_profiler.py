@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import re
+import os
+import logging
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?(?![\w.])")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+# update_pet_data按传入的字段拼出不同的SET子句，归为同一类语句
+_SET_LIST = re.compile(r"\bSET\s+.+?\s+WHERE\b", re.IGNORECASE | re.DOTALL)
+# 只有这些语句能做EXPLAIN QUERY PLAN
+_EXPLAINABLE = ("SELECT", "UPDATE", "DELETE", "INSERT", "REPLACE", "WITH")
+
+
+def normalize_sql(sql: str) -> str:
+    """把语句规范化为模板：合并空白，字面量替换为?，IN列表和SET列表合并"""
+    sql = _WHITESPACE.sub(" ", sql).strip()
+    sql = _STRING_LITERAL.sub("?", sql)
+    sql = _NUMBER_LITERAL.sub("?", sql)
+    sql = _IN_LIST.sub("IN (?)", sql)
+    sql = _SET_LIST.sub("SET … WHERE", sql)
+    return sql
+
+
+class StatementStats:
+    __slots__ = ("count", "total", "max", "shapes", "plan")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.shapes = set()   # 规范化前的不同写法
+        self.plan: Optional[str] = None
+
+
+class SQLProfiler:
+    """SQL语句统计，作为PetDatabase的语句监听者挂载
+
+    按规范化后的语句统计次数、总耗时和最长耗时；超过阈值的语句连同EXPLAIN QUERY PLAN写入日志。
+    """
+
+    def __init__(self, db, slow_ms: float = 50.0):
+        self.db = db
+        self.slow_ms = float(slow_ms)
+        self.enabled = False
+        self.statements: Dict[str, StatementStats] = {}
+        self.slow_count = 0
+
+    def enable(self):
+        if not self.enabled:
+            self.db.add_statement_listener(self.record)
+            self.enabled = True
+
+    def disable(self):
+        if self.enabled:
+            self.db.remove_statement_listener(self.record)
+            self.enabled = False
+
+    def reset(self):
+        self.statements = {}
+        self.slow_count = 0
+
+    def record(self, sql: str, elapsed: float):
+        key = normalize_sql(sql)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = StatementStats()
+        elapsed_ms = elapsed * 1000
+        stats.count += 1
+        stats.total += elapsed_ms
+        if elapsed_ms > stats.max:
+            stats.max = elapsed_ms
+        if len(stats.shapes) < 64:
+            stats.shapes.add(sql)
+
+        if elapsed_ms >= self.slow_ms:
+            self.slow_count += 1
+            if stats.plan is None:
+                stats.plan = self.explain(sql)
+            logger.warning(f"慢查询 {elapsed_ms:.1f}ms: {key}\n执行计划:\n{stats.plan}")
+
+    def explain(self, sql: str) -> str:
+        """获取语句的执行计划，参数全部以NULL代入"""
+        statement = sql.strip()
+        if not statement.upper().startswith(_EXPLAINABLE):
+            return "（不适用）"
+        try:
+            # 使用新的游标，不会再触发语句监听
+            rows = self.db.conn.execute(f"EXPLAIN QUERY PLAN {statement}", (None,) * statement.count("?")).fetchall()
+        except Exception as e:
+            return f"（获取失败: {str(e)}）"
+        # 每行为(id, parent, notused, detail)，按parent缩进
+        depth = {0: 0}
+        lines = []
+        for node_id, parent, _, detail in rows:
+            level = depth.get(parent, 0) + 1
+            depth[node_id] = level
+            lines.append("  " * level + detail)
+        return "\n".join(lines) if lines else "（无需查找）"
+
+    def ranked(self) -> List[tuple]:
+        """按总耗时从高到低排列的(语句, 统计)"""
+        return sorted(self.statements.items(), key=lambda item: -item[1].total)
+
+    def report(self, limit: int = 10, plans: bool = False) -> str:
+        total = sum(stats.total for stats in self.statements.values())
+        count = sum(stats.count for stats in self.statements.values())
+        lines = [f"🗄️ SQL统计：{len(self.statements)}类语句，{count}次，共{total:.1f}ms，慢查询{self.slow_count}次（阈值{self.slow_ms:.0f}ms）"]
+        for rank, (sql, stats) in enumerate(self.ranked()[:limit], 1):
+            share = stats.total / total if total else 0.0
+            lines.append(
+                f"{rank}. {share:.0%} 共{stats.total:.1f}ms {stats.count}次 "
+                f"平均{stats.total / stats.count:.3f}ms 最长{stats.max:.1f}ms 写法{len(stats.shapes)}种\n   {sql}"
+            )
+            if plans:
+                plan = stats.plan if stats.plan is not None else self.explain(next(iter(stats.shapes)))
+                lines.append("   执行计划:\n" + "\n".join(f"   {line}" for line in plan.split("\n")))
+        return "\n".join(lines)
+
+    def dump(self, path: str) -> str:
+        """把完整的排名报告（含执行计划）写入文件，返回文件路径"""
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.report(limit=len(self.statements), plans=True) + "\n")
+        return path
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+"""存储后端：指令处理器只依赖PetStorage协议，具体实现按配置storage_backend选择
+
+- sqlite：PetDatabase（db_shards大于1时为ShardedPetDatabase），数据保存在plugins_db中
+- memory：MemoryPetDatabase，纯内存字典，不读写磁盘，进程退出后数据丢失，用于基准测试和模拟
+
+新的后端实现PetStorage的方法，并在STORAGE_BACKENDS中注册即可。
+"""
+import heapq
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Protocol, Tuple
+
+from .pet import DEFAULT_SHOP_ITEMS, PET_COLUMNS, Pet, apply_item_effect, open_database, pet_row_to_data
+
+logger = logging.getLogger(__name__)
+
+
+class PetStorage(Protocol):
+    """插件使用的存储接口，宠物行是Pet.to_dict()的字段加上user_id"""
+
+    # 宠物
+    def create_pet(self, user_id: str, pet_name: str, pet_type: str, owner: str = "未知") -> bool: ...
+    def get_pet_data(self, user_id: str) -> Optional[Dict[str, Any]]: ...
+    def iter_pet_data(self) -> Iterator[Dict[str, Any]]: ...
+    def get_all_user_ids(self) -> List[str]: ...
+    def update_pet_data(self, user_id: str, **kwargs): ...
+    def update_pets(self, pet_rows: List[Dict[str, Any]]) -> set: ...
+    def delete_pet(self, user_id: str): ...
+
+    # 背包与商店
+    def get_shop_items(self) -> List[Dict[str, Any]]: ...
+    def get_user_inventory(self, user_id: str) -> List[Dict[str, Any]]: ...
+    def add_item_to_inventory(self, user_id: str, item_name: str, quantity: int = 1): ...
+    def remove_item_from_inventory(self, user_id: str, item_name: str, quantity: int = 1) -> bool: ...
+    def get_heal_items(self, user_id: str) -> Dict[str, Dict[str, int]]: ...
+    def consume_items(self, user_id: str, used: Dict[str, int]): ...
+    def use_item_on_pet(self, user_id: str, item_name: str, pet: Pet) -> str: ...
+
+    # 冷却与挂机探索
+    def save_cooldown(self, user_id: str, command: str, expires_at: int): ...
+    def load_cooldowns(self) -> List[tuple]: ...
+    def get_idle_enrollments(self) -> Dict[str, Any]: ...
+    def set_idle_enrolled(self, user_id: str, enrolled: bool): ...
+    def set_idle_digest(self, user_id: str, digest: str = None): ...
+    def save_idle_tick(self, pet_rows: List[Dict[str, Any]], item_rows: List[tuple], digest_rows: List[tuple]) -> set: ...
+
+    # 排行榜
+    def top_power(self, limit: int) -> List[Tuple[str, int]]: ...
+    def add_group_member(self, user_id: str, group_id: str): ...
+    def get_group_members(self, group_id: str) -> List[str]: ...
+
+    # 事务、语句监听和关闭
+    def transaction(self, *user_ids: str): ...
+    def add_statement_listener(self, listener): ...
+    def remove_statement_listener(self, listener): ...
+    def close(self): ...
+
+
+# 与pet_data表的列默认值一致，两个时间在创建时填入
+PET_DEFAULTS: Dict[str, Any] = {
+    'owner': '未知', 'level': 1, 'exp': 0, 'hp': 100, 'attack': 10, 'defense': 5, 'speed': 10,
+    'hunger': 50, 'mood': 50, 'coins': 0, 'skills': '[]', 'auto_heal_threshold': 100,
+    'critical_rate': 0.05, 'critical_damage': 1.5, 'skill_unlocked': '', 'burn_turns': 0,
+    'heal_blocked_turns': 0, 'defense_boost': 0, 'crit_rate_boost': 0, 'revive_used': 0, 'row_version': 0,
+}
+SHOP_COLUMNS = ('name', 'description', 'price', 'effect_type', 'effect_value', 'effect_value2')
+COLUMN_INDEX = {column: index for index, column in enumerate(PET_COLUMNS)}
+_MISSING = object()
+
+
+class MemoryPetDatabase:
+    """纯内存的存储后端，行为与PetDatabase一致
+
+    宠物按PET_COLUMNS的顺序保存为元组，背包、冷却和挂机报名保存在字典中。
+    transaction()记录修改前的值，出错时按相反顺序恢复，与SQLite的回滚效果相同。
+    """
+
+    def __init__(self):
+        self.pets: Dict[str, tuple] = {}
+        self.inventory: Dict[str, Dict[str, int]] = {}
+        self.cooldowns: Dict[Tuple[str, str], int] = {}
+        self.idle: Dict[str, Optional[str]] = {}
+        self.group_members: Dict[str, Dict[str, None]] = {}
+        self.shop_items = [
+            {'id': index, **dict(zip(SHOP_COLUMNS, item))}
+            for index, item in enumerate(DEFAULT_SHOP_ITEMS, start=1)
+        ]
+        self._shop_by_name = {item['name']: item for item in self.shop_items}
+        # 事务中的撤销记录：(字典, 键, 修改前的值)
+        self._undo: Optional[List[tuple]] = None
+
+    def _set(self, table: dict, key, value):
+        if self._undo is not None:
+            self._undo.append((table, key, table.get(key, _MISSING)))
+        table[key] = value
+
+    def _delete(self, table: dict, key):
+        if key in table:
+            if self._undo is not None:
+                self._undo.append((table, key, table[key]))
+            del table[key]
+
+    @contextmanager
+    def transaction(self, *user_ids: str):
+        """在一个事务中执行多次写操作，出错时整体回滚"""
+        outermost = self._undo is None
+        if outermost:
+            self._undo = []
+        try:
+            yield self
+        except BaseException:
+            if outermost:
+                for table, key, value in reversed(self._undo):
+                    if value is _MISSING:
+                        table.pop(key, None)
+                    else:
+                        table[key] = value
+                self._undo = None
+            raise
+        if outermost:
+            self._undo = None
+
+    def add_statement_listener(self, listener):
+        """内存后端没有SQL语句"""
+
+    def remove_statement_listener(self, listener):
+        pass
+
+    def close(self):
+        pass
+
+    # 宠物
+    def create_pet(self, user_id: str, pet_name: str, pet_type: str, owner: str = "未知") -> bool:
+        if user_id in self.pets:
+            return False
+        now = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        row = dict(PET_DEFAULTS, user_id=user_id, pet_name=pet_name, pet_type=pet_type, owner=owner,
+                   last_updated=now, last_battle_time=now)
+        self._set(self.pets, user_id, tuple(row[column] for column in PET_COLUMNS))
+        return True
+
+    def get_pet_data(self, user_id: str) -> Optional[Dict[str, Any]]:
+        row = self.pets.get(user_id)
+        return pet_row_to_data(row) if row is not None else None
+
+    def iter_pet_data(self) -> Iterator[Dict[str, Any]]:
+        for row in list(self.pets.values()):
+            yield pet_row_to_data(row)
+
+    def get_all_user_ids(self) -> List[str]:
+        return list(self.pets)
+
+    def update_pet_data(self, user_id: str, **kwargs):
+        row = self.pets.get(user_id)
+        if row is None:
+            return
+        kwargs['last_updated'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        updated = list(row)
+        for key, value in kwargs.items():
+            updated[COLUMN_INDEX[key]] = value
+        self._set(self.pets, user_id, tuple(updated))
+
+    def update_pets(self, pet_rows: List[Dict[str, Any]]) -> set:
+        # 只有一个进程使用，不会有版本冲突
+        for row in pet_rows:
+            self.update_pet_data(row['user_id'], **{key: value for key, value in row.items() if key != 'user_id'})
+        return set()
+
+    def delete_pet(self, user_id: str):
+        self._delete(self.pets, user_id)
+
+    # 背包与商店
+    def get_shop_items(self) -> List[Dict[str, Any]]:
+        return [dict(item) for item in self.shop_items]
+
+    def get_user_inventory(self, user_id: str) -> List[Dict[str, Any]]:
+        return [{'name': name, 'quantity': quantity} for name, quantity in self.inventory.get(user_id, {}).items()]
+
+    def add_item_to_inventory(self, user_id: str, item_name: str, quantity: int = 1):
+        items = self.inventory.setdefault(user_id, {})
+        self._set(items, item_name, items.get(item_name, 0) + quantity)
+
+    def remove_item_from_inventory(self, user_id: str, item_name: str, quantity: int = 1) -> bool:
+        items = self.inventory.get(user_id, {})
+        current = items.get(item_name)
+        if current is None or current < quantity:
+            return False
+        if current - quantity <= 0:
+            self._delete(items, item_name)
+        else:
+            self._set(items, item_name, current - quantity)
+        return True
+
+    def get_heal_items(self, user_id: str) -> Dict[str, Dict[str, int]]:
+        heal_items = {}
+        for name, quantity in self.inventory.get(user_id, {}).items():
+            item = self._shop_by_name.get(name)
+            if quantity > 0 and item and item['effect_type'] == 'hp':
+                heal_items[name] = {'quantity': quantity, 'heal': item['effect_value']}
+        return heal_items
+
+    def consume_items(self, user_id: str, used: Dict[str, int]):
+        items = self.inventory.get(user_id, {})
+        for item_name, quantity in used.items():
+            if item_name in items:
+                self._set(items, item_name, max(items[item_name] - quantity, 0))
+        for item_name in [name for name, quantity in items.items() if quantity <= 0]:
+            self._delete(items, item_name)
+
+    def use_item_on_pet(self, user_id: str, item_name: str, pet: Pet) -> str:
+        if self.inventory.get(user_id, {}).get(item_name, 0) <= 0:
+            return f"你没有{item_name}！"
+        item = self._shop_by_name.get(item_name)
+        if not item:
+            return f"无效的物品{item_name}！"
+        result = apply_item_effect(pet, item_name, item['effect_type'], item['effect_value'], item['effect_value2'])
+        self.remove_item_from_inventory(user_id, item_name, 1)
+        return result
+
+    # 冷却与挂机探索
+    def save_cooldown(self, user_id: str, command: str, expires_at: int):
+        self._set(self.cooldowns, (user_id, command), expires_at)
+
+    def load_cooldowns(self) -> List[tuple]:
+        now = int(datetime.now().timestamp())
+        for key in [key for key, expires_at in self.cooldowns.items() if expires_at <= now]:
+            self._delete(self.cooldowns, key)
+        return [(user_id, command, expires_at) for (user_id, command), expires_at in self.cooldowns.items()]
+
+    def get_idle_enrollments(self) -> Dict[str, Any]:
+        return dict(self.idle)
+
+    def set_idle_enrolled(self, user_id: str, enrolled: bool):
+        if enrolled:
+            if user_id not in self.idle:
+                self._set(self.idle, user_id, None)
+        else:
+            self._delete(self.idle, user_id)
+
+    def set_idle_digest(self, user_id: str, digest: str = None):
+        if user_id in self.idle:
+            self._set(self.idle, user_id, digest)
+
+    def save_idle_tick(self, pet_rows: List[Dict[str, Any]], item_rows: List[tuple], digest_rows: List[tuple]) -> set:
+        with self.transaction():
+            self.update_pets(pet_rows)
+            for user_id, item_name, quantity in item_rows:
+                self.add_item_to_inventory(user_id, item_name, quantity)
+            for digest, user_id in digest_rows:
+                self.set_idle_digest(user_id, digest)
+        return set()
+
+
+    # 排行榜
+    def top_power(self, limit: int) -> List[Tuple[str, int]]:
+        attack, defense, speed = COLUMN_INDEX['attack'], COLUMN_INDEX['defense'], COLUMN_INDEX['speed']
+        rows = ((user_id, row[attack] + row[defense] + row[speed]) for user_id, row in self.pets.items())
+        return heapq.nsmallest(limit, rows, key=lambda row: (-row[1], row[0]))
+
+    def add_group_member(self, user_id: str, group_id: str):
+        self._set(self.group_members.setdefault(group_id, {}), user_id, None)
+
+    def get_group_members(self, group_id: str) -> List[str]:
+        return list(self.group_members.get(group_id, {}))
+
+
+# 后端名称 -> 创建函数(插件目录, 插件配置)
+STORAGE_BACKENDS: Dict[str, Callable[[str, Dict[str, Any]], PetStorage]] = {
+    "sqlite": lambda plugin_dir, config: open_database(plugin_dir, shards=config.get("db_shards", 1)),
+    "memory": lambda plugin_dir, config: MemoryPetDatabase(),
+}
+
+
+def open_storage(plugin_dir: str, config: Dict[str, Any]) -> PetStorage:
+    """按配置storage_backend创建存储后端，未知的名称退回sqlite"""
+    backend = config.get("storage_backend") or "sqlite"
+    if backend not in STORAGE_BACKENDS:
+        logger.error(f"未知的存储后端: {backend}，可选：{'、'.join(STORAGE_BACKENDS)}，已使用sqlite")
+        backend = "sqlite"
+    if backend == "memory":
+        logger.warning("使用内存存储后端，宠物数据不会保存到磁盘")
+    return STORAGE_BACKENDS[backend](plugin_dir, config)